@@ -1,7 +1,13 @@
+# ⏱️ 冷啟動量測起點：必須是第一個 import
+from src.utils.startup_clock import STARTUP_T0
+
 import os
+import time
+import hmac
 import json
 import logging
 import asyncio
+import importlib
 import functions_framework
 import pathlib
 from dotenv import load_dotenv
@@ -17,14 +23,19 @@ from linebot.v3.messaging import (
 from linebot.v3.webhooks import MessageEvent, TextMessageContent
 from linebot.v3.webhook import WebhookParser
 
-# 引入你的 Agent 與 Services
-from src.agents.calendar import CalendarAgent
-from src.agents.expense import ExpenseAgent
-from src.agents.chat import ChatAgent
-from src.agents.memory_parser import MemoryParser
-from src.services.llm.factory import create_llm_provider
-from src.services.llm.embedding import EmbeddingService
-from src.services.firestore_service import AsyncFirestoreService
+from src.services.llm.base import request_deadline
+from src.utils.task_graph import TaskGraph
+from src.services.llm.schemas import ROUTER_DECISION
+
+from src.config import (
+    INTENT_LOCAL_ENABLED,
+    ROUTER_CACHE_ENABLED,
+    SPECULATIVE_PARSE_ENABLED,
+    LLM_PIPELINE_MODE,
+    LLM_REQUEST_BUDGET,
+)
+
+# 註：Agent 與 Services 改為在第一次用到時才 import + 建立 (見下方 get_* 函式)
 
 # 1. Setup & Config
 load_dotenv()
@@ -37,27 +48,118 @@ logger = logging.getLogger("MainRouter")
 CHANNEL_ACCESS_TOKEN = os.getenv("CHANNEL_ACCESS_TOKEN")
 CHANNEL_SECRET = os.getenv("CHANNEL_SECRET")
 
+# Warm-up 路由 (Cloud Scheduler / 部署後呼叫)：需帶 X-Warmup-Token，未設定 WARMUP_TOKEN 時停用
+WARMUP_PATH = "/warmup"
+WARMUP_TOKEN = os.getenv("WARMUP_TOKEN")
+
 if not CHANNEL_ACCESS_TOKEN or not CHANNEL_SECRET:
     logger.critical("❌ Critical Error: Missing LINE environment variables (CHANNEL_ACCESS_TOKEN / CHANNEL_SECRET)!")
 
 configuration = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
 
-# ✅ 冷啟動優化：Module-level 初始化，避免每次 Request 重新分配資源
+# ✅ 冷啟動優化：LINE 相關物件很輕量且每個 Request 都會用到，維持 Module-level 初始化
 # aiohttp connector 需要在 event loop 內初始化，Cloud Run Gen2 原生支援 async，
 # functions_framework 會在有 event loop 的環境中 import，所以這裡是安全的。
 parser = WebhookParser(CHANNEL_SECRET)
 _async_api_client = AsyncApiClient(configuration)
 line_bot_api = AsyncMessagingApi(_async_api_client)
 
-router_llm = create_llm_provider(role="router")
-calendar_agent = CalendarAgent()
-expense_agent = ExpenseAgent()
-chat_agent = ChatAgent()
-memory_parser = MemoryParser()
+# ✅ 冷啟動優化：Agent / LLM / Firestore 等較重的物件改為 Lazy Singleton，
+# 只有在第一個需要它的 Request 才建立 (例如純聊天訊息不會去載入 Calendar 與 Sheets 憑證)
+_singletons: dict[str, object] = {}
+_startup_timings: dict[str, float] = {}
+_startup_reported = False
+
+
+def _lazy(name: str, module_path: str, attr: str, **kwargs):
+    """
+    取得 (或第一次建立) 名為 name 的 Singleton。
+    第一次呼叫時才 import module_path 並以 attr(**kwargs) 建立，並記錄 import + 建立的總耗時。
+    """
+    instance = _singletons.get(name)
+    if instance is None:
+        t0 = time.perf_counter()
+        factory = getattr(importlib.import_module(module_path), attr)
+        instance = factory(**kwargs)
+        _singletons[name] = instance
+        _startup_timings[name] = (time.perf_counter() - t0) * 1000
+        logger.info("⏱️ Lazy init %s: %.1f ms", name, _startup_timings[name])
+    return instance
+
+
+def get_router_llm():
+    return _lazy(
+        "router_llm", "src.services.llm.factory", "create_llm_provider", role="router"
+    )
+
+
+def get_calendar_agent():
+    return _lazy("calendar_agent", "src.agents.calendar", "CalendarAgent")
+
+
+def get_expense_agent():
+    return _lazy("expense_agent", "src.agents.expense", "ExpenseAgent")
+
+
+def get_chat_agent():
+    return _lazy("chat_agent", "src.agents.chat", "ChatAgent")
+
+
+def get_memory_parser():
+    return _lazy("memory_parser", "src.agents.memory_parser", "MemoryParser")
+
+
+def get_embedding_service():
+    return _lazy("embedding_service", "src.services.llm.embedding", "EmbeddingService")
+
+
+def get_firestore_service():
+    return _lazy(
+        "firestore_service", "src.services.firestore_service", "AsyncFirestoreService"
+    )
+
+
+def get_intent_classifier():
+    return _lazy(
+        "intent_classifier", "src.services.intent_classifier", "LocalIntentClassifier"
+    )
+
+
+def get_router_cache():
+    return _lazy("router_cache", "src.services.router_cache", "RouterDecisionCache")
+
+
+def get_fused_router():
+    return _lazy("fused_router", "src.agents.fused_router", "FusedRouter")
+
+
+def get_speculative_parser():
+    return _lazy(
+        "speculative_parser",
+        "src.services.speculation",
+        "SpeculativeParser",
+        classifier=get_intent_classifier(),
+    )
+
+
+# 模組載入 (import + LINE client 初始化) 的耗時
+_MODULE_IMPORT_MS = (time.perf_counter() - STARTUP_T0) * 1000
+
+
+def _report_startup(first_request_ms: float) -> None:
+    """第一個 Request 結束後輸出一次冷啟動報告 (可在 Cloud Functions Log 中比較優化前後)"""
+    global _startup_reported
+    if _startup_reported:
+        return
+    _startup_reported = True
+    lazy_inits = ", ".join(f"{k}={v:.1f}ms" for k, v in _startup_timings.items()) or "none"
+    logger.info(
+        "⏱️ Startup report | module import: %.1f ms | first request: %.1f ms | lazy inits: %s",
+        _MODULE_IMPORT_MS,
+        first_request_ms,
+        lazy_inits,
+    )
 
-# Singleton 實例
-embedding_service = EmbeddingService()
-firestore_service = AsyncFirestoreService()
 
 # ✅ Prompt 快取：讀一次之後不再重複 I/O
 _router_prompt_template: str | None = None
@@ -77,20 +179,47 @@ def _on_memory_task_done(task: asyncio.Task) -> None:
         logger.error("❌ Memory workflow failed: %s", exc)
 
 
-async def get_router_intent(user_text) -> tuple[str, bool]:
+async def get_router_intent(user_text, embedding_task=None, rule_decision=None) -> tuple[str, bool]:
     """
     [Router] 非同步意圖分類
+    先走本地快速路徑 (規則 → embedding centroid)，沒有把握時才呼叫 Router LLM。
+    embedding_task: handle_message 已經在算的 embedding (有 centroid 時才會等它)
+    rule_decision: handle_message 已算好的規則分類結果 (見 _classify_by_rules；None = 規則沒有把握)
     回傳: intent (str), needs_memory (bool)
     """
-    template = _get_router_prompt_template()
-    prompt = template.replace("{{USER_INPUT}}", user_text).replace(
-        "{{CURRENT_TIME}}", ""
-    )
+    if INTENT_LOCAL_ENABLED:
+        classifier = get_intent_classifier()
+        decision = rule_decision
+        if decision is None and embedding_task is not None and classifier.has_centroids:
+            try:
+                decision = classifier.classify_embedding(await embedding_task, user_text)
+            except Exception as e:
+                logger.warning("⚠️ Centroid intent skipped: %s", e)
+
+        classifier.record(decision.source if decision else "fallback")
+        if decision:
+            logger.info(
+                "⚡ Local intent (%s, %.2f): %s", decision.source, decision.confidence, decision.intent
+            )
+            return decision.intent, decision.needs_memory
+
+    if ROUTER_CACHE_ENABLED:
+        cached = await get_router_cache().get(user_text)
+        if cached:
+            logger.info("♻️ Router cache hit: %s", cached)
+            return cached
+
+    # 固定的 Router 指示作為 system prefix (可被供應商快取)，只有使用者輸入每次不同
+    prompt = f'User Input: "{user_text}"'
 
     try:
-        data = await router_llm.aparse_json_response(prompt)
+        data = await get_router_llm().aparse_json_response(
+            prompt, schema=ROUTER_DECISION, system_prefix=_get_router_prompt_template()
+        )
         intent = data.get("intent", "CHAT")
         needs_memory = data.get("needs_memory", False)
+        if ROUTER_CACHE_ENABLED:
+            get_router_cache().set(user_text, intent, needs_memory)
         return intent, needs_memory
     except Exception as e:
         logger.error("❌ Router Decision Error: %s", e)
@@ -102,6 +231,14 @@ async def get_router_intent(user_text) -> tuple[str, bool]:
 # ========================================================
 @functions_framework.http
 async def webhook(request):
+    # Warm-up 與 webhook 共用同一個 entry point，才能暖到同一批 instance
+    if request.path.rstrip("/").endswith(WARMUP_PATH):
+        # 固定時間比較，避免從回應時間猜出 token
+        supplied = request.headers.get("X-Warmup-Token", "")
+        if not WARMUP_TOKEN or not hmac.compare_digest(supplied.encode(), WARMUP_TOKEN.encode()):
+            return "Forbidden", 403
+        return await warmup_async()
+
     signature = request.headers.get("X-Line-Signature")
     try:
         body = request.get_data(as_text=True)
@@ -113,7 +250,73 @@ async def webhook(request):
         return "Error", 500
 
 
+async def _timed_ping(name: str, coro_fn) -> tuple[str, dict]:
+    """執行單一 backend 的 warm-up，回傳耗時或錯誤 (不會拋出例外)"""
+    t0 = time.perf_counter()
+    try:
+        await coro_fn()
+        return name, {"ok": True, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+    except Exception as e:
+        logger.warning("⚠️ Warm-up %s failed: %s", name, e)
+        return name, {"ok": False, "error": str(e)}
+
+
+async def warmup_async():
+    """
+    [Warm-up] 建立所有 Lazy Singleton，並對每個 backend 送出一個極小的已驗證請求，
+    讓 TLS 連線與 OAuth token 在第一則真正的使用者訊息之前就準備好。
+    """
+    t0 = time.perf_counter()
+    calendar_agent = get_calendar_agent()
+    expense_agent = get_expense_agent()
+    chat_agent = get_chat_agent()
+    memory_parser = get_memory_parser()
+    router_llm = get_router_llm()
+    embedding_service = get_embedding_service()
+    firestore_service = get_firestore_service()
+    init_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+    pings = await asyncio.gather(
+        _timed_ping("line", line_bot_api.get_bot_info),
+        _timed_ping("router_llm", router_llm.awarmup),
+        _timed_ping("calendar_llm", calendar_agent.llm.awarmup),
+        _timed_ping("expense_llm", expense_agent.llm.awarmup),
+        _timed_ping("chat_llm", chat_agent.llm.awarmup),
+        _timed_ping("memory_llm", memory_parser.llm.awarmup),
+        _timed_ping("embedding", embedding_service.awarmup),
+        _timed_ping("firestore", firestore_service.awarmup),
+        _timed_ping("calendar", calendar_agent.skills.service.awarmup),
+        _timed_ping("sheets", lambda: asyncio.to_thread(expense_agent.skills.warmup)),
+    )
+
+    report = {"init_ms": init_ms, "backends": dict(pings)}
+    if "router_cache" in _singletons:
+        report["router_cache"] = _singletons["router_cache"].stats()
+    if embedding_service.cache_enabled:
+        report["embedding_cache"] = embedding_service.stats()
+    if "speculative_parser" in _singletons:
+        report["speculation"] = _singletons["speculative_parser"].hit_rate()
+    cascades = {
+        agent.llm.name: agent.llm.escalation_rate()
+        for agent in (calendar_agent, expense_agent, memory_parser)
+        if hasattr(agent.llm, "escalation_rate")
+    }
+    if cascades:
+        report["cascade"] = cascades
+    hedges = {
+        name: llm.hedge_stats()
+        for name, llm in (("router", router_llm), ("chat", chat_agent.llm))
+        if hasattr(llm, "hedge_stats")
+    }
+    if hedges:
+        report["hedge"] = hedges
+    logger.info("🔥 Warm-up finished: %s", report)
+    status = 200 if all(p["ok"] for _, p in pings) else 207
+    return json.dumps(report), status, {"Content-Type": "application/json"}
+
+
 async def process_webhook_async(body, signature):
+    t0 = time.perf_counter()
     events = parser.parse(body, signature)
 
     tasks = []
@@ -122,7 +325,10 @@ async def process_webhook_async(body, signature):
             tasks.append(handle_message(event))
 
     if tasks:
-        await asyncio.gather(*tasks)
+        # LLM 呼叫的 timeout / 重試都受這個預算限制，確保在 reply token 失效前回覆
+        with request_deadline(LLM_REQUEST_BUDGET):
+            await asyncio.gather(*tasks)
+        _report_startup((time.perf_counter() - t0) * 1000)
     return "OK", 200
 
 
@@ -144,66 +350,131 @@ async def handle_message(event):
     logger.info("📨 Processing: %s", user_msg)
 
     # ==========================
-    # 並發處理 Intent 與 Embedding
+    # 依相依圖排程：embedding → retrieval 只有 CHAT 用得到，memory 在回覆之後於背景完成
     # ==========================
-    embedding_task = asyncio.create_task(embedding_service.get_embedding(user_msg))
-    intent_task = asyncio.create_task(get_router_intent(user_msg))
+    # 規則分類只算一次，embedding 排程、Router 與 speculation 共用
+    rule_decision = _classify_by_rules(user_msg)
+
+    graph = TaskGraph()
+    graph.add("embedding", lambda: get_embedding_service().get_embedding(user_msg))
+    if LLM_PIPELINE_MODE == "fused":
+        # Fused：單一次呼叫同時拿到 intent 與 Agent payload (不經本地分類 / Router 快取 / speculation)
+        graph.add("route", lambda: get_fused_router().route(user_msg))
+    else:
+        graph.add("route", lambda: _route_two_stage(graph, user_id, user_msg, rule_decision))
+    graph.add(
+        "retrieval",
+        lambda embedding: get_firestore_service().search_memories(
+            query_embedding=embedding, user_id=user_id, limit=3
+        ),
+        deps=("embedding",),
+    )
+    graph.add("agent", lambda route: _dispatch(graph, route, user_id, user_msg), deps=("route",))
+    graph.add("reply", lambda reply_messages: _reply(event, reply_messages), deps=("agent",))
+    # 背景 Task 在回覆之後才跑完，不受本次 Request 的時間預算限制 (detached = 空的 context)
+    graph.add(
+        "memory_parse", lambda: get_memory_parser().parse_memory(user_msg), detached=True
+    )
+    graph.add(
+        "memory",
+        lambda parsed_mem, embedding: _save_memory(user_id, user_msg, parsed_mem, embedding),
+        deps=("memory_parse", "embedding"),
+        detached=True,
+    )
 
-    # A & B 平行執行
-    embedding, (intent, needs_memory) = await asyncio.gather(embedding_task, intent_task)
+    # Embedding 與 Router 平行 (speculative)；本地分類已確定用不到時就不算
+    if _embedding_likely_needed(rule_decision):
+        graph.start("embedding")
 
+    intent, needs_memory, _ = await graph.get("route")
     logger.info("🚦 Router Intent: %s, Needs Memory: %s", intent, needs_memory)
 
-    reply_messages = []
+    if intent != "CHAT" and not needs_memory:
+        graph.cancel("embedding")
+    if needs_memory:
+        # 啟動背景 Task 提取記憶與存入 DB，不阻礙回應
+        graph.start("memory").add_done_callback(_on_memory_task_done)
 
     try:
-        # ==========================
-        # Action 分發
-        # ==========================
-        if intent == "CALENDAR":
-            reply_messages = await calendar_agent.handle_message(user_msg)
-
-        elif intent == "EXPENSE":
-            reply_messages = await expense_agent.handle_message(
-                user_msg, user_id=user_id
-            )
-
-        else:
-            # CHAT 或 未知，先去 DB 撈回憶
-            memories = await firestore_service.search_memories(
-                query_embedding=embedding,
-                user_id=user_id,
-                limit=3
-            )
-            # 整合並發送給 Chat Agent
-            reply_messages = await chat_agent.handle_message(user_msg, memories)
-
-        # 若是一般對話或功能，但需要紀錄 Memory
-        if needs_memory:
-            # 啟動背景 Task 提取記憶與存入 DB，不阻礙回應
-            async def memory_workflow():
-                parsed_mem = await memory_parser.parse_memory(user_msg)
-                await firestore_service.save_memory(
-                    user_id=user_id,
-                    content=user_msg,
-                    summary=parsed_mem['summary'],
-                    tags=parsed_mem['tags'],
-                    memory_type=parsed_mem['memory_type'],
-                    embedding=embedding
-                )
-
-            task = asyncio.create_task(memory_workflow())
-            task.add_done_callback(_on_memory_task_done)
-
-        # ==========================
-        # 回覆 LINE
-        # ==========================
-        if reply_messages:
-            await line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token, messages=reply_messages
-                )
-            )
-
+        await graph.get("reply")
     except Exception as e:
         logger.error("❌ Dispatch Error: %s", e)
+    finally:
+        graph.cancel_pending()
+        logger.info("⏱️ Pipeline timings (ms): %s", graph.timings)
+
+
+def _classify_by_rules(user_text: str):
+    """本地規則分類 (INTENT_LOCAL_ENABLED 關閉或沒有把握時回傳 None)"""
+    if not INTENT_LOCAL_ENABLED:
+        return None
+    return get_intent_classifier().classify_text(user_text)
+
+
+def _embedding_likely_needed(rule_decision) -> bool:
+    """本地規則已確定是 CALENDAR / EXPENSE 且不需要記憶時，不必先算 embedding"""
+    return not (
+        rule_decision and rule_decision.intent != "CHAT" and not rule_decision.needs_memory
+    )
+
+
+async def _route_two_stage(graph, user_id, user_msg, rule_decision=None) -> tuple[str, bool, object]:
+    """Router (本地分類 → 快取 → LLM)，並行 speculative parsing；回傳 (intent, needs_memory, parsed)"""
+    # (可選) Router 判斷的同時，先以最可能的 Agent 解析指令；規則已經有把握時 Router 幾乎不花時間，不需要預測
+    speculation = None
+    if SPECULATIVE_PARSE_ENABLED and rule_decision is None:
+        speculation = get_speculative_parser().start(
+            user_id,
+            user_msg,
+            # 只建立預測到的那個 Agent
+            {
+                "CALENDAR": lambda text: get_calendar_agent().parse(text),
+                "EXPENSE": lambda text: get_expense_agent().parse(text),
+            },
+        )
+
+    # 只有 centroid 分類會用到 embedding
+    embedding_task = None
+    if INTENT_LOCAL_ENABLED and get_intent_classifier().has_centroids:
+        embedding_task = graph.start("embedding")
+    intent, needs_memory = await get_router_intent(user_msg, embedding_task, rule_decision)
+
+    parsed = None
+    if SPECULATIVE_PARSE_ENABLED:
+        parsed = await get_speculative_parser().resolve(speculation, user_id, intent)
+    return intent, needs_memory, parsed
+
+
+async def _dispatch(graph, route, user_id, user_msg) -> list:
+    """Action 分發，回傳要回覆的訊息"""
+    intent, _, parsed = route
+    if intent == "CALENDAR":
+        return await get_calendar_agent().handle_message(user_msg, parsed=parsed)
+
+    if intent == "EXPENSE":
+        return await get_expense_agent().handle_message(user_msg, user_id=user_id, parsed=parsed)
+
+    # CHAT 或 未知，先去 DB 撈回憶，整合並發送給 Chat Agent
+    memories = await graph.get("retrieval")
+    return await get_chat_agent().handle_message(user_msg, memories)
+
+
+async def _reply(event, reply_messages):
+    """回覆 LINE"""
+    if reply_messages:
+        await line_bot_api.reply_message(
+            ReplyMessageRequest(reply_token=event.reply_token, messages=reply_messages)
+        )
+
+
+async def _save_memory(user_id, user_msg, parsed_mem, embedding):
+    """存入解析好的記憶 (回覆之後在背景完成)"""
+    await get_firestore_service().save_memory(
+        user_id=user_id,
+        content=user_msg,
+        summary=parsed_mem['summary'],
+        tags=parsed_mem['tags'],
+        memory_type=parsed_mem['memory_type'],
+        embedding=embedding,
+        embedding_version=get_embedding_service().version,
+    )
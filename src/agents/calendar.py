@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import datetime
 import pathlib
@@ -6,19 +7,124 @@ from src.utils.flex_templates import (
     generate_create_success_flex,
     generate_overview_flex,
 )
-from src.skills.calendar_skill import CalendarSkills
-from src.services.llm.factory import create_llm_provider
+from src.skills.calendar_skill import AsyncCalendarSkills
+from src.services.llm.factory import create_structured_provider
+from src.config import CALENDAR_STREAM_DISPATCH
+from src.services.llm.schemas import CALENDAR_ACTION, CALENDAR_ACTIONS, validate
 
 logger = logging.getLogger(__name__)
 
 # LINE 單次回覆上限為 5 則訊息
 MAX_LINE_MESSAGES = 5
 
+# 會寫入日曆的 Skill；同一次回覆中超過一筆就改走 Calendar batch request
+MUTATION_SKILLS = (
+    "create_event",
+    "create_recurring_event",
+    "delete_event",
+    "reschedule_event",
+    "batch_create",
+)
+# 需要先搜尋目標行程的寫入 Skill
+LOOKUP_SKILLS = ("delete_event", "reschedule_event")
+
+
+def as_action_list(parsed_data):
+    """
+    防呆：如果 AI 只回傳單一 Dict (偶爾會發生)，把它包成 List。
+    拋出: ValueError (既不是 Dict 也不是 List)
+    """
+    if isinstance(parsed_data, dict):
+        return [parsed_data]
+    if isinstance(parsed_data, list):
+        return parsed_data
+    raise ValueError("AI returned neither Dict nor List")
+
+
+def _flex_reply(alt_text, flex_json):
+    return FlexMessage(alt_text=alt_text, contents=FlexContainer.from_dict(flex_json))
+
+
+def _created_reply(args, result, alt_text, **ui_extra):
+    """新增 / 週期新增的回覆：成功時顯示行程卡片，失敗時顯示原因"""
+    if not result["success"]:
+        return [TextMessage(text=f"❌ 建立失敗 ({args.get('title')}): {result.get('message')}")]
+    ui_data = {
+        "title": args.get("title"),
+        "startTime": args.get("start_time"),
+        "endTime": args.get("end_time"),
+        "location": args.get("location", ""),
+        **ui_extra,
+    }
+    return [_flex_reply(alt_text, generate_create_success_flex(ui_data))]
+
+
+def _render_create(args, result):
+    return _created_reply(args, result, f"行程已建立: {args.get('title')}")
+
+
+def _render_create_recurring(args, result):
+    recurrence = result.get("rrule") or result.get("event", {}).get("recurrence")
+    return _created_reply(
+        args, result, f"週期行程已建立: {args.get('title')}", recurrence=recurrence
+    )
+
+
+def _render_batch_create(args, results):
+    success_count = sum(1 for r in results if r["success"])
+    return [TextMessage(text=f"✅ 批量建立完成！共建立 {success_count} 筆行程")]
+
+
+def _render_list(args, result):
+    if not result["success"]:
+        return [TextMessage(text=f"❌ 查詢失敗: {result.get('message')}")]
+    flex_json = generate_overview_flex(
+        result["events"], truncated=result.get("truncated", False)
+    )
+    return [_flex_reply("行程總覽", flex_json)]
+
+
+def _render_delete(args, result):
+    if not result["success"]:
+        return [TextMessage(text=f"⚠️ 刪除失敗：{result['message']}")]
+    deleted_title = result["deleted_event"].get("summary", "行程")
+    return [TextMessage(text=f"🗑️ 已刪除：{deleted_title}")]
+
+
+def _render_reschedule(args, result):
+    if not result["success"]:
+        return [TextMessage(text=f"⚠️ 改期失敗：{result.get('message')}")]
+
+    messages = []
+    original = result.get("original_event") or {}
+    if result.get("mode") == "created":
+        messages.append(TextMessage(text="⚠️ 找不到舊行程 (直接建立新行程)"))
+    ui_data = {
+        "title": args.get("new_title") or original.get("summary", "行程"),
+        "startTime": args.get("new_start_time"),
+        "endTime": args.get("new_end_time"),
+        "location": original.get("location", ""),
+        "headline": "✅ 行程已改期",
+    }
+    messages.append(_flex_reply("行程已改期", generate_create_success_flex(ui_data)))
+    return messages
+
+
+# 各 Skill 的回覆產生方式：(normalized args, Skill 結果) -> [LINE message, ...]
+SKILL_RENDERERS = {
+    "create_event": _render_create,
+    "create_recurring_event": _render_create_recurring,
+    "batch_create": _render_batch_create,
+    "list_events": _render_list,
+    "delete_event": _render_delete,
+    "reschedule_event": _render_reschedule,
+}
+
 
 class CalendarAgent:
     def __init__(self):
-        self.skills = CalendarSkills()
-        self.llm = create_llm_provider(role="agent")
+        self.skills = AsyncCalendarSkills()
+        self.llm = create_structured_provider("calendar")
 
         # ✅ 優化：在初始化時就讀入 Prompt，之後重複使用
         self.prompt_template = self._load_prompt()
@@ -62,155 +168,240 @@ class CalendarAgent:
 
         return new_args
 
-    async def handle_message(self, user_msg):
-        # 1. 檢查 Prompt 是否載入成功
+    def _batch_create_events(self, args):
+        """batch_create 的各筆行程 (已清洗參數)；events 不是 List 時把 args 本身當成一筆"""
+        raw_events = args.get("events", [])
+        if not isinstance(raw_events, list):
+            raw_events = [args]
+        return [self._normalize_args(evt) for evt in raw_events]
+
+    def _collect_mutations(self, actions_list):
+        """
+        找出 Action List 中的寫入型操作 (batch_create 會展開成多筆 create_event)。
+        batch 會比其他 Action 先執行，因此停在第一個 list_events：之後的寫入逐筆依序執行，
+        查詢結果才不會提早看到它們。
+        回傳: [(action index, skill, normalized args), ...]
+        """
+        mutations = []
+        for idx, action_data in enumerate(actions_list):
+            skill = action_data.get("skill")
+            if skill == "list_events":
+                break
+            if skill not in MUTATION_SKILLS:
+                continue
+
+            args = self._normalize_args(action_data.get("args", {}))
+            if skill == "batch_create":
+                for evt in self._batch_create_events(args):
+                    mutations.append((idx, "create_event", evt))
+            else:
+                mutations.append((idx, skill, args))
+        return mutations
+
+    @staticmethod
+    def _independent_prefix(mutations):
+        """
+        batch 內的刪除/改期會在送出前先搜尋目標，看不到同一則訊息稍早新增或改期的結果
+        (例如「明天三點新增 X，再把 X 改到五點」)。
+        因此只 batch 到「新增/改期之後的第一個刪除/改期」為止，該 Action 與之後的都逐筆依序執行。
+        """
+        changed = False
+        for pos, (_, skill, _) in enumerate(mutations):
+            if skill in LOOKUP_SKILLS and changed:
+                return mutations[:pos]
+            if skill != "delete_event":
+                changed = True
+        return mutations
+
+    async def _run_batched_mutations(self, actions_list, claimed_ids=None):
+        """
+        若互不相依的寫入型操作超過一筆，以單一 batch request 一次執行 (見 _independent_prefix)。
+        claimed_ids: batch 內刪除/改期選中的行程 id 會加入，之後逐筆執行的 Action 不會再選到
+        回傳: {action index: [result, ...]}；不需 batch 或 batch 沒送出就失敗時回傳空 dict (改為逐筆執行)。
+        batch 送出之後的錯誤由 batch_apply 轉成各筆的失敗結果，不會逐筆重做 (避免重複建立 / 刪到別筆)
+        """
+        mutations = self._independent_prefix(self._collect_mutations(actions_list))
+        if len(mutations) <= 1:
+            return {}
+
+        logger.info("📦 Batching %d calendar mutations", len(mutations))
+        try:
+            results = await self.skills.batch_apply(
+                [(skill, args) for _, skill, args in mutations], claimed_ids=claimed_ids
+            )
+        except Exception as e:
+            # batch_apply 只會在送出 batch request 之前拋出例外，這時逐筆執行不會重複寫入
+            logger.error("Batch mutation failed before sending, falling back to sequential: %s", e)
+            return {}
+
+        batched = {}
+        for (idx, _, _), result in zip(mutations, results):
+            batched.setdefault(idx, []).append(result)
+        return batched
+
+    async def parse(self, user_msg):
+        """
+        呼叫 LLM 把使用者訊息解析成 Action List (不執行)。
+        拋出: Exception (Prompt 遺失或解析失敗，由呼叫方處理)
+        """
         if not self.prompt_template:
-            return [TextMessage(text="❌ 系統錯誤：Prompt 載入失敗，請檢查 Log")]
+            raise ValueError("Calendar prompt not loaded")
 
-        # 2. 替換變數
-        dt_now = datetime.datetime.now().isoformat()
-        prompt = self.prompt_template.replace("{{USER_INPUT}}", user_msg).replace(
-            "{{CURRENT_TIME}}", dt_now
+        return as_action_list(
+            await self.llm.aparse_json_response(
+                self._user_prompt(user_msg),
+                schema=CALENDAR_ACTIONS,
+                system_prefix=self.prompt_template,
+            )
         )
 
-        # 3. Call LLM (Parsing)
-        actions_list = []
-        try:
-            parsed_data = await self.llm.aparse_json_response(prompt)
+    @staticmethod
+    def _user_prompt(user_msg):
+        """每次不同的部分 (固定指示 self.prompt_template 以 system prefix 傳入)"""
+        dt_now = datetime.datetime.now().isoformat()
+        return f'Current Time in Taiwan: {dt_now}\nUser Input: "{user_msg}"'
 
-            # 防呆：如果 AI 還是只回傳單一 Dict (偶爾會發生)，把它包成 List
-            if isinstance(parsed_data, dict):
-                actions_list = [parsed_data]
-            elif isinstance(parsed_data, list):
-                actions_list = parsed_data
-            else:
-                raise ValueError("AI returned neither Dict nor List")
+    async def _execute_action(self, idx, action_data, batched, claimed_ids=None):
+        """
+        執行單一 Action 並產生回覆訊息。
+        batched: _run_batched_mutations 的結果 ({action index: [result, ...]})
+        claimed_ids: 同一則訊息中已被刪除 / 改期鎖定的行程 id (不走 batch 時由各 Action 共用)
+        """
+        skill = action_data.get("skill")
+        raw_args = action_data.get("args", {})
 
-            logger.info("🤖 LLM Parsed Actions List: %s", actions_list)
+        # 參數清洗
+        args = self._normalize_args(raw_args)
 
-        except Exception as e:
-            logger.error("LLM parsing failed: %s", e)
-            return [TextMessage(text="😵‍💫 抱歉，我不確定您的指令，請再試一次。")]
+        logger.info("⚡ Executing Skill: %s | Args: %s", skill, args)
 
-        # 4. Dispatch Skills (Loop Processing)
-        reply_messages = []
+        render = SKILL_RENDERERS.get(skill)
+        if render is None:
+            return [TextMessage(text=f"🤔 未知指令: {skill}")]
 
-        # 遍歷每一個 Action
-        for action_data in actions_list:
-            skill = action_data.get("skill")
-            raw_args = action_data.get("args", {})
+        try:
+            result = await self._run_skill(idx, skill, args, batched, claimed_ids)
+            return render(args, result)
+        except TypeError as te:
+            logger.error("Parameter Mismatch in %s: %s", skill, te)
+            return [TextMessage(text=f"❌ {skill} 參數錯誤")]
+        except Exception as e:
+            logger.error("Skill execution failed (%s): %s", skill, e)
+            return [TextMessage(text=f"❌ 執行 {skill} 時發生錯誤")]
 
-            # 參數清洗
-            args = self._normalize_args(raw_args)
+    async def _run_skill(self, idx, skill, args, batched, claimed_ids):
+        """
+        取得 Skill 的執行結果：已在 batch 內執行過就直接使用，否則逐筆呼叫。
+        batch_create 回傳每筆 create_event 結果的 list
+        """
+        if idx in batched:
+            return batched[idx] if skill == "batch_create" else batched[idx][0]
+        if skill == "create_event":
+            return await self.skills.create_event(**args)
+        if skill == "create_recurring_event":
+            return await self.skills.create_recurring_event(**args)
+        if skill == "batch_create":
+            # 註：新的 Prompt 通常會直接展開成多個 create_event，但保留此邏輯以防萬一
+            return [await self.skills.create_event(**evt) for evt in self._batch_create_events(args)]
+        if skill == "list_events":
+            return await self.skills.list_events(**args)
+        if skill == "delete_event":
+            return await self.skills.delete_event_by_query(**args, claimed_ids=claimed_ids)
+        return await self.skills.reschedule_event(**args, claimed_ids=claimed_ids)
+
+    async def handle_message(self, user_msg, parsed=None):
+        """
+        parsed: 已經解析好的 Action List (speculative parsing 或 fused pipeline 的結果)；None 時才呼叫 LLM
+        """
+        # 1. 檢查 Prompt 是否載入成功
+        if parsed is None and not self.prompt_template:
+            return [TextMessage(text="❌ 系統錯誤：Prompt 載入失敗，請檢查 Log")]
 
-            logger.info("⚡ Executing Skill: %s | Args: %s", skill, args)
+        # 2. Call LLM (Parsing)
+        if parsed is None and CALENDAR_STREAM_DISPATCH:
+            return await self._handle_streaming(user_msg)
+        return await self._handle_parsed(user_msg, parsed)
 
+    async def _handle_parsed(self, user_msg, parsed=None):
+        """一般模式：取得完整的 Action List 後再執行 (parsed 為 None 時呼叫 LLM 解析)"""
+        if parsed is not None:
+            actions_list = as_action_list(parsed)
+        else:
             try:
-                if skill == "create_event":
-                    result = self.skills.create_event(**args)
-                    if result["success"]:
-                        ui_data = {
-                            "title": args.get("title"),
-                            "startTime": args.get("start_time"),
-                            "endTime": args.get("end_time"),
-                            "location": args.get("location", ""),
-                        }
-                        flex_json = generate_create_success_flex(ui_data)
-                        reply_messages.append(
-                            FlexMessage(
-                                alt_text=f"行程已建立: {args.get('title')}",
-                                contents=FlexContainer.from_dict(flex_json),
-                            )
-                        )
-                    else:
-                        reply_messages.append(
-                            TextMessage(
-                                text=f"❌ 建立失敗 ({args.get('title')}): {result.get('message')}"
-                            )
-                        )
-
-                elif skill == "batch_create":
-                    # Batch 處理 (如果 Prompt 回傳這種類型)
-                    # 註：新的 Prompt 通常會直接展開成多個 create_event，但保留此邏輯以防萬一
-                    raw_events = args.get("events", [])
-                    if not isinstance(raw_events, list):
-                        raw_events = [args]
-
-                    success_count = 0
-                    for evt in raw_events:
-                        clean_evt = self._normalize_args(evt)
-                        if self.skills.create_event(**clean_evt)["success"]:
-                            success_count += 1
-
-                    reply_messages.append(
-                        TextMessage(
-                            text=f"✅ 批量建立完成！共建立 {success_count} 筆行程"
-                        )
-                    )
-
-                elif skill == "list_events":
-                    result = self.skills.list_events(**args)
-                    if result["success"]:
-                        flex_json = generate_overview_flex(result["events"])
-                        reply_messages.append(
-                            FlexMessage(
-                                alt_text="行程總覽",
-                                contents=FlexContainer.from_dict(flex_json),
-                            )
-                        )
-                    else:
-                        reply_messages.append(
-                            TextMessage(text=f"❌ 查詢失敗: {result.get('message')}")
-                        )
-
-                elif skill == "delete_event":
-                    result = self.skills.delete_event_by_query(**args)
-                    if result["success"]:
-                        deleted_title = result["deleted_event"].get("summary", "行程")
-                        reply_messages.append(
-                            TextMessage(text=f"🗑️ 已刪除：{deleted_title}")
-                        )
-                    else:
-                        reply_messages.append(
-                            TextMessage(text=f"⚠️ 刪除失敗：{result['message']}")
-                        )
-
-                elif skill == "reschedule_event":
-                    result = self.skills.reschedule_event(**args)
-
-                    status_msg = ""
-                    if result["delete_status"]["success"]:
-                        status_msg += "🗑️ 舊行程已刪除\n"
-                    else:
-                        status_msg += "⚠️ 找不到舊行程 (直接建立新行程)\n"
-
-                    if result["create_status"]["success"]:
-                        ui_data = {
-                            "title": args.get("new_title"),
-                            "startTime": args.get("new_start_time"),
-                            "endTime": args.get("new_end_time"),
-                        }
-                        flex_json = generate_create_success_flex(ui_data)
-                        reply_messages.append(
-                            FlexMessage(
-                                alt_text="行程已改期",
-                                contents=FlexContainer.from_dict(flex_json),
-                            )
-                        )
-                    else:
-                        status_msg += "❌ 新行程建立失敗"
-                        reply_messages.append(TextMessage(text=status_msg))
-
-                else:
-                    reply_messages.append(TextMessage(text=f"🤔 未知指令: {skill}"))
-
-            except TypeError as te:
-                logger.error("Parameter Mismatch in %s: %s", skill, te)
-                reply_messages.append(TextMessage(text=f"❌ {skill} 參數錯誤"))
+                actions_list = await self.parse(user_msg)
             except Exception as e:
-                logger.error("Skill execution failed (%s): %s", skill, e)
-                reply_messages.append(TextMessage(text=f"❌ 執行 {skill} 時發生錯誤"))
+                logger.error("LLM parsing failed: %s", e)
+                return [TextMessage(text="😵‍💫 抱歉，我不確定您的指令，請再試一次。")]
+
+        logger.info("🤖 LLM Parsed Actions List: %s", actions_list)
+        return self._finalize_replies(await self._execute_group(actions_list, set()))
+
+    async def _execute_group(self, actions_list, claimed_ids):
+        """
+        依序執行一組 Action，回傳所有回覆訊息。
+        其中互不相依的多筆寫入先合併成一個 batch request (見 _run_batched_mutations)
+        """
+        batched = await self._run_batched_mutations(actions_list, claimed_ids)
+
+        reply_messages = []
+        for idx, action_data in enumerate(actions_list):
+            reply_messages.extend(
+                await self._execute_action(idx, action_data, batched, claimed_ids)
+            )
+        return reply_messages
+
+    def _joins_batch(self, pending, action_data):
+        """暫存的 Action 加上這一個之後，其中的寫入是否仍互不相依 (可以放進同一個 batch)"""
+        mutations = self._collect_mutations(pending + [action_data])
+        return len(self._independent_prefix(mutations)) == len(mutations)
 
+    async def _handle_streaming(self, user_msg):
+        """
+        [串流模式] 一邊接收 LLM 輸出一邊執行，不等整個 List 生成完。
+        每個 Action 先以 CALENDAR_ACTION 驗證 (同 cascade 的 schema)；還沒執行任何操作就遇到不合格的 Action 時，
+        改走一般解析，由 cascade 驗證並在需要時升級模型。
+        連續且互不相依的寫入先暫存，遇到 list_events、相依的寫入或串流結束時才一起排入執行 (走 batch request)。
+        各組依序執行 (每個 task 等前一個完成)，「先建立再改期」不會互相競爭；
+        刪除 / 改期共用 claimed_ids，不會選到同一筆行程。
+        """
+        stream = _StreamDispatch(self)
+        items = self.llm.astream_json_items(
+            self._user_prompt(user_msg),
+            schema=CALENDAR_ACTIONS,
+            system_prefix=self.prompt_template,
+        )
+        error_message = None
+        reparse = False
+        try:
+            async for action_data in items:
+                errors = validate(action_data, CALENDAR_ACTION)
+                if errors and not stream.tasks:
+                    # 還沒有任何寫入：捨棄這次串流，改走一般解析
+                    logger.info("⤴️ Streamed action invalid, falling back to full parse: %s", "; ".join(errors[:3]))
+                    reparse = True
+                    break
+                if errors:
+                    raise ValueError(f"Streamed action invalid: {'; '.join(errors[:3])}")
+
+                logger.info("🤖 Streamed action: %s", action_data)
+                stream.add(action_data)
+        except Exception as e:
+            logger.error("LLM streaming parse failed: %s", e)
+            if not stream.tasks and not stream.pending:
+                return [TextMessage(text="😵‍💫 抱歉，我不確定您的指令，請再試一次。")]
+            error_message = TextMessage(text="⚠️ 後續指令解析失敗，僅執行了前面的操作。")
+        finally:
+            await items.aclose()
+
+        if reparse:
+            return await self._handle_parsed(user_msg)
+        reply_messages = await stream.results()
+        if error_message:
+            reply_messages.append(error_message)
+        return self._finalize_replies(reply_messages)
+
+    def _finalize_replies(self, reply_messages):
+        """套用 LINE 的訊息數量上限；沒有任何結果時回傳提示"""
         # 限制回傳訊息數量 (LINE 上限為 MAX_LINE_MESSAGES 則)
         if len(reply_messages) > MAX_LINE_MESSAGES:
             reply_messages = reply_messages[: MAX_LINE_MESSAGES - 1]
@@ -225,3 +416,44 @@ class CalendarAgent:
             return [TextMessage(text="❓ 系統無法識別任何有效操作")]
 
         return reply_messages
+
+
+class _StreamDispatch:
+    """
+    串流模式的排程 (見 CalendarAgent._handle_streaming)：把抵達的 Action 分組後依序排入執行。
+    連續且互不相依的寫入留在 pending，等到遇到 list_events、相依的寫入或串流結束才一起執行 (走 batch request)。
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.tasks = []
+        self.pending = []
+        self.claimed_ids = set()
+
+    def add(self, action_data):
+        if not self.agent._joins_batch(self.pending, action_data):
+            self.flush()
+        self.pending.append(action_data)
+        # 查詢要看到前面寫入的結果，也不能被之後的寫入搶先
+        if action_data.get("skill") == "list_events":
+            self.flush()
+
+    def flush(self):
+        """把 pending 排成一個 task，等前一組執行完才開始"""
+        if not self.pending:
+            return
+        previous = self.tasks[-1] if self.tasks else None
+        self.tasks.append(asyncio.create_task(self._run_after(previous, list(self.pending))))
+        self.pending.clear()
+
+    async def _run_after(self, previous, actions):
+        if previous is not None:
+            # 只等前一組結束 (它自己會處理錯誤)，不傳遞它的例外
+            await asyncio.wait([previous])
+        return await self.agent._execute_group(actions, self.claimed_ids)
+
+    async def results(self):
+        """排入剩下的 Action，等全部執行完，依序回傳所有回覆訊息"""
+        self.flush()
+        results = await asyncio.gather(*self.tasks)
+        return [message for messages in results for message in messages]
@@ -7,7 +7,7 @@ logger = logging.getLogger(__name__)
 
 class ChatAgent:
     def __init__(self):
-        self.llm = create_llm_provider(role="agent")
+        self.llm = create_llm_provider(role="chat")
         
         # 讀取 prompt
         current_dir = pathlib.Path(__file__).parent.parent
@@ -37,13 +37,15 @@ class ChatAgent:
         else:
             memory_ctx = "目前沒有找到相關的背景記憶。"
 
-        prompt = self.prompt_template.replace("{{USER_INPUT}}", user_text).replace(
-            "{{MEMORY_CONTEXT}}", memory_ctx
+        # 固定的指示作為 system prefix (可被供應商快取)，記憶與使用者輸入每次不同
+        prompt = (
+            f"<MEMORY_CONTEXT>\n{memory_ctx}\n</MEMORY_CONTEXT>\n\n"
+            f'User Input: "{user_text}"'
         )
 
         try:
             # 一般對話不需要 JSON 格式，直接利用 agenerate 生成文字
-            reply_text = await self.llm.agenerate(prompt)
+            reply_text = await self.llm.agenerate(prompt, system_prefix=self.prompt_template)
             return [TextMessage(text=reply_text)]
         except Exception as e:
             logger.error("❌ Chat Agent failed: %s", e)
@@ -5,7 +5,8 @@ from linebot.v3.messaging import TextMessage
 
 # 引入 Skill
 from src.skills.expense import ExpenseSkills
-from src.services.llm.factory import create_llm_provider
+from src.services.llm.factory import create_structured_provider
+from src.services.llm.schemas import EXPENSE_ACTION
 
 logger = logging.getLogger(__name__)
 
@@ -13,42 +14,51 @@ logger = logging.getLogger(__name__)
 class ExpenseAgent:
     def __init__(self):
         self.skills = ExpenseSkills()
-        self.llm = create_llm_provider(role="agent")
+        self.llm = create_structured_provider("expense")
+        # 讀入一次後重複使用 (固定前綴才能被供應商快取)
+        self.prompt_template = self._load_prompt()
 
-    def _load_prompt(self, user_text):
-        """讀取 Prompt 並填入變數"""
+    def _load_prompt(self):
+        """讀取 Prompt (固定不變的指示，作為 system prefix)"""
         current_dir = pathlib.Path(__file__).parent.parent
         prompt_path = current_dir / "prompts" / "expense_agent.txt"
 
         try:
             with open(prompt_path, "r", encoding="utf-8") as f:
-                template = f.read()
+                return f.read()
         except Exception as e:
             logger.error("❌ Error reading expense prompt: %s", e)
             return ""
 
+    async def parse(self, user_text):
+        """
+        呼叫 LLM 解析記帳 / 查帳指令 (不執行)。
+        拋出: Exception (Prompt 遺失或解析失敗，由呼叫方處理)
+        """
+        if not self.prompt_template:
+            raise ValueError("Expense prompt not loaded")
         today = datetime.date.today().isoformat()
-        prompt = template.replace("{{CURRENT_DATE}}", today)
-        return f"{prompt}\n\nUser Input: {user_text}"
+        prompt = f"Current Date: {today}\nUser Input: {user_text}"
+        return await self.llm.aparse_json_response(
+            prompt, schema=EXPENSE_ACTION, system_prefix=self.prompt_template
+        )
 
-    async def handle_message(self, user_text, user_id=None):
+    async def handle_message(self, user_text, user_id=None, parsed=None):
         """
         處理記帳與查帳請求的主流程
+        parsed: 已經解析好的結果 (speculative parsing 或 fused pipeline)；None 時才呼叫 LLM
         """
         logger.info("💰 Expense Agent received: %s", user_text)
 
         # 1. 呼叫 LLM 解析意圖
-        try:
-            prompt = self._load_prompt(user_text)
-            if not prompt:
-                return [TextMessage(text="❌ 系統錯誤：Prompt 載入失敗，請檢查 Log")]
-
-            ai_response = await self.llm.aparse_json_response(prompt)
-            logger.info("🤖 AI Parsed Data: %s", ai_response)
-
-        except Exception as e:
-            logger.error("❌ LLM Parsing Error: %s", str(e))
-            return [TextMessage(text="😵‍💫 抱歉，我看不懂這個指令，請再試一次。")]
+        ai_response = parsed
+        if ai_response is None:
+            try:
+                ai_response = await self.parse(user_text)
+            except Exception as e:
+                logger.error("❌ LLM Parsing Error: %s", str(e))
+                return [TextMessage(text="😵‍💫 抱歉，我看不懂這個指令，請再試一次。")]
+        logger.info("🤖 AI Parsed Data: %s", ai_response)
 
         # 2. 根據 Action 分流處理
         action = ai_response.get("action")
@@ -0,0 +1,92 @@
+import logging
+import datetime
+import pathlib
+
+from src.services.llm.factory import create_llm_provider
+from src.services.llm.schemas import FUSED_DECISION
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("CALENDAR", "EXPENSE", "CHAT")
+
+# 從各 Agent 的 Prompt 擷取技能說明的區段 (start marker, end marker)，維持單一來源
+CALENDAR_SPEC_MARKERS = ("=== SKILLS AVAILABLE ===", "=== OUTPUT FORMAT ===")
+EXPENSE_SPEC_MARKERS = ("### 模式 A", "---")
+
+
+def _extract_section(text: str, markers: tuple[str, str]) -> str:
+    """取出 text 中 start marker (含) 到 end marker (不含) 之間的內容；找不到 marker 時回傳全文"""
+    start_marker, end_marker = markers
+    start = text.find(start_marker)
+    if start < 0:
+        return text
+    end = text.find(end_marker, start + len(start_marker))
+    return text[start:end if end > 0 else None].strip()
+
+
+class FusedRouter:
+    """
+    [Fused Pipeline] 單一次 LLM 呼叫同時完成路由與解析。
+    回傳 intent、needs_memory 與 Agent 的 action payload，由 CalendarAgent / ExpenseAgent 以 parsed= 直接執行，
+    省下 two-stage 模式中第二段的 LLM 延遲與重複送出的共用上下文。
+    """
+
+    def __init__(self):
+        # 需要完整解析 Agent payload，使用 agent 等級的模型
+        self.llm = create_llm_provider(role="agent")
+        self.prompt_template = self._load_prompt()
+
+    def _load_prompt(self) -> str:
+        prompts_dir = pathlib.Path(__file__).parent.parent / "prompts"
+        try:
+            template = (prompts_dir / "fused_router.txt").read_text(encoding="utf-8")
+            calendar_prompt = (prompts_dir / "calendar_agent.txt").read_text(encoding="utf-8")
+            expense_prompt = (prompts_dir / "expense_agent.txt").read_text(encoding="utf-8")
+        except Exception as e:
+            logger.error("❌ Error reading fused router prompt: %s", e)
+            return ""
+
+        logger.info("✅ Fused router prompt loaded")
+        return template.replace(
+            "{{CALENDAR_SPEC}}", _extract_section(calendar_prompt, CALENDAR_SPEC_MARKERS)
+        ).replace(
+            "{{EXPENSE_SPEC}}", _extract_section(expense_prompt, EXPENSE_SPEC_MARKERS)
+        )
+
+    def build_prompt(self, user_text: str) -> str:
+        """每次不同的部分 (固定指示 self.prompt_template 以 system prefix 傳入)"""
+        now = datetime.datetime.now()
+        return f'Current Time in Taiwan: {now.isoformat()}\nUser Input: "{user_text}"'
+
+    async def route(self, user_text: str) -> tuple[str, bool, object]:
+        """
+        回傳: intent (str), needs_memory (bool), payload (Agent 的 parsed 結果；無效或 CHAT 時為 None)
+        失敗時回傳 ("CHAT", False, None)，與 two-stage Router 的 fallback 一致。
+        """
+        if not self.prompt_template:
+            return "CHAT", False, None
+
+        try:
+            data = await self.llm.aparse_json_response(
+                self.build_prompt(user_text),
+                schema=FUSED_DECISION,
+                system_prefix=self.prompt_template,
+            )
+        except Exception as e:
+            logger.error("❌ Fused Router Error: %s", e)
+            return "CHAT", False, None
+
+        intent = data.get("intent", "CHAT")
+        if intent not in INTENTS:
+            intent = "CHAT"
+        needs_memory = bool(data.get("needs_memory", False))
+
+        payload = data.get("payload")
+        if intent == "CALENDAR" and not isinstance(payload, (list, dict)):
+            payload = None
+        elif intent == "EXPENSE" and not (isinstance(payload, dict) and payload.get("action")):
+            payload = None
+        elif intent == "CHAT":
+            payload = None
+        # payload 為 None 時 Agent 會自行重新解析
+        return intent, needs_memory, payload
@@ -1,20 +1,13 @@
 import json
 import logging
-from src.services.llm.factory import create_llm_provider
+from src.services.llm.factory import create_structured_provider
+from src.services.llm.schemas import MEMORY_RECORD
 
 logger = logging.getLogger(__name__)
 
-class MemoryParser:
-    """
-    負責解析並抽取使用者訊息中的資訊，轉換為標準的儲存格式（摘要、標籤、類型）。
-    """
-    def __init__(self):
-        # 記憶整理需要較強的理解力，因此這裡使用 agent 權重的 LLM
-        self.llm = create_llm_provider(role="agent")
-        
-    def _get_prompt(self, user_text: str) -> str:
-        return f"""
-You are an expert knowledge extractor. Your task is to analyze the user's message and extract key information to be stored in a memory database.
+# 固定的指示 (作為 system prefix，可被供應商快取)；使用者訊息另外傳入
+MEMORY_SYSTEM_PROMPT = """
+You are an expert knowledge extractor. Your task is to analyze the user's message (given after these instructions as USER MESSAGE) and extract key information to be stored in a memory database.
 
 RULES:
 1. "summary" should be a concise 1-2 sentence description of the core information or fact.
@@ -25,25 +18,32 @@ RULES:
    - "task_note": For to-dos, reminders, or actionable items.
    - "daily_log": For general observations, thoughts, or non-technical logs.
 
-USER MESSAGE:
-"{user_text}"
-
 OUTPUT FORMAT:
 Return ONLY valid JSON matching this structure exactly:
-{{
+{
     "summary": "...",
     "tags": ["...", "..."],
     "memory_type": "..."
-}}
+}
 """
 
+class MemoryParser:
+    """
+    負責解析並抽取使用者訊息中的資訊，轉換為標準的儲存格式（摘要、標籤、類型）。
+    """
+    def __init__(self):
+        # 記憶整理需要較強的理解力，因此這裡使用 agent 權重的 LLM (啟用 cascade 時先試 router 模型)
+        self.llm = create_structured_provider("memory")
+        
     async def parse_memory(self, user_text: str) -> dict:
         """
         非同步呼叫 LLM 抽取記憶欄位。
         """
-        prompt = self._get_prompt(user_text)
+        prompt = f'USER MESSAGE:\n"{user_text}"'
         try:
-            result = await self.llm.aparse_json_response(prompt)
+            result = await self.llm.aparse_json_response(
+                prompt, schema=MEMORY_RECORD, system_prefix=MEMORY_SYSTEM_PROMPT
+            )
             # 確保欄位皆存在
             summary = result.get("summary", "User note")
             tags = result.get("tags", [])
@@ -12,13 +12,32 @@ GEMINI_ROUTER_MODEL_NAME = "gemini-2.5-flash-lite"
 # Agent: 求準，解析使用者語意，可用更強的模型
 GEMINI_AGENT_MODEL_NAME = "gemini-3-flash-preview"
 
-# Gemini 生成參數（統一管理，保持回應風格一致）
-GEMINI_GENERATION_CONFIG = {
-    "temperature": 0.7,  # 0.0 ~ 1.0，越低越精確，越高越有創意
-    "top_p": 0.95,
-    "top_k": 40,
-    "max_output_tokens": 8192,
+# --- Generation Profiles (依用途套用，見 factory.create_llm_provider 的 profile 參數) ---
+# router: 只輸出一個小 JSON (intent / needs_memory)，溫度 0、輸出上限很小
+# agent:  解析成 JSON action，溫度 0 讓輸出穩定可重現 (Gemini 3 模型除外，見 GEMINI_DEFAULT_TEMPERATURE_MODELS)
+# chat:   閒聊回覆，保留較高的創意與長度
+GEMINI_GENERATION_PROFILES = {
+    "router": {"temperature": 0.0, "max_output_tokens": 256},
+    "agent": {"temperature": 0.0, "max_output_tokens": 4096},
+    "chat": {
+        "temperature": 0.7,  # 0.0 ~ 1.0，越低越精確，越高越有創意
+        "top_p": 0.95,
+        "top_k": 40,
+        "max_output_tokens": 8192,
+    },
 }
+# Thinking 設定依模型世代而定：2.5 系列用 thinking_budget (0 = 關閉)，Gemini 3 用 thinking_level
+GEMINI_THINKING_CONFIG = {
+    GEMINI_ROUTER_MODEL_NAME: {"thinking_budget": 0},
+    GEMINI_AGENT_MODEL_NAME: {"thinking_level": "low"},
+}
+# 這些模型不套用 profile 的 temperature：Gemini 3 建議維持預設的 1.0 (調低可能出現重複迴圈或推理變差)
+GEMINI_DEFAULT_TEMPERATURE_MODELS = {GEMINI_AGENT_MODEL_NAME}
+
+# Gemini 明確快取 (cached content)：Prompt 檔的固定前綴建立一次快取，之後的呼叫直接引用
+# 前綴太短 (低於模型的最小快取 token 數) 時會自動改用一般的 system_instruction；其他建立失敗會在 backoff 後重試
+GEMINI_CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
 
 # --- Claude Model Configuration ---
 # Router: 求快，使用 Haiku 系列（成本最低）
@@ -26,5 +45,109 @@ CLAUDE_ROUTER_MODEL_NAME = "claude-haiku-4-5"
 # Agent: 求準，使用 Sonnet 系列（平衡效能與成本）
 CLAUDE_AGENT_MODEL_NAME = "claude-sonnet-4-5"
 
-# Claude max_tokens（必填參數，Gemini 無此限制）
-CLAUDE_MAX_TOKENS = 8192
+# Claude 生成參數 (max_tokens 為必填參數)，profile 同 GEMINI_GENERATION_PROFILES
+CLAUDE_GENERATION_PROFILES = {
+    "router": {"temperature": 0.0, "max_tokens": 256},
+    "agent": {"temperature": 0.0, "max_tokens": 4096},
+    "chat": {"temperature": 0.7, "max_tokens": 8192},
+}
+
+# --- Model Cascade ---
+# Calendar / Expense / Memory 的解析先用 Router 等級的模型，輸出不符合 schema 才升級到 Agent 模型
+LLM_CASCADE_ENABLED = os.getenv("LLM_CASCADE_ENABLED", "false").lower() == "true"
+
+# --- Hedged Requests ---
+# 主要供應商超過 hedge delay 未回應 (或失敗) 時，同時呼叫備援供應商，取先回來的有效結果
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+# 備援供應商，留空 = 另一家 (gemini <-> claude)
+LLM_HEDGE_BACKUP_PROVIDER = os.getenv("LLM_HEDGE_BACKUP_PROVIDER", "")
+# 樣本數不足前使用的 hedge delay (秒)；之後改用主要供應商近期延遲的 percentile
+LLM_HEDGE_INITIAL_DELAY = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "2.0"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+
+# --- Google Calendar Mirror ---
+# 以 Calendar syncToken 增量同步的本地鏡像，查詢/刪除/改期前的搜尋都直接讀本地資料。
+# Webhook (AsyncGCalService) 預設啟用；報表腳本只有在設定快照路徑時才使用 (才能跨次執行保留 syncToken)。
+CALENDAR_MIRROR_ENABLED = os.getenv("CALENDAR_MIRROR_ENABLED", "true").lower() == "true"
+# 快照位置：本地檔案路徑，或 firestore:<collection>/<document> (留空 = 只存在記憶體)
+# 快照只保存行程 id / etag / 起訖時間與 syncToken，不含行程內容
+CALENDAR_MIRROR_SNAPSHOT = os.getenv("CALENDAR_MIRROR_SNAPSHOT", "")
+# 距離上次同步超過幾秒，查詢前就先做一次增量同步
+CALENDAR_MIRROR_MAX_STALENESS = float(os.getenv("CALENDAR_MIRROR_MAX_STALENESS", "30"))
+# 第一次 full sync 只下載 [現在 - PAST_DAYS, 現在 + FUTURE_DAYS] 的行程 (0 = 該側不設限)，區間外的查詢直接打 API
+CALENDAR_MIRROR_PAST_DAYS = int(os.getenv("CALENDAR_MIRROR_PAST_DAYS", "30"))
+CALENDAR_MIRROR_FUTURE_DAYS = int(os.getenv("CALENDAR_MIRROR_FUTURE_DAYS", "365"))
+
+# --- LLM HTTP 連線池 (所有 role 共用，每個供應商一個 client) ---
+# 同時連線上限、保留的 keep-alive 連線數與閒置多久後關閉 (秒)
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 多工 (需要安裝 h2 套件，見 requirements.txt)
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() == "true"
+
+# --- Local Intent Classifier (Router 前的快速路徑) ---
+# 規則 / centroid 的信心分數達到門檻就直接採用，不再呼叫 Router LLM
+INTENT_LOCAL_ENABLED = os.getenv("INTENT_LOCAL_ENABLED", "true").lower() == "true"
+INTENT_LOCAL_THRESHOLD = float(os.getenv("INTENT_LOCAL_THRESHOLD", "0.9"))
+# 各 intent 的 embedding centroid (由 src/scripts/intent_eval.py --build-centroids 產生，留空 = 只用規則)
+INTENT_CENTROIDS_PATH = os.getenv("INTENT_CENTROIDS_PATH", "")
+
+# --- Router Decision Cache ---
+# 以正規化後的訊息 (去空白、全形轉半形、數字遮罩) 快取 Router LLM 的 (intent, needs_memory)
+ROUTER_CACHE_ENABLED = os.getenv("ROUTER_CACHE_ENABLED", "true").lower() == "true"
+ROUTER_CACHE_TTL = float(os.getenv("ROUTER_CACHE_TTL", "3600"))
+ROUTER_CACHE_MAX_SIZE = int(os.getenv("ROUTER_CACHE_MAX_SIZE", "1024"))
+# 同時寫入 Firestore (cache_router 集合)，讓其他 warm instance 也能命中
+ROUTER_CACHE_SHARED = os.getenv("ROUTER_CACHE_SHARED", "false").lower() == "true"
+
+# --- Embedding Dimensionality ---
+# gemini-embedding-001 預設輸出 3072 維；支援截斷 (MRL) 成較小的維度以縮小 Firestore 文件、索引與搜尋成本
+# 0 = 使用模型預設維度 (與既有記憶、向量索引一致)。改成 768 等較小維度是需要明確執行的遷移：
+# 先以新維度重建 Firestore 向量索引並執行 src/scripts/backfill_embeddings.py，再更新部署的設定；
+# 否則查詢向量與索引維度不符，記憶搜尋會失敗
+EMBEDDING_DIMENSIONALITY = int(os.getenv("EMBEDDING_DIMENSIONALITY", "0"))
+# 截斷後的向量不再是單位長度，重新做 L2 正規化 (cosine 搜尋與 centroid 分類都以此為前提)
+EMBEDDING_RENORMALIZE = os.getenv("EMBEDDING_RENORMALIZE", "true").lower() == "true"
+
+# --- Embedding Cache ---
+# 以 (模型名稱, 正規化文字) 的 hash 快取 Embedding 向量；相同輸入不再呼叫 Gemini
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+# L1 (instance 內 LRU) 上限：每個 3072 維向量約 24 KB
+EMBEDDING_CACHE_MAX_SIZE = int(os.getenv("EMBEDDING_CACHE_MAX_SIZE", "256"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+# L2：同時寫入 Firestore (cache_embedding 集合)，讓其他 warm instance / 冷啟動後也能命中
+EMBEDDING_CACHE_SHARED = os.getenv("EMBEDDING_CACHE_SHARED", "false").lower() == "true"
+
+# --- Memory Search (Firestore vector search 後的重新排序) ---
+# 分數 = weight * 相似度 (1 - cosine distance) + (1 - weight) * 時間衰減
+MEMORY_SEARCH_SIMILARITY_WEIGHT = float(os.getenv("MEMORY_SEARCH_SIMILARITY_WEIGHT", "0.7"))
+# cosine distance 超過門檻的記憶直接由 Firestore 過濾掉 (0 = 不過濾)
+MEMORY_SEARCH_DISTANCE_THRESHOLD = float(os.getenv("MEMORY_SEARCH_DISTANCE_THRESHOLD", "0.6"))
+# 多抓幾倍的候選讓時間衰減重新排序：距離越集中抓越多，差距大時相似度已決定排名，少抓即可
+MEMORY_SEARCH_OVERFETCH_MIN = float(os.getenv("MEMORY_SEARCH_OVERFETCH_MIN", "1.0"))
+MEMORY_SEARCH_OVERFETCH_MAX = float(os.getenv("MEMORY_SEARCH_OVERFETCH_MAX", "3.0"))
+
+# --- Speculative Agent Parsing ---
+# 在 Router 判斷的同時，先用「最可能的」Agent 解析指令；Router 結果一致就直接使用，否則取消
+SPECULATIVE_PARSE_ENABLED = os.getenv("SPECULATIVE_PARSE_ENABLED", "false").lower() == "true"
+
+# --- LLM Pipeline Mode ---
+# "two_stage": Router 分類後再由 Agent 解析 (預設)
+# "fused": 單一次呼叫同時回傳 intent 與 Agent 的 action payload (見 src/scripts/pipeline_benchmark.py)
+LLM_PIPELINE_MODE = os.getenv("LLM_PIPELINE_MODE", "two_stage").lower()
+
+# --- LLM Resilience (Deadline / Retry / Circuit Breaker) ---
+# 每則訊息處理的總時間預算 (秒)；每次 LLM 呼叫的 timeout 取「單次上限」與「剩餘預算」的較小值
+LLM_REQUEST_BUDGET = float(os.getenv("LLM_REQUEST_BUDGET", "20"))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "15"))
+# 可重試錯誤 (429 / 5xx / 連線逾時) 的重試次數與 backoff 基準秒數 (full jitter)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+# 同一供應商連續失敗幾次就斷路 (fail fast)，斷路多久後放行一次試探呼叫
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# --- Calendar Streaming Dispatch ---
+# 串流接收 Calendar Agent 的輸出，每個 Action 一解析完整就開始執行 (不等整個 List 生成完，也不走 batch request)
+CALENDAR_STREAM_DISPATCH = os.getenv("CALENDAR_STREAM_DISPATCH", "false").lower() == "true"
@@ -0,0 +1,116 @@
+"""
+把 Firestore 中舊版 (embedding_version 與目前 EmbeddingService.version 不同) 的記憶向量轉成目前的版本。
+
+兩種轉換方式：
+    truncate: 舊向量來自同一個模型且維度足夠時直接截斷 + 重新正規化 (gemini-embedding-001 支援 MRL 截斷，不需呼叫 API)
+    reembed:  以記憶原文 (content) 重新呼叫 Embedding API
+預設 auto：能截斷就截斷，否則重新 embed。
+
+用法：
+    python -m src.scripts.backfill_embeddings --dry-run
+    python -m src.scripts.backfill_embeddings [--mode auto|truncate|reembed] [--batch-size 200] [--concurrency 8]
+
+需要 GEMINI_API_KEY 與 Firestore 權限；EMBEDDING_DIMENSIONALITY 設為遷移後的目標維度 (例如 768)。
+變更維度時，Firestore 向量索引 (memories.embedding) 也要以新維度重建，兩者都完成後再更新部署的設定。
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from collections import Counter
+
+# 加入專案根目錄以讀取 src 模組
+sys.path.append(os.getcwd())
+
+from src.services.firestore_service import AsyncFirestoreService  # noqa: E402
+from src.services.llm.embedding import EmbeddingService  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+logger = logging.getLogger("BackfillEmbeddings")
+
+# 遷移只需要這幾個欄位
+FIELDS = ("content", "embedding", "embedding_version")
+# Firestore 單一 batch write 上限
+MAX_BATCH_SIZE = 500
+
+
+def can_truncate(service: EmbeddingService, data: dict) -> bool:
+    """
+    舊向量可以直接截斷：
+    - 有標記版本：來自同一個模型，且維度不小於目標維度
+    - 未標記版本的舊資料：可能是 text-embedding-004 (768 維) 等其他模型的輸出，
+      只有維度「大於」目標 (例如 gemini-embedding-001 的完整 3072 維) 才視為可截斷，其餘重新 embed
+    """
+    vector = data.get("embedding")
+    version = data.get("embedding_version")
+    target = service.output_dimensionality
+    if not vector or not target:
+        return False
+    if not version:
+        return len(vector) > target
+    return version.startswith(f"{service.model_name}@") and len(vector) >= target
+
+
+async def convert_page(service: EmbeddingService, docs, mode: str, semaphore, stats: Counter) -> dict:
+    """回傳這一頁需要更新的 {doc_id: 新向量}"""
+    updates = {}
+
+    async def reembed(doc_id: str, content: str):
+        async with semaphore:
+            try:
+                updates[doc_id] = await service.get_embedding(content)
+                stats["reembedded"] += 1
+            except Exception as e:
+                logger.warning("⚠️ Re-embed failed for %s: %s", doc_id, e)
+                stats["failed"] += 1
+
+    jobs = []
+    for doc in docs:
+        data = doc.to_dict()
+        if data.get("embedding_version") == service.version:
+            stats["current"] += 1
+            continue
+
+        if mode != "reembed" and can_truncate(service, data):
+            updates[doc.id] = service.reduce(list(data["embedding"]))
+            stats["truncated"] += 1
+        elif mode != "truncate" and data.get("content"):
+            jobs.append(reembed(doc.id, data["content"]))
+        else:
+            stats["skipped"] += 1
+
+    await asyncio.gather(*jobs)
+    return updates
+
+
+async def backfill(args):
+    service = EmbeddingService()
+    firestore_service = AsyncFirestoreService()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    stats = Counter()
+    logger.info("🎯 Target embedding version: %s", service.version)
+
+    async for docs in firestore_service.iter_memory_pages(args.batch_size, FIELDS):
+        updates = await convert_page(service, docs, args.mode, semaphore, stats)
+        if updates and not args.dry_run:
+            ok = await firestore_service.update_memory_embeddings(updates, service.version)
+            stats["written" if ok else "write_failed"] += len(updates)
+        logger.info("📦 Page done (%d docs): %s", len(docs), dict(stats))
+
+    logger.info("✅ Backfill finished%s: %s", " (dry run)" if args.dry_run else "", dict(stats))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Migrate memory embeddings to the current version")
+    arg_parser.add_argument("--mode", choices=("auto", "truncate", "reembed"), default="auto")
+    arg_parser.add_argument("--batch-size", type=int, default=200)
+    arg_parser.add_argument("--concurrency", type=int, default=8, help="同時進行的 Embedding API 呼叫數")
+    arg_parser.add_argument("--dry-run", action="store_true", help="只統計，不寫入 Firestore")
+    args = arg_parser.parse_args()
+    args.batch_size = min(args.batch_size, MAX_BATCH_SIZE)
+    asyncio.run(backfill(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ from linebot.v3.messaging import (
     TextMessage,
 )
 
+from src.config import CALENDAR_MIRROR_SNAPSHOT
 from src.skills.calendar_skill import CalendarSkills
 from src.utils.flex_templates import generate_overview_flex
 
@@ -51,7 +52,8 @@ def main():
 
     # 2. 呼叫 Skill
     try:
-        skills = CalendarSkills()
+        # 有快照 (Firestore) 時走 syncToken 增量同步，不必每次重新下載整段行程
+        skills = CalendarSkills(use_mirror=bool(CALENDAR_MIRROR_SNAPSHOT))
         result = skills.list_events(time_min=time_min, time_max=time_max)
 
         if not result["success"]:
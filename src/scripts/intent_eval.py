@@ -0,0 +1,170 @@
+"""
+本地意圖分類器 (LocalIntentClassifier) 的離線評估。
+
+用法：
+    python -m src.scripts.intent_eval                         # 只評估規則
+    python -m src.scripts.intent_eval --centroids c.json      # 規則 + centroid
+    python -m src.scripts.intent_eval --build-centroids c.json  # 以樣本建立 centroid (需要 GEMINI_API_KEY)
+    python -m src.scripts.intent_eval --calibrate             # 在 held-out 集上計算各規則的 confidence
+
+樣本檔為 JSONL：{"text": ..., "intent": "CALENDAR|EXPENSE|CHAT", "needs_memory": bool}
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from collections import Counter, defaultdict
+
+# 加入專案根目錄以讀取 src 模組
+sys.path.append(os.getcwd())
+
+from src.services.intent_classifier import RULES, LocalIntentClassifier  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+logger = logging.getLogger("IntentEval")
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), "intent_samples.jsonl")
+# 校正規則 confidence 用的 held-out 集 (含容易誤判的敘述句、型號數字等)
+HELDOUT_SAMPLES = os.path.join(os.path.dirname(__file__), "intent_heldout.jsonl")
+
+
+def load_samples(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def embed_samples(samples: list[dict]) -> list[list[float]]:
+    from src.services.llm.embedding import EmbeddingService
+
+    service = EmbeddingService()
+    return await asyncio.gather(*(service.get_embedding(s["text"]) for s in samples))
+
+
+def build_centroids(samples, embeddings, out_path: str, min_similarity: float):
+    """以各 intent 的樣本 embedding 平均值作為 centroid"""
+    grouped = defaultdict(list)
+    for sample, vector in zip(samples, embeddings):
+        grouped[sample["intent"]].append(vector)
+
+    centroids = {
+        intent: [sum(col) / len(vectors) for col in zip(*vectors)]
+        for intent, vectors in grouped.items()
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({"min_similarity": min_similarity, "centroids": centroids}, f)
+    logger.info("✅ Wrote %d centroids to %s", len(centroids), out_path)
+
+
+def evaluate(classifier: LocalIntentClassifier, samples, embeddings=None) -> dict:
+    """
+    回傳各層的命中率 (hit rate) 與命中時的準確率，並列出會交給 Router LLM 的樣本 (fallbacks)。
+    沒命中的樣本在線上會交給 Router LLM，不算錯。
+    """
+    hits = Counter()
+    correct = Counter()
+    confusion = Counter()
+    fallbacks = []
+    elapsed = 0.0
+
+    for i, sample in enumerate(samples):
+        t0 = time.perf_counter()
+        decision = classifier.classify_text(sample["text"])
+        elapsed += time.perf_counter() - t0
+        if decision is None and embeddings is not None:
+            decision = classifier.classify_embedding(embeddings[i], sample["text"])
+        if decision is None:
+            hits["fallback"] += 1
+            fallbacks.append(sample["text"])
+            continue
+
+        hits[decision.source] += 1
+        ok = decision.intent == sample["intent"] and decision.needs_memory == sample.get(
+            "needs_memory", False
+        )
+        if ok:
+            correct[decision.source] += 1
+        else:
+            confusion[(sample["intent"], decision.intent)] += 1
+            logger.warning("❌ %s -> %s (%s)", sample["text"], decision.intent, decision.source)
+
+    local = hits["rule"] + hits["centroid"]
+    return {
+        "samples": len(samples),
+        "hit_rate": round(local / len(samples), 3) if samples else 0.0,
+        "precision": round((correct["rule"] + correct["centroid"]) / local, 3) if local else 0.0,
+        "hits": dict(hits),
+        "confusion": {f"{gold}->{pred}": n for (gold, pred), n in confusion.items()},
+        "rule_latency_us": round(elapsed / len(samples) * 1e6, 1) if samples else 0.0,
+        "fallbacks": fallbacks,
+    }
+
+
+def calibrate(samples) -> dict:
+    """
+    各規則在樣本上的命中數與準確率 (不論門檻)。
+    confidence 取 Laplace 平滑 (正確 + 1) / (命中 + 2)：命中次數少的規則不會因為偶然全對就超過門檻。
+    """
+    hits = Counter()
+    correct = Counter()
+    for sample in samples:
+        for name, intent, _ in LocalIntentClassifier.matching_rules(sample["text"].strip()):
+            hits[name] += 1
+            if intent == sample["intent"]:
+                correct[name] += 1
+            else:
+                logger.warning("❌ [%s] %s -> %s", name, sample["text"], intent)
+
+    current = {name: confidence for name, _, confidence, _ in RULES}
+    return {
+        name: {
+            "hits": hits[name],
+            "precision": round(correct[name] / hits[name], 3) if hits[name] else None,
+            "confidence": round((correct[name] + 1) / (hits[name] + 2), 3),
+            "current": current[name],
+        }
+        for name in current
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Evaluate the local intent classifier")
+    arg_parser.add_argument("--samples", default=DEFAULT_SAMPLES)
+    arg_parser.add_argument("--threshold", type=float, default=None)
+    arg_parser.add_argument("--centroids", default="", help="evaluate with this centroid file")
+    arg_parser.add_argument("--build-centroids", default="", help="write centroids to this path")
+    arg_parser.add_argument("--min-similarity", type=float, default=0.75)
+    arg_parser.add_argument(
+        "--calibrate", action="store_true", help="report per-rule confidence on the held-out set"
+    )
+    args = arg_parser.parse_args()
+
+    if args.calibrate:
+        samples_path = HELDOUT_SAMPLES if args.samples == DEFAULT_SAMPLES else args.samples
+        print(json.dumps(calibrate(load_samples(samples_path)), ensure_ascii=False, indent=2))
+        return
+
+    samples = load_samples(args.samples)
+    embeddings = None
+    centroids_path = args.centroids
+
+    if args.build_centroids or args.centroids:
+        embeddings = asyncio.run(embed_samples(samples))
+    if args.build_centroids:
+        build_centroids(samples, embeddings, args.build_centroids, args.min_similarity)
+        # 註：在同一批樣本上評估會偏樂觀，正式調整門檻請另外準備驗證集
+        centroids_path = centroids_path or args.build_centroids
+
+    kwargs = {"centroids_path": centroids_path}
+    if args.threshold is not None:
+        kwargs["threshold"] = args.threshold
+    classifier = LocalIntentClassifier(**kwargs)
+
+    report = evaluate(classifier, samples, embeddings)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+比較 two-stage (Router → Agent) 與 fused (單一次呼叫) 兩種 LLM pipeline 的延遲與 token 用量。
+另外單獨量測 Router 呼叫：router profile (溫度 0、小輸出上限) 對照 chat profile (溫度 0.7、大輸出上限)。
+thinking 依模型設定 (GEMINI_THINKING_CONFIG)，兩者都是 Router 模型，所以這組對照不包含 thinking 的差異。
+只呼叫 LLM 解析，不會寫入日曆或試算表。
+
+用法：
+    python -m src.scripts.pipeline_benchmark [--samples path.jsonl] [--rounds 2]
+
+需要與 webhook 相同的環境變數 (LLM_PROVIDER、API Key、Google 憑證供 Agent 初始化)。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+
+# 加入專案根目錄以讀取 src 模組
+sys.path.append(os.getcwd())
+
+from src.agents.calendar import CalendarAgent  # noqa: E402
+from src.agents.expense import ExpenseAgent  # noqa: E402
+from src.agents.fused_router import FusedRouter  # noqa: E402
+from src.services.llm.factory import create_llm_provider  # noqa: E402
+from src.services.llm.schemas import ROUTER_DECISION  # noqa: E402
+from src.services.llm.usage import track_usage  # noqa: E402
+from src.scripts.intent_eval import DEFAULT_SAMPLES, load_samples  # noqa: E402
+
+logging.basicConfig(level=logging.WARNING, stream=sys.stdout)
+logger = logging.getLogger("PipelineBenchmark")
+
+ROUTER_PROMPT_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "prompts", "system_prompt.txt"
+)
+
+
+class RouterOnly:
+    """只有 Router 呼叫 (main.py 的 LLM 分類那一步)，profile 決定溫度與輸出上限 (thinking 由模型決定)"""
+
+    def __init__(self, profile: str = "router"):
+        self.router_llm = create_llm_provider(role="router", profile=profile)
+        with open(ROUTER_PROMPT_PATH, "r", encoding="utf-8") as f:
+            self.router_template = f.read()
+
+    async def run(self, text: str) -> str:
+        data = await self.router_llm.aparse_json_response(
+            f'User Input: "{text}"', schema=ROUTER_DECISION, system_prefix=self.router_template
+        )
+        return data.get("intent", "CHAT")
+
+
+class TwoStage(RouterOnly):
+    """重現 main.py 的 two-stage 路徑 (不含本地分類 / 快取，量的是 LLM 本身)"""
+
+    def __init__(self):
+        super().__init__()
+        self.parsers = {"CALENDAR": CalendarAgent().parse, "EXPENSE": ExpenseAgent().parse}
+
+    async def run(self, text: str) -> str:
+        intent = await super().run(text)
+        if intent in self.parsers:
+            await self.parsers[intent](text)
+        return intent
+
+
+class Fused:
+    def __init__(self):
+        self.router = FusedRouter()
+
+    async def run(self, text: str) -> str:
+        intent, _, _ = await self.router.route(text)
+        return intent
+
+
+async def measure(pipeline, samples, rounds: int) -> dict:
+    latencies, tokens, correct = [], [], 0
+    for _ in range(rounds):
+        for sample in samples:
+            with track_usage() as usage:
+                t0 = time.perf_counter()
+                try:
+                    intent = await pipeline.run(sample["text"])
+                except Exception as e:
+                    logger.warning("⚠️ %s failed on %s: %s", type(pipeline).__name__, sample["text"], e)
+                    continue
+                latencies.append((time.perf_counter() - t0) * 1000)
+            tokens.append(usage.total_tokens)
+            correct += intent == sample["intent"]
+
+    if not latencies:
+        return {"runs": 0}
+    latencies.sort()
+    return {
+        "runs": len(latencies),
+        "intent_accuracy": round(correct / len(latencies), 3),
+        "latency_ms_p50": round(statistics.median(latencies), 1),
+        "latency_ms_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+        "tokens_avg": round(statistics.mean(tokens), 1),
+    }
+
+
+async def main_async(args):
+    samples = load_samples(args.samples)
+    report = {}
+    pipelines = (
+        ("router_only", RouterOnly()),
+        ("router_only_chat_profile", RouterOnly(profile="chat")),
+        ("two_stage", TwoStage()),
+        ("fused", Fused()),
+    )
+    for name, pipeline in pipelines:
+        report[name] = await measure(pipeline, samples, args.rounds)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark two-stage vs fused LLM pipeline")
+    arg_parser.add_argument("--samples", default=DEFAULT_SAMPLES)
+    arg_parser.add_argument("--rounds", type=int, default=1)
+    asyncio.run(main_async(arg_parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+import os
+import json
+import time
+import logging
+import datetime
+
+from src.services.event_index import EventIndex, rank_candidates
+
+logger = logging.getLogger(__name__)
+
+TW_TZ = datetime.timezone(datetime.timedelta(hours=8))
+
+# 快照格式版本，欄位有變動時遞增，舊快照會被忽略並重新 full sync
+SNAPSHOT_VERSION = 3
+# 快照只保存增量同步需要的欄位 (不含標題、地點、描述等行程內容)
+SNAPSHOT_EVENT_FIELDS = ("id", "etag", "start", "end")
+# 存在 Firestore 的快照：CALENDAR_MIRROR_SNAPSHOT=firestore:<collection>/<document>
+FIRESTORE_SNAPSHOT_PREFIX = "firestore:"
+
+# full sync 的區間落後「現在」應有的區間超過這麼多，就在查詢超出範圍時重新 full sync
+WINDOW_SLACK = datetime.timedelta(days=1)
+
+
+def parse_event_time(value: dict) -> datetime.datetime | None:
+    """把 event 的 start/end ({"dateTime"} 或整天的 {"date"}) 轉成有時區的 datetime"""
+    if not value:
+        return None
+    if value.get("dateTime"):
+        return datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+    if value.get("date"):
+        # 整天行程以台灣時間的午夜為界
+        return datetime.datetime.fromisoformat(value["date"]).replace(tzinfo=TW_TZ)
+    return None
+
+
+def parse_bound(iso_str: str | None) -> datetime.datetime | None:
+    """查詢區間的邊界 (沒給時區視為台灣時間)"""
+    if not iso_str:
+        return None
+    dt = datetime.datetime.fromisoformat(iso_str.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=TW_TZ)
+    return dt
+
+
+class FileSnapshotStore:
+    """快照存在本地 JSON 檔 (先寫暫存檔再 rename，避免寫到一半被讀到)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict | None:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, data: dict):
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class FirestoreSnapshotStore:
+    """
+    快照存在 Firestore 的單一文件 (報表腳本用：GitHub Actions 的 cache 在公開 repo 中可被 PR 讀取)。
+    Client 在第一次讀寫時才建立，沒用到快照就不需要 Firestore 權限。
+    """
+
+    def __init__(self, collection: str, document: str):
+        self.collection = collection
+        self.document = document
+        self._doc_ref = None
+
+    def _doc(self):
+        if self._doc_ref is None:
+            from google.cloud import firestore
+
+            self._doc_ref = firestore.Client().collection(self.collection).document(self.document)
+        return self._doc_ref
+
+    def load(self) -> dict | None:
+        doc = self._doc().get()
+        return doc.to_dict() if doc.exists else None
+
+    def save(self, data: dict):
+        self._doc().set(data)
+
+    def delete(self):
+        self._doc().delete()
+
+
+def snapshot_store(location: str):
+    """
+    依 CALENDAR_MIRROR_SNAPSHOT 建立快照儲存 (留空 = 不落地)。
+    firestore:<collection>/<document> 存 Firestore，其他視為本地檔案路徑。
+    """
+    if not location:
+        return None
+    if location.startswith(FIRESTORE_SNAPSHOT_PREFIX):
+        collection, _, document = location[len(FIRESTORE_SNAPSHOT_PREFIX):].partition("/")
+        if not collection or not document:
+            raise ValueError(f"Invalid Firestore snapshot location: {location}")
+        return FirestoreSnapshotStore(collection, document)
+    return FileSnapshotStore(location)
+
+
+class CalendarMirror:
+    """
+    Google Calendar 的本地鏡像 (in-memory，可選擇落地成 JSON 快照)。
+
+    由 GCalService / AsyncGCalService 透過 Calendar syncToken 做增量同步：
+    第一次 full sync 只下載 [現在 - past_days, 現在 + future_days] 的行程 (timeMin/timeMax 只能用在 full sync)，
+    之後以 syncToken 只下載有變動的行程；syncToken 過期 (HTTP 410) 時由 service 呼叫 reset() 重來。
+    查詢區間超出 full sync 的範圍時 (covers() 為 False)，由 service 改查 API；
+    區間是依 full sync 當時的「現在」決定的，日子過去後 (window_drifted()) 由 service 呼叫 request_full_sync() 把區間往後移。
+    查詢 (list_events、刪除/改期前的搜尋) 直接在本地完成，不再每次下載 30 天的行程。
+
+    快照 (snapshot_path：本地路徑或 firestore:<collection>/<document>) 只保存 id、etag、起訖時間與 syncToken。
+    從快照還原的行程沒有內容 (skeleton)：區間內還有 skeleton 時 is_complete() 為 False，
+    由 service 改查 API，再以 hydrate() 把查回的完整行程補進鏡像。
+    """
+
+    def __init__(
+        self,
+        calendar_id: str,
+        snapshot_path: str = "",
+        max_staleness: float = 30.0,
+        past_days: int = 0,
+        future_days: int = 0,
+    ):
+        self.calendar_id = calendar_id
+        self.snapshot_path = snapshot_path
+        self.snapshot = snapshot_store(snapshot_path)
+        self.max_staleness = max_staleness
+        self.past_days = past_days
+        self.future_days = future_days
+
+        self.sync_token: str | None = None
+        self.last_synced = 0.0  # time.monotonic()；0 代表需要同步
+        # full sync 涵蓋的區間 (None = 該側不設限)
+        self.window: tuple[datetime.datetime | None, datetime.datetime | None] = (None, None)
+        self._events: dict[str, dict] = {}
+        self._bounds: dict[str, tuple] = {}
+        self.index = EventIndex()
+        # 從快照還原、還沒有內容的行程 id
+        self._skeletons: set[str] = set()
+        # 區間落後時要求重新 full sync；在 begin_full_sync() 真正清空前，鏡像不再拿來回答查詢
+        self._full_sync_requested = False
+
+        if self.snapshot:
+            self.load_snapshot()
+
+    def __len__(self):
+        return len(self._events)
+
+    @property
+    def needs_full_sync(self) -> bool:
+        return self.sync_token is None or self._full_sync_requested
+
+    def is_stale(self) -> bool:
+        """距離上次同步超過 max_staleness 秒，就需要再做一次增量同步"""
+        return self.needs_full_sync or time.monotonic() - self.last_synced > self.max_staleness
+
+    def invalidate(self):
+        """標記為過期，下次查詢前強制增量同步 (例如建立了週期行程，實例需由 Google 展開)"""
+        self.last_synced = 0.0
+
+    def reset(self):
+        """清空鏡像 (syncToken 失效時使用)，下次同步會是 full sync"""
+        self._events.clear()
+        self._bounds.clear()
+        self._skeletons.clear()
+        self.index.clear()
+        self.sync_token = None
+        self.last_synced = 0.0
+        self.window = (None, None)
+        self._full_sync_requested = False
+
+    def request_full_sync(self):
+        """
+        要求下次同步做 full sync (例如區間已落後)。
+        不立刻清空，避免和進行中的增量同步互相干擾；清空留給 begin_full_sync()
+        """
+        self._full_sync_requested = True
+
+    def window_drifted(self) -> bool:
+        """full sync 的區間是否已落後現在應有的區間 (future_days 那一側少了超過 WINDOW_SLACK)"""
+        window_max = self.window[1]
+        if self.needs_full_sync or window_max is None or not self.future_days:
+            return False
+        wanted_max = datetime.datetime.now(TW_TZ) + datetime.timedelta(days=self.future_days)
+        return wanted_max - window_max > WINDOW_SLACK
+
+    def begin_full_sync(self) -> dict:
+        """清空鏡像並決定這次 full sync 的區間，回傳 events.list 要加的 timeMin/timeMax"""
+        self.reset()
+        now = datetime.datetime.now(TW_TZ)
+        self.window = (
+            now - datetime.timedelta(days=self.past_days) if self.past_days else None,
+            now + datetime.timedelta(days=self.future_days) if self.future_days else None,
+        )
+        params = {}
+        if self.window[0]:
+            params["timeMin"] = self.window[0].isoformat()
+        if self.window[1]:
+            params["timeMax"] = self.window[1].isoformat()
+        return params
+
+    # ---------- 同步結果套用 ----------
+
+    def upsert(self, event: dict):
+        """新增或更新單一行程 (status=cancelled 視為刪除)"""
+        event_id = event.get("id")
+        if not event_id:
+            return
+        if event.get("status") == "cancelled":
+            self.remove(event_id)
+            return
+        try:
+            bounds = (parse_event_time(event.get("start")), parse_event_time(event.get("end")))
+        except ValueError:
+            bounds = (None, None)
+        self._events[event_id] = event
+        self._bounds[event_id] = bounds
+        self._skeletons.discard(event_id)
+        self.index.add(event)
+
+    def remove(self, event_id: str):
+        self._events.pop(event_id, None)
+        self._bounds.pop(event_id, None)
+        self._skeletons.discard(event_id)
+        self.index.remove(event_id)
+
+    def _restore_skeleton(self, entry: dict):
+        """還原快照中的一筆行程 (只有 id 與時間，不進索引)"""
+        event_id = entry.get("id")
+        if not event_id:
+            return
+        try:
+            bounds = (parse_event_time(entry.get("start")), parse_event_time(entry.get("end")))
+        except ValueError:
+            bounds = (None, None)
+        self._events[event_id] = entry
+        self._bounds[event_id] = bounds
+        self._skeletons.add(event_id)
+
+    def hydrate(self, events: list[dict], time_min: str, time_max: str | None = None):
+        """
+        以 API 查回的 [time_min, time_max) 完整結果補上 skeleton 的內容。
+        查詢結果沒有出現的 skeleton 已不在這個區間內，直接移除。
+        """
+        self.apply_page(events)
+        stale = [event_id for event_id, _ in self._iter_window(time_min, time_max) if event_id in self._skeletons]
+        for event_id in stale:
+            self.remove(event_id)
+
+    def apply_page(self, items: list[dict]):
+        """套用一頁 events.list 的結果"""
+        for item in items:
+            self.upsert(item)
+
+    def finish_sync(self, next_sync_token: str | None):
+        """同步完成：記錄新的 syncToken 與時間，並寫回快照"""
+        if next_sync_token:
+            self.sync_token = next_sync_token
+        self.last_synced = time.monotonic()
+        if self.snapshot:
+            self.save_snapshot()
+
+    # ---------- 查詢 ----------
+
+    def covers(self, time_min: str, time_max: str | None = None) -> bool:
+        """[time_min, time_max) 是否完全落在 full sync 的區間內 (否則本地可能缺少行程)"""
+        window_min, window_max = self.window
+        dt_min = parse_bound(time_min)
+        dt_max = parse_bound(time_max)
+        if window_min and (dt_min is None or dt_min < window_min):
+            return False
+        if window_max and (dt_max is None or dt_max > window_max):
+            return False
+        return True
+
+    def is_complete(self, time_min: str, time_max: str | None = None) -> bool:
+        """區間內的行程是否都有內容 (沒有從快照還原、尚未補上的 skeleton)"""
+        if not self._skeletons:
+            return True
+        return not any(
+            event_id in self._skeletons for event_id, _ in self._iter_window(time_min, time_max)
+        )
+
+    def query(self, time_min: str, time_max: str | None = None) -> list[dict]:
+        """
+        回傳與 [time_min, time_max) 有重疊的行程，依開始時間排序。
+        與 events.list(timeMin, timeMax, singleEvents=True, orderBy=startTime) 的語意一致。
+        """
+        matched = [
+            (start, event_id) for event_id, start in self._iter_window(time_min, time_max)
+        ]
+        matched.sort(key=lambda item: item[0])
+        return [self._events[event_id] for _, event_id in matched]
+
+    def search(
+        self,
+        keyword: str,
+        anchor: str,
+        window_min: str,
+        window_max: str,
+        limit: int = 5,
+    ) -> list[dict]:
+        """
+        在 [window_min, window_max) 內以 n-gram 索引找出最符合 keyword 的行程，
+        同分時取開始時間最接近 anchor 的 (刪除/改期鎖定目標用)。
+        """
+        dt_anchor = parse_bound(anchor)
+        candidates = [
+            (self._events[event_id], start)
+            for event_id, start in self._iter_window(window_min, window_max)
+        ]
+        return rank_candidates(self.index, candidates, keyword, dt_anchor, limit)
+
+    def _iter_window(self, time_min: str, time_max: str | None):
+        """產生與區間重疊的 (event_id, start)"""
+        dt_min = parse_bound(time_min)
+        dt_max = parse_bound(time_max)
+        for event_id, (start, end) in self._bounds.items():
+            if start is None:
+                continue
+            end = end or start
+            if dt_min and end <= dt_min:
+                continue
+            if dt_max and start >= dt_max:
+                continue
+            yield event_id, start
+
+    # ---------- 快照 ----------
+
+    def load_snapshot(self):
+        """從快照還原 (忽略版本或日曆不符的快照)；行程只有 id 與時間，內容之後再補"""
+        try:
+            data = self.snapshot.load()
+        except Exception as e:
+            logger.warning("⚠️ Calendar mirror snapshot unreadable: %s", e)
+            return
+        if not data:
+            return
+
+        if data.get("version") != SNAPSHOT_VERSION or data.get("calendar_id") != self.calendar_id:
+            logger.info("♻️ Calendar mirror snapshot ignored (version/calendar mismatch)")
+            return
+
+        self.reset()
+        for entry in data.get("events", []):
+            self._restore_skeleton(entry)
+        self.sync_token = data.get("sync_token")
+        self.window = tuple(parse_bound(bound) for bound in data.get("window", (None, None)))
+        # 快照可能已經過時，仍需先做一次增量同步
+        self.last_synced = 0.0
+        logger.info("✅ Calendar mirror restored %d events from snapshot", len(self))
+
+    def save_snapshot(self):
+        """寫入快照 (只有增量同步需要的欄位，見 SNAPSHOT_EVENT_FIELDS)"""
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "calendar_id": self.calendar_id,
+            "sync_token": self.sync_token,
+            "window": [bound.isoformat() if bound else None for bound in self.window],
+            "events": [
+                {field: event[field] for field in SNAPSHOT_EVENT_FIELDS if field in event}
+                for event in self._events.values()
+            ],
+        }
+        try:
+            self.snapshot.save(data)
+        except Exception as e:
+            logger.warning("⚠️ Failed to save calendar mirror snapshot: %s", e)
+
+    def discard_snapshot(self):
+        """刪除快照 (syncToken 失效時使用，避免下次執行又還原同一個過期的 token)"""
+        if not self.snapshot:
+            return
+        try:
+            self.snapshot.delete()
+        except Exception as e:
+            logger.warning("⚠️ Failed to remove calendar mirror snapshot: %s", e)
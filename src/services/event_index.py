@@ -0,0 +1,147 @@
+import datetime
+import unicodedata
+from collections import Counter, defaultdict
+
+# 各欄位的權重：標題最重要，地點次之，描述只當輔助
+FIELD_WEIGHTS = {"summary": 1.0, "location": 0.6, "description": 0.3}
+# 關鍵字完整出現在標題時的加分
+EXACT_TITLE_BONUS = 0.5
+# 低於此分數視為不相符
+MIN_MATCH_SCORE = 0.5
+# n-gram 長度：2-gram 讓「會議」這類短中文詞也能命中，3-gram 讓英文拼錯一兩個字仍有分數
+GRAM_SIZES = (2, 3)
+
+
+def normalize_text(text: str) -> str:
+    """全形轉半形 (NFKC)、轉小寫、合併空白"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def text_grams(text: str) -> set[str]:
+    """
+    把文字切成字元 n-gram。
+    不依賴斷詞，所以中文 (CJK) 與英文都適用；單一字元的關鍵字則直接以該字元為 gram。
+    """
+    norm = normalize_text(text)
+    if not norm:
+        return set()
+    if len(norm) == 1:
+        return {norm}
+
+    grams = set()
+    for size in GRAM_SIZES:
+        for i in range(len(norm) - size + 1):
+            grams.add(norm[i:i + size])
+    # 單字元也收錄，讓單一字元的查詢有機會命中
+    grams.update(ch for ch in norm if not ch.isspace())
+    return grams
+
+
+class EventIndex:
+    """
+    行程的字元 n-gram 反向索引 (標題、地點、描述)。
+    CalendarMirror 會隨同步增量維護；沒有 Mirror 時也可以針對一次查詢結果臨時建立。
+    """
+
+    def __init__(self):
+        # field -> gram -> {event_id}
+        self._postings: dict[str, dict[str, set[str]]] = {
+            field: defaultdict(set) for field in FIELD_WEIGHTS
+        }
+        # event_id -> field -> grams (刪除時用來清 postings)
+        self._doc_grams: dict[str, dict[str, set[str]]] = {}
+        self._titles: dict[str, str] = {}
+
+    def __len__(self):
+        return len(self._doc_grams)
+
+    def add(self, event: dict):
+        event_id = event.get("id")
+        if not event_id:
+            return
+        self.remove(event_id)
+
+        doc = {}
+        for field in FIELD_WEIGHTS:
+            grams = text_grams(event.get(field, ""))
+            doc[field] = grams
+            for gram in grams:
+                self._postings[field][gram].add(event_id)
+        self._doc_grams[event_id] = doc
+        self._titles[event_id] = normalize_text(event.get("summary", ""))
+
+    def remove(self, event_id: str):
+        doc = self._doc_grams.pop(event_id, None)
+        self._titles.pop(event_id, None)
+        if not doc:
+            return
+        for field, grams in doc.items():
+            postings = self._postings[field]
+            for gram in grams:
+                ids = postings.get(gram)
+                if ids is None:
+                    continue
+                ids.discard(event_id)
+                if not ids:
+                    del postings[gram]
+
+    def clear(self):
+        for postings in self._postings.values():
+            postings.clear()
+        self._doc_grams.clear()
+        self._titles.clear()
+
+    def score(self, keyword: str, event_ids=None) -> dict[str, float]:
+        """
+        計算關鍵字與各行程的相似度。
+        分數 = 各欄位 (命中的 query gram 比例 × 欄位權重) 取最大值，標題完整包含關鍵字再加分。
+        event_ids: 只計算這些行程 (通常是時間窗內的候選)
+        """
+        query_grams = text_grams(keyword)
+        if not query_grams:
+            return {}
+
+        scores: dict[str, float] = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            postings = self._postings[field]
+            hits = Counter()
+            for gram in query_grams:
+                for event_id in postings.get(gram, ()):
+                    if event_ids is None or event_id in event_ids:
+                        hits[event_id] += 1
+            for event_id, count in hits.items():
+                scores[event_id] = max(scores[event_id], weight * count / len(query_grams))
+
+        norm_keyword = normalize_text(keyword)
+        for event_id in scores:
+            if norm_keyword and norm_keyword in self._titles.get(event_id, ""):
+                scores[event_id] += EXACT_TITLE_BONUS
+        return dict(scores)
+
+
+def rank_candidates(
+    index: EventIndex,
+    candidates: list[tuple[dict, datetime.datetime]],
+    keyword: str,
+    anchor: datetime.datetime,
+    limit: int = 5,
+) -> list[dict]:
+    """
+    依關鍵字相似度排序候選行程，同分時以「開始時間離 anchor 最近」決勝。
+    沒有 keyword 時只依時間距離排序。
+    candidates: [(event, start_dt), ...]
+    """
+    scores = {}
+    if keyword:
+        scores = index.score(keyword, {event["id"] for event, _ in candidates})
+
+    ranked = []
+    for event, start in candidates:
+        score = scores.get(event["id"], 0.0)
+        if keyword and score < MIN_MATCH_SCORE:
+            continue
+        distance = abs((start - anchor).total_seconds())
+        ranked.append((-round(score, 6), distance, event))
+
+    ranked.sort(key=lambda item: (item[0], item[1]))
+    return [event for _, _, event in ranked[:limit]]
@@ -1,11 +1,39 @@
 import os
+import math
 import uuid
 import logging
 import datetime
 from google.cloud import firestore
+from google.cloud.firestore_v1.vector import Vector
+
+from src.config import (
+    MEMORY_SEARCH_SIMILARITY_WEIGHT,
+    MEMORY_SEARCH_DISTANCE_THRESHOLD,
+    MEMORY_SEARCH_OVERFETCH_MIN,
+    MEMORY_SEARCH_OVERFETCH_MAX,
+)
 
 logger = logging.getLogger(__name__)
 
+# Vector search 回傳的 cosine distance 欄位名稱 (只存在查詢結果，不寫入文件)
+DISTANCE_FIELD = "vector_distance"
+
+# Vector search 只取回這些欄位 (不含數千維的 embedding，ChatAgent 與重新排序都用不到)
+MEMORY_SEARCH_FIELDS = ("summary", "tags", "created_at", "memory_type", DISTANCE_FIELD)
+
+# 各記憶類型的半衰期 (天)
+HALF_LIVES = {
+    "technical_log": 180,
+    "personal_fact": 99999,  # 幾乎不老化
+    "task_note": 7,
+    "daily_log": 30,
+}
+
+# 候選距離的分布 (max - min) 達到這個值時，相似度已足以決定排名，只需抓 MIN 倍
+SPREAD_FOR_MIN_OVERFETCH = 0.2
+# 距離分布的 EMA 平滑係數
+SPREAD_EMA_ALPHA = 0.3
+
 class AsyncFirestoreService:
     """
     非同步存取 Firestore，專責處理記憶日誌系統的文章 (Memory System)。
@@ -32,8 +60,56 @@ class AsyncFirestoreService:
             self.client = None
 
         self.collection_name = collection_name
+        # 近期 vector search 候選距離分布的 EMA (決定 over-fetch 倍數)
+        self._distance_spread: float | None = None
         self._initialized = True
 
+    async def awarmup(self) -> None:
+        """讀取一個 (不存在的) 文件，預先建立 gRPC channel 與取得 token"""
+        if not self.client:
+            raise RuntimeError("Firestore client not initialized")
+        await self.client.collection(self.collection_name).document("_warmup").get()
+
+    # ---------- 通用快取 (跨 instance 共用) ----------
+
+    async def get_cache_entry(self, namespace: str, key: str) -> dict | None:
+        """
+        讀取 cache_<namespace> 集合中的快取項目 (過期視為不存在)。
+        key 需為合法的 document id (呼叫端先 hash)。
+        """
+        if not self.client:
+            return None
+        try:
+            doc = await self.client.collection(f"cache_{namespace}").document(key).get()
+        except Exception as e:
+            logger.warning("⚠️ Cache read failed (%s): %s", namespace, e)
+            return None
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        expires_at = data.get("expires_at")
+        if expires_at and expires_at < datetime.datetime.now(datetime.timezone.utc):
+            return None
+        return data.get("value")
+
+    async def set_cache_entry(self, namespace: str, key: str, value: dict, ttl_seconds: float) -> bool:
+        """
+        寫入快取項目。expires_at 可搭配 Firestore TTL policy 自動清除過期文件。
+        """
+        if not self.client:
+            return False
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=ttl_seconds
+        )
+        try:
+            await self.client.collection(f"cache_{namespace}").document(key).set(
+                {"value": value, "expires_at": expires_at}
+            )
+            return True
+        except Exception as e:
+            logger.warning("⚠️ Cache write failed (%s): %s", namespace, e)
+            return False
+
     async def save_memory(
         self,
         user_id: str,
@@ -41,7 +117,8 @@ class AsyncFirestoreService:
         summary: str,
         tags: list[str],
         memory_type: str,
-        embedding: list[float]
+        embedding: list[float],
+        embedding_version: str | None = None,
     ) -> bool:
         """
         非同步儲存記憶至 Firestore。
@@ -52,7 +129,9 @@ class AsyncFirestoreService:
             summary: Gemini 歸納的摘要
             tags: 標籤
             memory_type: 記憶分類 ["technical_log", "personal_fact", "task_note", "daily_log"]
-            embedding: 768維向量
+            embedding: 向量 (維度見 EMBEDDING_DIMENSIONALITY，預設為模型維度)
+            embedding_version: 向量空間識別 (EmbeddingService.version)；
+                               沒有這個欄位的舊記憶由 src/scripts/backfill_embeddings.py 轉換
         """
         if not self.client:
             logger.error("❌ Firestore client not initialized")
@@ -69,7 +148,9 @@ class AsyncFirestoreService:
             "summary": summary,
             "tags": tags,
             "memory_type": memory_type,
-            "embedding": embedding,
+            # 以 Vector 型別寫入才會被向量索引收錄
+            "embedding": Vector(embedding),
+            "embedding_version": embedding_version,
             "decay_weight": 1.0,  # 初始權重
             "related_ids": [],    # Phase 3
             "source": "line_message"
@@ -84,76 +165,132 @@ class AsyncFirestoreService:
             logger.error("❌ Failed to save memory: %s", e)
             return False
 
-    async def search_memories(self, query_embedding: list[float], user_id: str, limit: int = 5) -> list[dict]:
+    # ---------- Embedding 遷移 (見 src/scripts/backfill_embeddings.py) ----------
+
+    async def iter_memory_pages(self, batch_size: int, fields: tuple[str, ...]):
+        """依 document id 分頁讀取所有記憶 (只取 fields)，每次 yield 一頁 DocumentSnapshot"""
+        if not self.client:
+            return
+        base = (
+            self.client.collection(self.collection_name)
+            .select(fields)
+            .order_by(firestore.FieldPath.document_id())
+            .limit(batch_size)
+        )
+        last = None
+        while True:
+            query = base.start_after(last) if last is not None else base
+            docs = await query.get()
+            if not docs:
+                return
+            yield docs
+            if len(docs) < batch_size:
+                return
+            last = docs[-1]
+
+    async def update_memory_embeddings(
+        self, updates: dict[str, list[float]], embedding_version: str
+    ) -> bool:
+        """以一次 batch write 更新多筆記憶的向量與版本 (單一 batch 上限 500 筆)"""
+        if not self.client or not updates:
+            return False
+        batch = self.client.batch()
+        coll_ref = self.client.collection(self.collection_name)
+        for doc_id, embedding in updates.items():
+            batch.update(
+                coll_ref.document(doc_id),
+                {"embedding": Vector(embedding), "embedding_version": embedding_version},
+            )
+        try:
+            await batch.commit()
+            return True
+        except Exception as e:
+            logger.error("❌ Failed to update embeddings: %s", e)
+            return False
+
+    async def search_memories(
+        self,
+        query_embedding: list[float],
+        user_id: str,
+        limit: int = 5,
+        include_embedding: bool = False,
+    ) -> list[dict]:
         """
         利用 Native Vector Search 找出最相關的記憶片段。
+        Firestore 回傳每筆的 cosine distance (DISTANCE_FIELD)，與時間衰減混合後重新排序；
+        超過 MEMORY_SEARCH_DISTANCE_THRESHOLD 的記憶不會被讀取，所以可能回傳少於 limit 筆。
+
+        只取回 MEMORY_SEARCH_FIELDS；需要向量本身的呼叫端 (例如去重、匯出) 傳 include_embedding=True。
         """
         if not self.client:
             return []
 
         try:
-            from google.cloud.firestore_v1.vector import Vector
             from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
-            
+
             coll_ref = self.client.collection(self.collection_name)
-            
-            # 1. 進行 Vector Search 查詢
-            # 目前 firestore python SDK 支援 vector search: vector_query
-            # 若 user_id 隔離，則需利用 pre-filter (若 SDK 支援) 或先查詢後過濾。
-            # 這裡先套用 basic find_nearest
-            vector_query = coll_ref.where("user_id", "==", user_id).find_nearest(
+
+            # 1. 進行 Vector Search 查詢 (以 user_id pre-filter)，多抓幾筆以便套用 time decay 後重新排序
+            fetch_limit = max(limit, math.ceil(limit * self._overfetch_factor()))
+            fields = MEMORY_SEARCH_FIELDS + (("embedding",) if include_embedding else ())
+            vector_query = coll_ref.where("user_id", "==", user_id).select(fields).find_nearest(
                 vector_field="embedding",
                 query_vector=Vector(query_embedding),
                 distance_measure=DistanceMeasure.COSINE,
-                limit=limit * 2 # 多抓幾筆以便套用 time decay 後重新排序
+                limit=fetch_limit,
+                distance_result_field=DISTANCE_FIELD,
+                distance_threshold=MEMORY_SEARCH_DISTANCE_THRESHOLD or None,
             )
-            
+
             docs = await vector_query.get()
             raw_memories = [doc.to_dict() for doc in docs]
-            
-            # 2. 於應用層計算 Decay Weight
-            scored_memories = []
+            if not raw_memories:
+                return []
+
+            # 2. 相似度與 Decay Weight 混合成一個分數，一次排序
             now = datetime.datetime.now(datetime.timezone.utc)
-            
-            half_lives = {
-                "technical_log": 180,
-                "personal_fact": 99999, # 幾乎不老化
-                "task_note": 7,
-                "daily_log": 30
-            }
-            
-            for mem in raw_memories:
-                m_type = mem.get("memory_type", "daily_log")
-                created_at_str = mem.get("created_at")
-                
-                # 計算時間差(天數)
-                try:
-                    dt = datetime.datetime.fromisoformat(created_at_str)
-                    days_diff = (now - dt).days
-                    if days_diff < 0: days_diff = 0
-                except:
-                    days_diff = 30
-                
-                h_life = half_lives.get(m_type, 30)
-                decay = 0.5 ** (days_diff / h_life) # 半衰期公式
-                
-                # 假設 vector search 會產生某種分數，如果沒有提供，我們直接降權 (不完美，但有效)
-                # 目前 get() 的結果雖然按照距離排列，但要重新排序我們需要絕對相似度...
-                # 在此假設原本在序列前面的代表原相似度較高
-                scored_memories.append({
-                    "data": mem,
-                    "decay": decay
-                })
-                
-            # 為了簡單化，假設傳回來的 index 越小，分數越高，加上 decay 混合排序
-            # 這是簡易實作，因為 vector search API 未必回傳精確字面 score 
-            # 實際上可使用 `_document.vector_distance` 不過可能在非官方公開屬性中
-            scored_memories.sort(key=lambda x: x["decay"], reverse=True)
-            
+            weight = MEMORY_SEARCH_SIMILARITY_WEIGHT
+            distances = [mem.get(DISTANCE_FIELD, 1.0) for mem in raw_memories]
+            scores = [
+                weight * (1.0 - distance) + (1.0 - weight) * _decay(mem, now)
+                for mem, distance in zip(raw_memories, distances)
+            ]
+            self._record_spread(distances)
+
+            ranked = sorted(zip(scores, range(len(raw_memories))), reverse=True)
             # 取出前 `limit` 名
-            final_memories = [m["data"] for m in scored_memories[:limit]]
-            return final_memories
-            
+            return [raw_memories[idx] for _, idx in ranked[:limit]]
+
         except Exception as e:
-            logger.error("❌ Exception in search_memories: %s", e)
+            # 最常見的原因是查詢向量與索引維度不符 (EMBEDDING_DIMENSIONALITY 變更後尚未重建索引 / backfill)
+            logger.error("❌ Exception in search_memories (query dim=%d): %s", len(query_embedding), e)
             return []
+
+    def _overfetch_factor(self) -> float:
+        """近期候選距離越集中，時間衰減越可能改變排名，就多抓一些候選"""
+        if self._distance_spread is None:
+            return MEMORY_SEARCH_OVERFETCH_MAX
+        ratio = min(self._distance_spread / SPREAD_FOR_MIN_OVERFETCH, 1.0)
+        return MEMORY_SEARCH_OVERFETCH_MAX - (
+            MEMORY_SEARCH_OVERFETCH_MAX - MEMORY_SEARCH_OVERFETCH_MIN
+        ) * ratio
+
+    def _record_spread(self, distances: list[float]):
+        if len(distances) < 2:
+            return
+        spread = max(distances) - min(distances)
+        if self._distance_spread is None:
+            self._distance_spread = spread
+        else:
+            self._distance_spread += SPREAD_EMA_ALPHA * (spread - self._distance_spread)
+
+
+def _decay(mem: dict, now: datetime.datetime) -> float:
+    """依記憶類型的半衰期計算時間衰減 (0 ~ 1)"""
+    try:
+        dt = datetime.datetime.fromisoformat(mem.get("created_at"))
+        days_diff = max((now - dt).days, 0)
+    except (TypeError, ValueError):
+        days_diff = 30
+    h_life = HALF_LIVES.get(mem.get("memory_type", "daily_log"), 30)
+    return 0.5 ** (days_diff / h_life)  # 半衰期公式
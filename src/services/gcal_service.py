@@ -1,42 +1,245 @@
 import os
+import json
+import uuid
+import asyncio
 import logging
 import datetime
+from urllib.parse import quote
+
+import aiohttp
 import google.auth
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from src.config import (
+    CALENDAR_MIRROR_ENABLED,
+    CALENDAR_MIRROR_SNAPSHOT,
+    CALENDAR_MIRROR_MAX_STALENESS,
+    CALENDAR_MIRROR_PAST_DAYS,
+    CALENDAR_MIRROR_FUTURE_DAYS,
+)
+from src.services.calendar_mirror import CalendarMirror, parse_bound, parse_event_time
+from src.services.event_index import EventIndex, rank_candidates
+
 logger = logging.getLogger(__name__)
 
+CALENDAR_SCOPES = ["https://www.googleapis.com/auth/calendar"]
+
+# AsyncGCalService 連線設定
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("GCAL_TIMEOUT_SECONDS", "10"))
+DEFAULT_POOL_SIZE = int(os.getenv("GCAL_POOL_SIZE", "10"))
+KEEPALIVE_SECONDS = 60
+
+# Partial response：只取 generate_overview_flex 與各 Skill 用得到的欄位
+EVENT_FIELDS = (
+    "id,etag,status,summary,location,description,start,end,htmlLink,recurrence,recurringEventId"
+)
+LIST_FIELDS = f"nextPageToken,items({EVENT_FIELDS})"
+SYNC_FIELDS = f"nextPageToken,nextSyncToken,items({EVENT_FIELDS})"
+# 每頁筆數 (API 上限 2500；小一點讓第一頁更快回來)
+LIST_PAGE_SIZE = 250
+
+# 刪除/改期搜尋時，往 time_min 之前多看幾小時 (LLM 給的時間常只是大概)
+SEARCH_LOOKBACK_HOURS = 3
+
+# Calendar batch endpoint 單次最多 50 個子請求
+BATCH_ENDPOINT = "https://www.googleapis.com/batch/calendar/v3"
+MAX_BATCH_SIZE = 50
+
+
+class GCalAPIError(Exception):
+    """Calendar REST API 回傳非 2xx 時拋出 (AsyncGCalService 專用)"""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"<HttpError {status}: {body[:300]}>")
+        self.status = status
+        self.body = body
+
+
+def _build_event_body(event_data):
+    """將 Skill 層的 event_data 轉成 Calendar API 的 event resource"""
+    body = {
+        "summary": event_data.get("title"),
+        "location": event_data.get("location", ""),
+        "description": event_data.get("description", ""),
+        "start": {
+            "dateTime": event_data["startTime"],
+            "timeZone": "Asia/Taipei",
+        },
+        "end": {
+            "dateTime": event_data["endTime"],
+            "timeZone": "Asia/Taipei",
+        },
+    }
+    # 週期行程 (RRULE)：Calendar 只存一筆主事件，由 Google 端展開
+    if event_data.get("recurrence"):
+        body["recurrence"] = event_data["recurrence"]
+    return body
+
+
+def _sync_params(mirror):
+    """
+    Mirror 同步用的 events.list 參數。
+    full sync 以 timeMin/timeMax 限定區間 (並清空鏡像)；增量同步只帶 syncToken (不可與 timeMin/timeMax/orderBy 併用)
+    """
+    params = {"singleEvents": True, "maxResults": 2500, "fields": SYNC_FIELDS}
+    if mirror.needs_full_sync:
+        params.update(mirror.begin_full_sync())
+    else:
+        params["syncToken"] = mirror.sync_token
+    return params
+
+
+def _apply_to_mirror(mirror, kind, payload, response):
+    """把成功的寫入結果同步到本地 Mirror，避免自己的寫入要等下次同步才看得到"""
+    if mirror is None:
+        return
+    if kind == "delete":
+        mirror.remove(payload)
+    elif kind == "create" and payload.get("recurrence"):
+        # 週期行程的實例由 Google 展開，下次查詢前重新增量同步
+        mirror.invalidate()
+    elif response:
+        mirror.upsert(response)
+
+
+def _hydrate_mirror(mirror, events, time_min, time_max):
+    """
+    把 API 查回的完整區間結果補進 Mirror (從快照還原的行程只有 id 與時間)。
+    呼叫端只能傳入沒有被 max_results 截斷的結果
+    """
+    if mirror is None or mirror.needs_full_sync or not mirror.covers(time_min, time_max):
+        return
+    mirror.hydrate(events, time_min, time_max)
+
+
+def _log_sync_failure(task: asyncio.Task):
+    """背景 full sync 的 done callback：取出例外並記錄 (下次查詢會再試)"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("⚠️ Background calendar mirror sync failed: %s", task.exception())
+
+
+def _normalize_time_range(time_min, time_max=None):
+    """
+    時區處理防呆 (沒給時區視為台灣時間，只給日期視為當天 00:00)，並在沒給 time_max 時預設查 30 天。
+    回傳的都是帶時區的 ISO 字串 (Calendar API 的 timeMin/timeMax 必須是 RFC3339)。
+    """
+    dt_min = parse_bound(time_min)
+    # 預設查 30 天 (為了涵蓋一般改期需求)
+    dt_max = parse_bound(time_max) or dt_min + datetime.timedelta(days=30)
+    return dt_min.isoformat(), dt_max.isoformat()
+
+
+def _search_window(time_min):
+    """刪除/改期的搜尋範圍：time_min 往前 SEARCH_LOOKBACK_HOURS 小時到往後 30 天"""
+    time_min, time_max = _normalize_time_range(time_min)
+    dt_min = parse_bound(time_min)
+    window_min = (dt_min - datetime.timedelta(hours=SEARCH_LOOKBACK_HOURS)).isoformat()
+    return time_min, window_min, time_max
+
+
+def _rank_listed_events(events, keyword, anchor, limit):
+    """沒有 Mirror 時：針對這次查詢結果臨時建立索引並排序"""
+    index = EventIndex()
+    candidates = []
+    for event in events:
+        start = parse_event_time(event.get("start"))
+        if start is None:
+            continue
+        index.add(event)
+        candidates.append((event, start))
+    return rank_candidates(index, candidates, keyword, parse_bound(anchor), limit)
+
 
 class GCalService:
-    def __init__(self):
+    def __init__(self, use_mirror: bool = False):
         self.calendar_id = os.getenv("CALENDAR_ID")
-        self.creds, _ = google.auth.default(
-            scopes=["https://www.googleapis.com/auth/calendar"]
+        self.creds, _ = google.auth.default(scopes=CALENDAR_SCOPES)
+        # 冷啟動優化：使用 google-api-python-client 套件內附的 discovery document，
+        # 不在啟動時透過網路抓取，也不嘗試讀寫 discovery cache
+        self.service = build(
+            "calendar",
+            "v3",
+            credentials=self.creds,
+            static_discovery=True,
+            cache_discovery=False,
         )
-        self.service = build("calendar", "v3", credentials=self.creds)
+
+        # 同步版預設不使用 Mirror (報表腳本只跑一次，full sync 反而更貴)，
+        # 除非有快照可以沿用上次的 syncToken
+        self.mirror = (
+            CalendarMirror(
+                self.calendar_id,
+                snapshot_path=CALENDAR_MIRROR_SNAPSHOT,
+                max_staleness=CALENDAR_MIRROR_MAX_STALENESS,
+                past_days=CALENDAR_MIRROR_PAST_DAYS,
+                future_days=CALENDAR_MIRROR_FUTURE_DAYS,
+            )
+            if use_mirror
+            else None
+        )
+
+    def sync_mirror(self):
+        """
+        以 syncToken 增量同步 Mirror (需要時為 full sync)。
+        token 過期 (410 Gone) 時直接在這裡重做 full sync 並寫回快照：
+        報表腳本每次只查一次，若留到下次查詢，快照裡會一直是過期的 token
+        """
+        try:
+            self._sync_pages()
+        except HttpError as error:
+            if error.resp.status != 410 or self.mirror.needs_full_sync:
+                raise
+            logger.warning("♻️ Calendar syncToken expired, running full sync")
+            # 先刪快照：full sync 也失敗時，下次執行不會再還原同一個過期的 token
+            self.mirror.discard_snapshot()
+            self.mirror.reset()
+            self._sync_pages()
+
+    def _sync_pages(self):
+        """跟著 nextPageToken 讀完這次同步的所有頁，完成後記錄新的 syncToken 並寫回快照"""
+        params = _sync_params(self.mirror)
+        page_token = None
+        while True:
+            result = (
+                self.service.events()
+                .list(calendarId=self.calendar_id, pageToken=page_token, **params)
+                .execute()
+            )
+            self.mirror.apply_page(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                self.mirror.finish_sync(result.get("nextSyncToken"))
+                return
+
+    def _mirror_covers(self, time_min, time_max) -> bool:
+        """
+        Mirror 能否直接回答這個區間的查詢 (必要時先同步)。
+        查詢超出範圍且 full sync 的區間已落後時，把區間往後移 (重新 full sync) 再判斷一次；
+        區間內還有從快照還原、沒有內容的行程時改查 API (查回後由 list_events 補進 Mirror)
+        """
+        if self.mirror.is_stale():
+            self.sync_mirror()
+        if self.mirror.covers(time_min, time_max):
+            return self.mirror.is_complete(time_min, time_max)
+        if self.mirror.window_drifted():
+            logger.info("♻️ Calendar mirror window is behind, running full sync")
+            self.mirror.request_full_sync()
+            self.sync_mirror()
+            return self.mirror.covers(time_min, time_max)
+        return False
 
     def create_event(self, event_data):
         """建立單一行程"""
         try:
-            event = {
-                "summary": event_data.get("title"),
-                "location": event_data.get("location", ""),
-                "description": event_data.get("description", ""),
-                "start": {
-                    "dateTime": event_data["startTime"],
-                    "timeZone": "Asia/Taipei",
-                },
-                "end": {
-                    "dateTime": event_data["endTime"],
-                    "timeZone": "Asia/Taipei",
-                },
-            }
+            event = _build_event_body(event_data)
             created_event = (
                 self.service.events()
                 .insert(calendarId=self.calendar_id, body=event)
                 .execute()
             )
+            _apply_to_mirror(self.mirror, "create", event_data, created_event)
             return {
                 "success": True,
                 "id": created_event.get("id"),
@@ -46,55 +249,567 @@ class GCalService:
             logger.error("An error occurred: %s", error)
             return {"success": False, "message": str(error)}
 
-    def list_events(self, time_min, time_max=None):
-        """查詢行程 (用於查詢與刪除前的搜尋)"""
+    def list_events(self, time_min, time_max=None, max_results=None):
+        """
+        查詢行程 (用於查詢與刪除前的搜尋)；有 Mirror 時直接查本地，區間超出 Mirror 範圍或失敗才打 API。
+        會跟著 nextPageToken 讀完所有頁；max_results 可限制總筆數 (達到上限就不再抓下一頁)。
+        """
+        if self.mirror is not None:
+            try:
+                norm_min, norm_max = _normalize_time_range(time_min, time_max)
+                if self._mirror_covers(norm_min, norm_max):
+                    events = self.mirror.query(norm_min, norm_max)
+                    return {"success": True, "events": events[:max_results] if max_results else events}
+            except Exception as e:
+                logger.warning("⚠️ Calendar mirror unavailable, querying API: %s", e)
+
         try:
-            # 時區處理防呆
-            if (
-                time_min
-                and "T" in time_min
-                and "+" not in time_min
-                and "Z" not in time_min
-            ):
-                time_min += "+08:00"
-            if (
-                time_max
-                and "T" in time_max
-                and "+" not in time_max
-                and "Z" not in time_max
-            ):
-                time_max += "+08:00"
-
-            if not time_max:
-                # 預設查 30 天 (為了涵蓋一般改期需求)
-                dt_min = datetime.datetime.fromisoformat(time_min)
-                dt_max = dt_min + datetime.timedelta(days=30)
-                time_max = dt_max.isoformat()
-
-            events_result = (
-                self.service.events()
-                .list(
-                    calendarId=self.calendar_id,
-                    timeMin=time_min,
-                    timeMax=time_max,
-                    singleEvents=True,
-                    orderBy="startTime",
+            time_min, time_max = _normalize_time_range(time_min, time_max)
+
+            events = []
+            page_token = None
+            while True:
+                events_result = (
+                    self.service.events()
+                    .list(
+                        calendarId=self.calendar_id,
+                        timeMin=time_min,
+                        timeMax=time_max,
+                        singleEvents=True,
+                        orderBy="startTime",
+                        maxResults=LIST_PAGE_SIZE,
+                        fields=LIST_FIELDS,
+                        pageToken=page_token,
+                    )
+                    .execute()
                 )
-                .execute()
-            )
-            events = events_result.get("items", [])
-            return {"success": True, "events": events}
+                events.extend(events_result.get("items", []))
+                page_token = events_result.get("nextPageToken")
+                if not page_token or (max_results and len(events) >= max_results):
+                    break
+            if not page_token:
+                _hydrate_mirror(self.mirror, events, time_min, time_max)
+            return {"success": True, "events": events[:max_results] if max_results else events}
         except Exception as e:
             logger.error("GCal List Error: %s", e)
             return {"success": False, "message": str(e)}
 
+    def find_events(self, time_min, keyword="", limit=5):
+        """
+        找出 time_min 附近最符合 keyword 的行程 (刪除/改期鎖定目標用)。
+        以標題/地點/描述的 n-gram 相似度排序，同分時取離 time_min 最近的。
+        """
+        anchor, window_min, window_max = _search_window(time_min)
+        if self.mirror is not None:
+            try:
+                if self._mirror_covers(window_min, window_max):
+                    events = self.mirror.search(keyword, anchor, window_min, window_max, limit)
+                    return {"success": True, "events": events}
+            except Exception as e:
+                logger.warning("⚠️ Calendar mirror unavailable, querying API: %s", e)
+
+        listed = self.list_events(window_min, window_max)
+        if not listed["success"]:
+            return listed
+        events = _rank_listed_events(listed["events"], keyword, anchor, limit)
+        return {"success": True, "events": events}
+
     def delete_event(self, event_id):
         """刪除行程 (為未來 Delete 功能做準備)"""
         try:
             self.service.events().delete(
                 calendarId=self.calendar_id, eventId=event_id
             ).execute()
+            _apply_to_mirror(self.mirror, "delete", event_id, None)
             return {"success": True}
         except HttpError as error:
             logger.error("GCal Delete Error: %s", error)
             return {"success": False, "message": str(error)}
+
+    def patch_event(self, event_id, patch_body):
+        """部分更新行程 (events.patch)：只覆寫 patch_body 內的欄位，保留 ID、參與者與描述"""
+        try:
+            patched_event = (
+                self.service.events()
+                .patch(calendarId=self.calendar_id, eventId=event_id, body=patch_body)
+                .execute()
+            )
+            _apply_to_mirror(self.mirror, "patch", event_id, patched_event)
+            return {"success": True, "event": patched_event}
+        except HttpError as error:
+            logger.error("GCal Patch Error: %s", error)
+            return {"success": False, "message": str(error)}
+
+
+def _mutation_result(kind, response):
+    """把單筆 mutation 的 API 回應轉成 Skill 層的結果格式"""
+    if kind == "delete":
+        return {"success": True}
+    response = response or {}
+    if kind == "patch":
+        return {"success": True, "event": response}
+    return {
+        "success": True,
+        "id": response.get("id"),
+        "link": response.get("htmlLink"),
+        "event": response,
+    }
+
+
+def _encode_batch_body(parts, boundary):
+    """
+    組出 multipart/mixed 的 batch request body。
+    parts: [(method, path, body_dict | None), ...]
+    """
+    lines = []
+    for idx, (method, path, body) in enumerate(parts):
+        lines.append(f"--{boundary}")
+        lines.append("Content-Type: application/http")
+        lines.append(f"Content-ID: <item{idx}>")
+        lines.append("")
+        lines.append(f"{method} {path} HTTP/1.1")
+        if body is not None:
+            payload = json.dumps(body, ensure_ascii=False)
+            lines.append("Content-Type: application/json; charset=UTF-8")
+            lines.append("")
+            lines.append(payload)
+        else:
+            lines.append("")
+        lines.append("")
+    lines.append(f"--{boundary}--")
+    return "\r\n".join(lines).encode("utf-8")
+
+
+def _decode_batch_response(text, boundary, size):
+    """
+    解析 batch response，回傳與送出順序一致的 [(status, body_text), ...]。
+    每個 part 的 Content-ID 為 <response-itemN>，據此對回原始順序。
+    """
+    results = [(0, "missing batch response part")] * size
+    for raw_part in text.split(f"--{boundary}"):
+        part = raw_part.strip()
+        if not part or part == "--":
+            continue
+
+        # part = 外層 headers + 空行 + 內層 HTTP response
+        normalized = part.replace("\r\n", "\n")
+        outer_headers, _, inner = normalized.partition("\n\n")
+        idx = None
+        for line in outer_headers.split("\n"):
+            if line.lower().startswith("content-id:") and "item" in line:
+                try:
+                    idx = int(line.rsplit("item", 1)[1].strip(" >"))
+                except ValueError:
+                    idx = None
+        if idx is None or not 0 <= idx < size:
+            continue
+
+        status_line, _, rest = inner.partition("\n")
+        try:
+            status = int(status_line.split(" ")[1])
+        except (IndexError, ValueError):
+            status = 0
+        _, _, body_text = rest.partition("\n\n")
+        results[idx] = (status, body_text.strip())
+    return results
+
+
+def _timeout_kwargs(timeout):
+    """
+    單次請求的 timeout 參數。
+    沒有指定時不帶 timeout=，讓 session 預設的 GCAL_TIMEOUT_SECONDS 生效
+    (aiohttp 會把 timeout=None 當成「完全不設上限」)。
+    """
+    if timeout is None:
+        return {}
+    return {"timeout": aiohttp.ClientTimeout(total=timeout)}
+
+
+class AsyncGCalService:
+    """
+    非同步版 GCalService。
+    直接以 aiohttp 呼叫 Calendar REST API，共用一個 keep-alive 連線池，
+    避免 googleapiclient 的同步 .execute() 卡住 webhook 的 event loop。
+    """
+
+    BASE_URL = "https://www.googleapis.com/calendar/v3"
+
+    def __init__(
+        self,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        use_mirror: bool = CALENDAR_MIRROR_ENABLED,
+    ):
+        self.calendar_id = os.getenv("CALENDAR_ID")
+        self.creds, _ = google.auth.default(scopes=CALENDAR_SCOPES)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.pool_size = pool_size
+
+        self._session: aiohttp.ClientSession | None = None
+        self._session_loop: asyncio.AbstractEventLoop | None = None
+        self._token_lock = asyncio.Lock()
+        self._sync_lock = asyncio.Lock()
+        # 背景 full sync 的 task (保留參照，避免被 GC)
+        self._full_sync_task: asyncio.Task | None = None
+
+        self.mirror = (
+            CalendarMirror(
+                self.calendar_id,
+                snapshot_path=CALENDAR_MIRROR_SNAPSHOT,
+                max_staleness=CALENDAR_MIRROR_MAX_STALENESS,
+                past_days=CALENDAR_MIRROR_PAST_DAYS,
+                future_days=CALENDAR_MIRROR_FUTURE_DAYS,
+            )
+            if use_mirror
+            else None
+        )
+
+    @property
+    def _events_url(self):
+        return f"{self.BASE_URL}/calendars/{quote(self.calendar_id or '', safe='')}/events"
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        取得共用的 ClientSession (Lazy 建立)。
+        Session 綁定建立時的 event loop；若 loop 已換 (例如腳本多次 asyncio.run)，就重建一個。
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=KEEPALIVE_SECONDS,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+            self._session_loop = loop
+            self._token_lock = asyncio.Lock()
+            self._sync_lock = asyncio.Lock()
+            self._full_sync_task = None
+        return self._session
+
+    async def _get_token(self) -> str:
+        """取得有效的 OAuth token，過期時在背景執行緒刷新 (google-auth 的 refresh 是同步的)"""
+        async with self._token_lock:
+            if not self.creds.valid:
+                await asyncio.to_thread(self.creds.refresh, GoogleAuthRequest())
+            return self.creds.token
+
+    async def _request(self, method, url, params=None, json_body=None, timeout=None):
+        """
+        送出單一 Calendar API 請求，回傳解析後的 JSON (DELETE 回傳空 dict)。
+        失敗時拋出 GCalAPIError，由上層轉成 {"success": False, ...}。
+        """
+        session = self._get_session()
+        headers = {"Authorization": f"Bearer {await self._get_token()}"}
+
+        async with session.request(
+            method,
+            url,
+            params=params,
+            json=json_body,
+            headers=headers,
+            **_timeout_kwargs(timeout),
+        ) as resp:
+            if resp.status >= 400:
+                raise GCalAPIError(resp.status, await resp.text())
+            if resp.status == 204:
+                return {}
+            return await resp.json(content_type=None) or {}
+
+    async def create_event(self, event_data, timeout=None):
+        """建立單一行程"""
+        try:
+            created_event = await self._request(
+                "POST",
+                self._events_url,
+                json_body=_build_event_body(event_data),
+                timeout=timeout,
+            )
+            _apply_to_mirror(self.mirror, "create", event_data, created_event)
+            return {
+                "success": True,
+                "id": created_event.get("id"),
+                "link": created_event.get("htmlLink"),
+            }
+        except (GCalAPIError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            logger.error("An error occurred: %s", error)
+            return {"success": False, "message": str(error) or "timeout"}
+
+    async def sync_mirror(self, timeout=None):
+        """
+        以 syncToken 增量同步 Mirror。
+        token 過期 (410 Gone) 時清空 Mirror 並在背景做 full sync，不在請求路徑上等它 (這次查詢改打 API)
+        """
+        async with self._sync_lock:
+            # 等鎖期間可能已被其他請求同步完成
+            if not self.mirror.is_stale():
+                return
+
+            params = _sync_params(self.mirror)
+            params["singleEvents"] = "true"
+            page_token = None
+            try:
+                while True:
+                    page_params = dict(params, pageToken=page_token) if page_token else params
+                    result = await self._request(
+                        "GET", self._events_url, params=page_params, timeout=timeout
+                    )
+                    self.mirror.apply_page(result.get("items", []))
+                    page_token = result.get("nextPageToken")
+                    if not page_token:
+                        self.mirror.finish_sync(result.get("nextSyncToken"))
+                        return
+            except GCalAPIError as error:
+                if error.status != 410 or "syncToken" not in params:
+                    raise
+                logger.warning("♻️ Calendar syncToken expired, running full sync in background")
+                self.mirror.reset()
+                self._schedule_full_sync()
+
+    def _schedule_full_sync(self):
+        """在背景做 full sync (已經在跑就不重複排程)"""
+        if self._full_sync_task is None or self._full_sync_task.done():
+            self._full_sync_task = asyncio.create_task(self.sync_mirror())
+            self._full_sync_task.add_done_callback(_log_sync_failure)
+
+    async def _mirror_covers(self, time_min, time_max, timeout=None) -> bool:
+        """
+        Mirror 能否直接回答這個區間的查詢 (必要時先做增量同步)。
+        還沒做過 full sync 時不在請求路徑上等它：改在背景同步，這次先直接查 API。
+        查詢超出範圍且 full sync 的區間已落後時，同樣在背景重新 full sync 把區間往後移。
+        """
+        if self.mirror.needs_full_sync:
+            self._schedule_full_sync()
+            return False
+        if self.mirror.is_stale():
+            await self.sync_mirror(timeout=timeout)
+            # syncToken 過期時 Mirror 已被清空，full sync 在背景進行
+            if self.mirror.needs_full_sync:
+                return False
+        if self.mirror.covers(time_min, time_max):
+            return self.mirror.is_complete(time_min, time_max)
+        if self.mirror.window_drifted():
+            logger.info("♻️ Calendar mirror window is behind, running full sync in background")
+            self.mirror.request_full_sync()
+            self._schedule_full_sync()
+        return False
+
+    async def iter_event_pages(
+        self, time_min, time_max=None, page_size=LIST_PAGE_SIZE, timeout=None
+    ):
+        """
+        [Async Generator] 逐頁產生行程 (依開始時間排序)。
+        呼叫端可以在第一頁回來時就開始處理，大範圍查詢也只需保留一頁在記憶體；
+        呼叫端提早停止迭代時，後面的頁面就不會再抓。
+        """
+        time_min, time_max = _normalize_time_range(time_min, time_max)
+        params = {
+            "timeMin": time_min,
+            "timeMax": time_max,
+            "singleEvents": "true",
+            "orderBy": "startTime",
+            "maxResults": page_size,
+            "fields": LIST_FIELDS,
+        }
+        while True:
+            events_result = await self._request(
+                "GET", self._events_url, params=params, timeout=timeout
+            )
+            yield events_result.get("items", [])
+
+            page_token = events_result.get("nextPageToken")
+            if not page_token:
+                return
+            params = dict(params, pageToken=page_token)
+
+    async def list_events(self, time_min, time_max=None, max_results=None, timeout=None):
+        """
+        查詢行程 (用於查詢與刪除前的搜尋)；有 Mirror 時直接查本地，區間超出 Mirror 範圍或失敗才打 API。
+        API 路徑會串流讀完所有頁；max_results 可限制總筆數 (達到上限就不再抓下一頁)。
+        """
+        if self.mirror is not None:
+            try:
+                norm_min, norm_max = _normalize_time_range(time_min, time_max)
+                if await self._mirror_covers(norm_min, norm_max, timeout=timeout):
+                    events = self.mirror.query(norm_min, norm_max)
+                    return {"success": True, "events": events[:max_results] if max_results else events}
+            except Exception as e:
+                logger.warning("⚠️ Calendar mirror unavailable, querying API: %s", e)
+
+        try:
+            events = await self._list_from_api(time_min, time_max, max_results, timeout)
+            return {"success": True, "events": events[:max_results] if max_results else events}
+        except Exception as e:
+            logger.error("GCal List Error: %s", e)
+            return {"success": False, "message": str(e) or "timeout"}
+
+    async def _list_from_api(self, time_min, time_max, max_results, timeout):
+        """串流讀取 API 的結果 (達到 max_results 就停)；讀完整個區間時順便補進 Mirror"""
+        events = []
+        pages = self.iter_event_pages(time_min, time_max, timeout=timeout)
+        try:
+            async for page in pages:
+                events.extend(page)
+                if max_results and len(events) >= max_results:
+                    return events
+        finally:
+            await pages.aclose()
+        _hydrate_mirror(self.mirror, events, *_normalize_time_range(time_min, time_max))
+        return events
+
+    async def find_events(self, time_min, keyword="", limit=5, timeout=None):
+        """找出 time_min 附近最符合 keyword 的行程，邏輯同 GCalService.find_events"""
+        anchor, window_min, window_max = _search_window(time_min)
+        if self.mirror is not None:
+            try:
+                if await self._mirror_covers(window_min, window_max, timeout=timeout):
+                    events = self.mirror.search(keyword, anchor, window_min, window_max, limit)
+                    return {"success": True, "events": events}
+            except Exception as e:
+                logger.warning("⚠️ Calendar mirror unavailable, querying API: %s", e)
+
+        listed = await self.list_events(window_min, window_max, timeout=timeout)
+        if not listed["success"]:
+            return listed
+        events = _rank_listed_events(listed["events"], keyword, anchor, limit)
+        return {"success": True, "events": events}
+
+    async def delete_event(self, event_id, timeout=None):
+        """刪除行程"""
+        try:
+            await self._request(
+                "DELETE",
+                f"{self._events_url}/{quote(event_id, safe='')}",
+                timeout=timeout,
+            )
+            _apply_to_mirror(self.mirror, "delete", event_id, None)
+            return {"success": True}
+        except (GCalAPIError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            logger.error("GCal Delete Error: %s", error)
+            return {"success": False, "message": str(error) or "timeout"}
+
+    async def patch_event(self, event_id, patch_body, timeout=None):
+        """部分更新行程 (events.patch)：只覆寫 patch_body 內的欄位，保留 ID、參與者與描述"""
+        try:
+            patched_event = await self._request(
+                "PATCH",
+                f"{self._events_url}/{quote(event_id, safe='')}",
+                json_body=patch_body,
+                timeout=timeout,
+            )
+            _apply_to_mirror(self.mirror, "patch", event_id, patched_event)
+            return {"success": True, "event": patched_event}
+        except (GCalAPIError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            logger.error("GCal Patch Error: %s", error)
+            return {"success": False, "message": str(error) or "timeout"}
+
+    async def batch_mutate(self, mutations, timeout=None):
+        """
+        以 Calendar batch endpoint 一次送出多筆新增/刪除/部分更新 (每 50 筆一個 batch，各 batch 並行)。
+        mutations: [("create", event_data) | ("delete", event_id) | ("patch", (event_id, patch_body)), ...]
+        回傳: 與 mutations 同順序的結果 list，格式同 create_event / delete_event
+        拋出: ValueError / KeyError (mutation 內容有誤，只會在送出之前)；送出之後的任何錯誤都轉成該筆的失敗結果，
+              呼叫端不可再逐筆重送 (Google 可能已經執行過)
+        """
+        events_path = f"/calendar/v3/calendars/{quote(self.calendar_id or '', safe='')}/events"
+
+        parts = []
+        for kind, payload in mutations:
+            if kind == "create":
+                parts.append(("POST", events_path, _build_event_body(payload)))
+            elif kind == "delete":
+                parts.append(("DELETE", f"{events_path}/{quote(payload, safe='')}", None))
+            elif kind == "patch":
+                event_id, patch_body = payload
+                parts.append(("PATCH", f"{events_path}/{quote(event_id, safe='')}", patch_body))
+            else:
+                raise ValueError(f"Unknown mutation: {kind}")
+
+        chunks = [
+            list(range(start, min(start + MAX_BATCH_SIZE, len(parts))))
+            for start in range(0, len(parts), MAX_BATCH_SIZE)
+        ]
+        chunk_results = await asyncio.gather(
+            *(self._send_batch([parts[i] for i in chunk], timeout) for chunk in chunks),
+            return_exceptions=True,
+        )
+
+        results = [None] * len(mutations)
+        for chunk, responses in zip(chunks, chunk_results):
+            for pos, idx in enumerate(chunk):
+                kind = mutations[idx][0]
+                if isinstance(responses, BaseException):
+                    logger.error("GCal Batch Error: %s", responses)
+                    results[idx] = {"success": False, "message": str(responses) or "timeout"}
+                    continue
+
+                status, body_text = responses[pos]
+                if 200 <= status < 300:
+                    try:
+                        body = json.loads(body_text) if body_text else {}
+                    except ValueError as e:
+                        logger.error("GCal Batch Item Error (%s): unreadable response: %s", kind, e)
+                        results[idx] = {"success": False, "message": "無法解析 Calendar 回應"}
+                        if self.mirror is not None:
+                            self.mirror.invalidate()
+                        continue
+                    results[idx] = _mutation_result(kind, body)
+                    try:
+                        _apply_to_mirror(self.mirror, kind, mutations[idx][1], body)
+                    except Exception as e:
+                        # 寫入已經成功，只是本地 Mirror 沒跟上：下次查詢前重新同步
+                        logger.warning("⚠️ Failed to apply batch result to mirror: %s", e)
+                        self.mirror.invalidate()
+                else:
+                    logger.error("GCal Batch Item Error (%s): %s %s", kind, status, body_text)
+                    results[idx] = {
+                        "success": False,
+                        "message": str(GCalAPIError(status, body_text)),
+                    }
+        return results
+
+    async def _send_batch(self, parts, timeout=None):
+        """送出單一 batch request，回傳 [(status, body_text), ...]"""
+        boundary = f"batch_{uuid.uuid4().hex}"
+        session = self._get_session()
+        headers = {
+            "Authorization": f"Bearer {await self._get_token()}",
+            "Content-Type": f"multipart/mixed; boundary={boundary}",
+        }
+
+        async with session.post(
+            BATCH_ENDPOINT,
+            data=_encode_batch_body(parts, boundary),
+            headers=headers,
+            **_timeout_kwargs(timeout),
+        ) as resp:
+            text = await resp.text()
+            if resp.status >= 400:
+                raise GCalAPIError(resp.status, text)
+            content_type = resp.headers.get("Content-Type", "")
+            resp_boundary = content_type.split("boundary=", 1)[-1].split(";")[0].strip('"')
+            return _decode_batch_response(text, resp_boundary, len(parts))
+
+    async def awarmup(self, timeout=None):
+        """
+        [Warm-up] 建立連線池與 OAuth token。
+        有 Mirror 時順便完成同步 (第一次為 full sync)，否則只讀取日曆的 id。
+        """
+        if self.mirror is not None:
+            if self.mirror.is_stale():
+                await self.sync_mirror(timeout=timeout)
+            return
+        await self._request(
+            "GET",
+            f"{self.BASE_URL}/calendars/{quote(self.calendar_id or '', safe='')}",
+            params={"fields": "id"},
+            timeout=timeout,
+        )
+
+    async def aclose(self):
+        """關閉連線池 (給腳本或測試結束時使用)"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,310 @@
+import re
+import json
+import math
+import logging
+from dataclasses import dataclass
+
+from src.config import (
+    INTENT_LOCAL_THRESHOLD,
+    INTENT_CENTROIDS_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# 每處理幾則訊息輸出一次命中率
+STATS_LOG_EVERY = 50
+# centroid 判斷時，第一名與第二名的相似度至少要差這麼多
+CENTROID_MIN_MARGIN = 0.05
+
+_TIME_WORDS = (
+    r"(今天|今晚|明天|明早|明晚|後天|大後天|早上|中午|下午|晚上"
+    r"|(這|下|下下)?(週|周|禮拜|星期)[一二三四五六日天]"
+    r"|\d{1,2}\s*/\s*\d{1,2}|\d{1,2}\s*月\s*\d{1,2}\s*[日號])"
+)
+_CLOCK = r"(\d{1,2}\s*[:：]\s*\d{2}|[\d一二三四五六七八九十兩]{1,3}\s*點半?)"
+_EVENT_WORDS = (
+    r"(開會|會議|行程|約會?|提醒|看診|看醫生|看牙醫|面試|聚餐|上課|出差|會面|健檢|家長會"
+    r"|meeting|1\s*[:：]\s*1|1\s*on\s*1)"
+)
+# 查詢用的期間「這週行程」「本月花費」
+_PERIOD = (
+    r"(今天|今日|昨天|明天|後天|(這|本|上|下)(週|周)末?|(這|上|下)(禮拜|星期)|週末"
+    r"|(這|上|下)個月|本月|今年)"
+)
+_CURRENCY_AMOUNT = r"(\$\s*\d+(\.\d+)?|\d+(\.\d+)?\s*(元|塊錢?|圓|nt|twd))"
+# 「牛肉麵 180」這種沒有單位的記帳，品項需以這些字結尾 (餐點、交通、帳單等)
+_EXPENSE_ITEM_SUFFIX = (
+    r"(餐|飯|麵|粥|飲料?|咖啡|茶|奶|湯|菜|肉|果|蛋糕|便當|點心|零食|宵夜|麵包|(計程|停|洗|修|租)車|票|油|費|租|稅|衣|褲|鞋|包)"
+)
+# 「他花了 3000」是別人的消費，不記帳
+_OTHER_PEOPLE = r"(他|她|隔壁|老闆|朋友|同事|別人|人家|大家|老婆|老公|爸|媽|室友|同學)"
+# 中文數字金額需要單位「八十塊」「一千二百元」
+_CHINESE_AMOUNT = r"[一二三四五六七八九十百千萬兩]+\s*(元|塊錢?)"
+_POLITE = r"(幫我|請|麻煩)?"
+# 排程動詞與時間 / 事件之間允許的量詞「新增一個行程」「排一下明天」
+_VERB_FILLER = r"(一下|一個|個)?\s*"
+# 問句 (「安排旅遊行程有什麼建議」) 不是指令
+_QUESTION = r"(嗎|什麼|怎麼|如何|建議|[?？])"
+
+# (name, intent, confidence, pattern)：命中即給出該 intent 與信心分數。
+# 所有 pattern 都錨定在句首 (與句尾)，只接受「指令形式」的訊息；敘述句 (「今天早上開會的結論是…」) 交給 Router LLM。
+# confidence 為 src/scripts/intent_heldout.jsonl 上各規則的 Laplace 平滑準確率 ((正確 + 1) / (命中 + 2))，
+# 由 `python -m src.scripts.intent_eval --calibrate` 產生。每條規則在 held-out 集上至少要有 ~20 次命中，
+# Laplace 下限才接近實際準確率 (命中 8 次全對也只有 0.9)；新增規則時請一併補足 held-out 樣本。
+RULES = [
+    # 記帳：「午餐 120元」「咖啡 $65」(需要貨幣符號 / 單位)
+    (
+        "expense_currency",
+        "EXPENSE",
+        0.967,
+        re.compile(r"^(?P<item>[^\d$]{1,16}?)\s*" + _CURRENCY_AMOUNT + r"$", re.I),
+    ),
+    # 記帳：「牛肉麵 180」(只有中文品項 + 數字，沒有貨幣單位)
+    # 品項必須以常見的消費類別字結尾，否則「體重 65」「車號 5566」這類量測值 / 編號也會命中；
+    # 品項至少兩個字、金額至少兩位數，且「車」只接受計程車 / 停車這類付費用語 (「車 5566」「公車 307」是車牌 / 路線)
+    (
+        "expense_bare",
+        "EXPENSE",
+        0.971,
+        re.compile(r"^(?P<item>(?=[\u4e00-\u9fff]{2})[\u4e00-\u9fff]{0,9}" + _EXPENSE_ITEM_SUFFIX + r")\s*\d{2,}$"),
+    ),
+    # 記帳：消費動詞 +金額「剛剛花了 3000 修車」「記一筆 電費 1350」
+    (
+        "expense_verb",
+        "EXPENSE",
+        0.9,
+        re.compile(
+            r"^(?!.{0,8}" + _OTHER_PEOPLE + r")(今天|昨天|剛剛|剛才|幫我)?\s*(記帳|記一筆|記一下|.{0,8}(花了|花費|付了|買了)).{0,12}?"
+            r"(\d+|" + _CHINESE_AMOUNT + ")"
+        ),
+    ),
+    # 記帳：查詢「本月花費」「這週總共花了多少錢」
+    (
+        "expense_query",
+        "EXPENSE",
+        0.966,
+        re.compile(
+            r"^(查|看|算)?(一下)?" + _PERIOD + r"(的)?(總共|一共)?"
+            r"((花費|支出|開銷|消費|開支|帳)(是|有)?(多少|統計|明細)?|花了?多少錢?)[?？]?$"
+        ),
+    ),
+    # 行程：排程動詞「幫我排明天下午三點的會議」「提醒我明天早上八點吃藥」「新增一個行程 週六爬山」
+    # 動詞後面必須緊接時間或事件名詞，否則「加油站明天幾點開」「新增的功能明天上線了」也會命中；
+    # 單字動詞 (排 / 加 / 約) 常是其他詞的開頭 (排骨、加班、約會)，時間之後還要有事件名詞。問句交給 Router LLM
+    (
+        "calendar_verb",
+        "CALENDAR",
+        0.963,
+        re.compile(
+            r"^(?!.*" + _QUESTION + r")" + _POLITE + r"("
+            r"提醒我" + _VERB_FILLER + _TIME_WORDS
+            + r"|(安排|預約|新增|建立)" + _VERB_FILLER + _TIME_WORDS + r".{0,16}(" + _CLOCK + "|" + _EVENT_WORDS + ")"
+            + r"|(排|加|約)" + _VERB_FILLER + _TIME_WORDS + r".{0,16}" + _EVENT_WORDS
+            + r"|(安排|預約|新增|建立|排|加|約)" + _VERB_FILLER + r"(跟[^，,。]{1,10}的\s*)?" + _EVENT_WORDS
+            + ")",
+            re.I,
+        ),
+    ),
+    # 行程：重複行程「每週二晚上七點上課」
+    (
+        "calendar_recurring",
+        "CALENDAR",
+        0.929,
+        re.compile(r"^每(天|週|周|個月|月|(週|周|禮拜|星期)[一二三四五六日天]).{0,12}(" + _CLOCK + "|" + _EVENT_WORDS + ")"),
+    ),
+    # 行程：整句只有「時間 + 事件」「明天下午三點開會」
+    (
+        "calendar_time_event",
+        "CALENDAR",
+        0.968,
+        re.compile(r"^" + _TIME_WORDS + r".{0,12}" + _EVENT_WORDS + r"[。!！]?$", re.I),
+    ),
+    # 行程：查詢「明天有什麼行程」「查一下這週的行程」
+    (
+        "calendar_query",
+        "CALENDAR",
+        0.963,
+        re.compile(
+            r"^我?.{0,6}(查一下|查|看一下|列出|有什麼|有哪些).{0,8}(行程|會議|行事曆|日曆)[嗎呢]?[?？]?$"
+        ),
+    ),
+    # 行程：只有期間 + 行程「這週行程」「明天的安排呢」
+    (
+        "calendar_period",
+        "CALENDAR",
+        0.972,
+        re.compile(
+            r"^(查|看|列出)?(一下)?" + _PERIOD + r"(的)?(行程|會議|安排|行事曆)(有哪些|有什麼|呢)?[?？]?$"
+        ),
+    ),
+    # 行程：取消 / 改期「取消明天的會議」「把週五的面試改到下週一」
+    (
+        "calendar_cancel",
+        "CALENDAR",
+        0.962,
+        re.compile(r"^" + _POLITE + r"(取消|刪除|刪掉).{0,12}" + _EVENT_WORDS + r"[。!！]?$", re.I),
+    ),
+    (
+        "calendar_move",
+        "CALENDAR",
+        0.962,
+        re.compile(
+            r"^" + _POLITE + r"把?.{0,12}" + _EVENT_WORDS + r".{0,2}(改到|延到|挪到|移到|提前到|往後延|往前移)",
+            re.I,
+        ),
+    ),
+    # 打招呼 / 簡短回應
+    (
+        "chat_greeting",
+        "CHAT",
+        0.958,
+        re.compile(
+            r"^(hi|hello|hey|嗨|哈囉|你好|早安|午安|晚安|謝謝|感謝|掰掰|bye|ok|好的?|收到)[\s!！~。.？?]*$",
+            re.I,
+        ),
+    ),
+]
+
+# 含有這些字時，規則命中的 intent 仍然採用，但 needs_memory = True (記憶另外寫入)
+MEMORY_CUES = re.compile(
+    r"(記住|記得|備忘|筆記|我喜歡|我不喜歡|我討厭|生日|紀念日|過敏|原因是|解法|root cause|workaround)",
+    re.I,
+)
+# 「午餐 120」的 item 不可以只是時間 / 日期詞 (例如「明天 3」「三月 15」)
+_TIME_ONLY = re.compile(r"^(" + _TIME_WORDS + r"|[一二三四五六七八九十]{1,2}\s*月|第)\s*$")
+
+
+@dataclass
+class IntentDecision:
+    intent: str
+    needs_memory: bool
+    confidence: float
+    source: str  # "rule" | "centroid"
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class LocalIntentClassifier:
+    """
+    Router LLM 前的本地意圖分類 (快速路徑)。
+
+    1. 關鍵字 / Regex 規則：明顯的記帳、行程、打招呼，在微秒內回答。
+    2. (可選) Nearest-centroid：用 handle_message 本來就會算的 embedding 比對各 intent 的中心點。
+    信心不足 (低於 threshold、規則互相衝突、或可能需要記憶) 時回傳 None，交給 Router LLM。
+    """
+
+    def __init__(
+        self,
+        threshold: float = INTENT_LOCAL_THRESHOLD,
+        centroids_path: str = INTENT_CENTROIDS_PATH,
+    ):
+        self.threshold = threshold
+        self.centroids: dict[str, list[float]] = {}
+        self.centroid_min_similarity = 0.0
+        self.stats = {"rule": 0, "centroid": 0, "fallback": 0}
+
+        if centroids_path:
+            self.load_centroids(centroids_path)
+
+    @property
+    def has_centroids(self) -> bool:
+        return bool(self.centroids)
+
+    def load_centroids(self, path: str):
+        """讀取 intent_eval.py 產生的 centroid 檔 ({"min_similarity", "centroids": {intent: vector}})"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("⚠️ Intent centroids unavailable (%s): %s", path, e)
+            return
+        self.centroids = data.get("centroids", {})
+        self.centroid_min_similarity = data.get("min_similarity", 0.0)
+        logger.info("✅ Loaded %d intent centroids from %s", len(self.centroids), path)
+
+    # ---------- 分類 ----------
+
+    def classify_text(self, text: str) -> IntentDecision | None:
+        """只用規則分類；沒有把握時回傳 None"""
+        text = text.strip()
+        if not text:
+            return None
+
+        scores: dict[str, float] = {}
+        for _, intent, confidence in self.matching_rules(text):
+            scores[intent] = max(scores.get(intent, 0.0), confidence)
+
+        if len(scores) != 1:
+            # 沒有命中，或同時命中多個 intent (例如「明晚聚餐花了 2000」)
+            return None
+        intent, confidence = next(iter(scores.items()))
+        if confidence < self.threshold:
+            return None
+        return IntentDecision(intent, bool(MEMORY_CUES.search(text)), confidence, "rule")
+
+    @staticmethod
+    def matching_rules(text: str) -> list[tuple[str, str, float]]:
+        """回傳命中的規則 [(name, intent, confidence)] (不論門檻)"""
+        hits = []
+        for name, intent, confidence, pattern in RULES:
+            match = pattern.search(text)
+            if not match:
+                continue
+            if "item" in pattern.groupindex:
+                item = match.group("item").strip()
+                # 「記住我每個月房租 18000」是要記住的事，不是一筆消費
+                if _TIME_ONLY.match(item) or MEMORY_CUES.search(item):
+                    continue
+            hits.append((name, intent, confidence))
+        return hits
+
+    def guess(self, text: str) -> str | None:
+        """
+        不論門檻的最佳猜測 (給 speculative parsing 用)：回傳命中規則中信心最高的 intent，沒有命中時回傳 None。
+        """
+        hits = self.matching_rules(text.strip())
+        return max(hits, key=lambda hit: hit[2])[1] if hits else None
+
+    def classify_embedding(self, embedding: list[float], text: str = "") -> IntentDecision | None:
+        """
+        Nearest-centroid 分類。
+        只對 CALENDAR / EXPENSE 做決定：CHAT 是否需要記憶仍需 LLM 判斷。
+        text: 原始訊息，含 MEMORY_CUES 時 needs_memory = True
+        """
+        if not self.centroids or not embedding:
+            return None
+        # centroid 以不同維度 (EMBEDDING_DIMENSIONALITY) 建立時無法比較，需重新執行 --build-centroids
+        if any(len(vector) != len(embedding) for vector in self.centroids.values()):
+            return None
+
+        ranked = sorted(
+            ((_cosine(embedding, vector), intent) for intent, vector in self.centroids.items()),
+            reverse=True,
+        )
+        best_sim, intent = ranked[0]
+        margin = best_sim - ranked[1][0] if len(ranked) > 1 else best_sim
+        if intent == "CHAT" or best_sim < self.centroid_min_similarity or margin < CENTROID_MIN_MARGIN:
+            return None
+        return IntentDecision(intent, bool(MEMORY_CUES.search(text)), best_sim, "centroid")
+
+    # ---------- 統計 ----------
+
+    def record(self, source: str):
+        """記錄本次由哪一層決定 (rule / centroid / fallback)，並定期輸出命中率"""
+        self.stats[source] = self.stats.get(source, 0) + 1
+        total = sum(self.stats.values())
+        if total % STATS_LOG_EVERY == 0:
+            logger.info("📊 Local intent stats: %s", self.hit_rate())
+
+    def hit_rate(self) -> dict:
+        total = sum(self.stats.values())
+        local = self.stats["rule"] + self.stats["centroid"]
+        return {
+            **self.stats,
+            "total": total,
+            "hit_rate": round(local / total, 3) if total else 0.0,
+        }
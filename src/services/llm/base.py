@@ -1,9 +1,130 @@
 import json
+import time
+import random
+import asyncio
 import logging
+import contextvars
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from src.services.llm.json_stream import JsonArrayStreamParser, strip_code_fence
+from src.config import (
+    LLM_CALL_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS,
+)
 
 logger = logging.getLogger(__name__)
 
+# 視為暫時性錯誤、可以重試的 HTTP status (529 = Anthropic overloaded)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504, 529}
+
+
+# ========================================================
+# Deadline：整個 Request 的剩餘時間預算
+# ========================================================
+# 絕對期限 (time.monotonic())；None 代表沒有預算限制
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "llm_deadline", default=None
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Request 的時間預算已經用完"""
+
+
+@contextmanager
+def request_deadline(budget_seconds: float):
+    """
+    設定 with 區塊 (含其中建立的 asyncio Task) 的時間預算。
+    巢狀使用時取較早的期限。
+    """
+    deadline = time.monotonic() + budget_seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> float | None:
+    """剩餘秒數；沒有設定預算時回傳 None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# ========================================================
+# Circuit Breaker：每個供應商一個
+# ========================================================
+class CircuitOpenError(RuntimeError):
+    """供應商目前被斷路，直接失敗 (HedgedProvider 會立刻改用備援供應商)"""
+
+
+class CircuitBreaker:
+    """
+    連續 failure_threshold 次暫時性失敗就進入 open (所有呼叫直接失敗)，
+    reset_timeout 秒後進入 half-open，只放行一個試探呼叫：成功就恢復，失敗就再次 open。
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probe_in_flight):
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        if state == "half_open":
+            self._probe_in_flight = True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("✅ Circuit %s closed", self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("🔌 Circuit %s opened after %d failures", self.name, self.failures)
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """呼叫以非暫時性錯誤結束 (例如 400)：不影響斷路狀態，但要釋放試探名額"""
+        self._probe_in_flight = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(vendor: str) -> CircuitBreaker:
+    """同一供應商 (router / agent 等各 role) 共用一個 Circuit Breaker"""
+    breaker = _breakers.get(vendor)
+    if breaker is None:
+        breaker = CircuitBreaker(vendor, LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+        _breakers[vendor] = breaker
+    return breaker
+
 
 class LLMProvider(ABC):
     """
@@ -13,22 +134,122 @@ class LLMProvider(ABC):
     """
 
     @abstractmethod
-    async def agenerate(self, prompt: str) -> str:
+    async def agenerate(self, prompt: str, system_prefix: str | None = None) -> str:
         """
         傳入 prompt，非同步回傳純文字 response。
         子類別必須實作此方法。
+
+        system_prefix: 固定不變的指示 (Prompt 檔內容)，與每次不同的 prompt (使用者輸入等) 分開傳入，
+                       讓供應商可以快取這段前綴 (Claude prompt caching / Gemini cached content)。
         """
         pass
 
-    async def aparse_json_response(self, prompt: str):
+    async def _resilient_call(self, vendor: str, make_call, is_retryable):
+        """
+        [共用工具] 以 deadline、重試 (full jitter backoff) 與 circuit breaker 包裝一次 SDK 呼叫。
+
+        Args:
+            vendor: 供應商名稱 (決定使用哪個 Circuit Breaker)
+            make_call: 無參數、回傳 coroutine 的函式 (每次重試都會重新呼叫)
+            is_retryable: 判斷例外是否為暫時性錯誤 (429 / 5xx / 連線問題)
+        拋出: DeadlineExceeded、CircuitOpenError 或 SDK 的原始例外
+        """
+        breaker = get_breaker(vendor)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            breaker.before_call()
+            timeout = LLM_CALL_TIMEOUT
+            budget = remaining_budget()
+            budget_limited = False
+            if budget is not None:
+                if budget <= 0:
+                    breaker.release()
+                    raise DeadlineExceeded(f"{vendor}: request budget exhausted")
+                budget_limited = budget < timeout
+                timeout = min(timeout, budget)
+
+            try:
+                result = await asyncio.wait_for(make_call(), timeout)
+            except asyncio.TimeoutError as e:
+                if budget_limited:
+                    # 超時的是我們自己的剩餘預算，不是供應商的問題：不計入斷路，也不再重試
+                    breaker.release()
+                    raise DeadlineExceeded(f"{vendor}: request budget exhausted") from e
+                breaker.record_failure()
+                if not await self._backoff(vendor, attempt, e):
+                    raise
+                continue
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                if not await self._backoff(vendor, attempt, e):
+                    raise
+                continue
+            except BaseException:
+                # 被取消 (hedge 落敗、speculation / TaskGraph 分支取消)：釋放 half-open 的試探名額
+                breaker.release()
+                raise
+
+            breaker.record_success()
+            return result
+
+    @staticmethod
+    async def _backoff(vendor: str, attempt: int, error: Exception) -> bool:
+        """暫時性錯誤後等待 full jitter backoff；回傳 False 代表不再重試 (次數或預算用完)"""
+        delay = random.uniform(0, LLM_RETRY_BASE_DELAY * 2**attempt)
+        budget = remaining_budget()
+        if attempt == LLM_MAX_RETRIES or (budget is not None and budget <= delay):
+            return False
+        logger.warning(
+            "⚠️ %s call failed (%s), retry %d in %.2fs",
+            vendor,
+            type(error).__name__,
+            attempt + 1,
+            delay,
+        )
+        await asyncio.sleep(delay)
+        return True
+
+    async def awarmup(self) -> None:
+        """
+        [Warm-up] 送出一個不產生內容的已驗證請求 (例如查詢模型資訊)，預先建立連線。
+        預設不做事；子類別可覆寫。
+        """
+        return None
+
+    async def aparse_json_response(
+        self, prompt: str, schema: dict | None = None, system_prefix: str | None = None
+    ):
         """
         [共用工具] 呼叫 agenerate() 並自動清洗、解析 JSON。
         統一處理 LLM 常見的 ```json ... ``` 包裝格式。
+        schema: 預期的輸出結構 (見 schemas.py)。基底實作不驗證；CascadeProvider 用它決定是否升級模型。
 
         回傳: dict 或 list (依 LLM 回傳的 JSON 結構而定)
         拋出: Exception (若解析失敗，由呼叫方處理)
         """
-        raw_text = await self.agenerate(prompt)
+        raw_text = await self.agenerate(prompt, system_prefix=system_prefix)
         # 清洗 LLM 常見的 Markdown code block 包裝
-        clean_text = raw_text.replace("```json", "").replace("```", "").strip()
-        return json.loads(clean_text)
+        return json.loads(strip_code_fence(raw_text))
+
+    async def astream(self, prompt: str, system_prefix: str | None = None, schema: dict | None = None):
+        """
+        串流回傳文字片段 (async generator)。
+        預設 (不支援串流的 Provider，例如 Cascade / Hedged)：一次回傳 agenerate() 的完整結果。
+        """
+        yield await self.agenerate(prompt, system_prefix=system_prefix)
+
+    async def astream_json_items(
+        self, prompt: str, schema: dict | None = None, system_prefix: str | None = None
+    ):
+        """
+        [共用工具] 串流解析 JSON 陣列：每個元素一生成完整就 yield (見 JsonArrayStreamParser)。
+        模型只回傳單一物件時，在串流結束後 yield 該物件。
+        """
+        parser = JsonArrayStreamParser()
+        async for chunk in self.astream(prompt, system_prefix=system_prefix, schema=schema):
+            for item in parser.feed(chunk):
+                yield item
+        for item in parser.close():
+            yield item
@@ -0,0 +1,70 @@
+import logging
+
+from src.services.llm.base import LLMProvider
+from src.services.llm.schemas import validate
+
+logger = logging.getLogger(__name__)
+
+# 每幾次結構化呼叫輸出一次升級率
+STATS_LOG_EVERY = 20
+
+
+class CascadeProvider(LLMProvider):
+    """
+    Model Cascade：先用便宜、快速的模型 (router 等級)，輸出不符合 schema 才升級到較強的模型 (agent 等級)。
+
+    只有帶 schema 的 aparse_json_response() 會走 cascade；agenerate() (自由文字) 直接使用強模型。
+    name 用來區分各 Agent 的升級率 (例如 "calendar")。
+    """
+
+    def __init__(self, fast: LLMProvider, strong: LLMProvider, name: str = "agent"):
+        self.fast = fast
+        self.strong = strong
+        self.name = name
+        self.stats = {"calls": 0, "escalations": 0}
+
+    async def agenerate(self, prompt: str, system_prefix: str | None = None) -> str:
+        return await self.strong.agenerate(prompt, system_prefix=system_prefix)
+
+    async def awarmup(self) -> None:
+        await self.fast.awarmup()
+        await self.strong.awarmup()
+
+    async def aparse_json_response(
+        self, prompt: str, schema: dict | None = None, system_prefix: str | None = None
+    ):
+        if schema is None:
+            return await self.strong.aparse_json_response(prompt, system_prefix=system_prefix)
+
+        self.stats["calls"] += 1
+        try:
+            data = await self.fast.aparse_json_response(
+                prompt, schema=schema, system_prefix=system_prefix
+            )
+            errors = validate(data, schema)
+            reason = "; ".join(errors[:3])
+        except Exception as e:
+            # JSON 解析失敗或便宜模型呼叫失敗，同樣升級
+            data, reason = None, f"{type(e).__name__}: {e}"
+
+        if not reason:
+            self._maybe_log()
+            return data
+
+        self.stats["escalations"] += 1
+        self._maybe_log()
+        logger.info("⤴️ Cascade[%s] escalating to strong model: %s", self.name, reason)
+        return await self.strong.aparse_json_response(
+            prompt, schema=schema, system_prefix=system_prefix
+        )
+
+    def escalation_rate(self) -> dict:
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "escalation_rate": round(self.stats["escalations"] / calls, 3) if calls else 0.0,
+        }
+
+    def _maybe_log(self):
+        if self.stats["calls"] % STATS_LOG_EVERY == 0:
+            logger.info("📊 Cascade[%s] stats: %s", self.name, self.escalation_rate())
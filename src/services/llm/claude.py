@@ -1,13 +1,40 @@
-import os
 import logging
 import anthropic
 
-from src.services.llm.base import LLMProvider
+from src.services.llm.base import LLMProvider, RETRYABLE_STATUS
+from src.services.llm.clients import get_anthropic_client
+from src.services.llm.usage import begin_call, record_usage
 
 logger = logging.getLogger(__name__)
 
+
+def _is_retryable(exc: Exception) -> bool:
+    """429 / 5xx / 529 (overloaded) 與連線錯誤可以重試"""
+    if isinstance(exc, anthropic.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS
+    return isinstance(exc, anthropic.APIConnectionError)
+
+
 # Claude 的預設 max_tokens (必填，不像 Gemini 有預設值)
 DEFAULT_MAX_TOKENS = 8192
+# structured output 用的工具名稱 (tool-use)
+STRUCTURED_OUTPUT_TOOL = "respond"
+
+
+def _input_tokens(usage) -> int:
+    """input token 總數 (含讀取 / 寫入 prompt cache 的部分)"""
+    return (
+        usage.input_tokens
+        + (usage.cache_read_input_tokens or 0)
+        + (usage.cache_creation_input_tokens or 0)
+    )
+
+
+def _begin_call(kwargs: dict) -> int:
+    """以 messages + system 的長度登記這次呼叫的估計輸入 token (見 usage.begin_call)"""
+    texts = [message["content"] for message in kwargs["messages"]]
+    texts.extend(block["text"] for block in kwargs.get("system", ()))
+    return begin_call(*texts)
 
 
 class ClaudeProvider(LLMProvider):
@@ -19,26 +46,114 @@ class ClaudeProvider(LLMProvider):
         ANTHROPIC_API_KEY=your_api_key
     """
 
-    def __init__(self, model_name: str, max_tokens: int = DEFAULT_MAX_TOKENS):
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("❌ ANTHROPIC_API_KEY is not set in environment variables.")
-
-        self.client = anthropic.AsyncAnthropic(api_key=api_key)
+    def __init__(
+        self,
+        model_name: str,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        temperature: float | None = None,
+        client=None,
+    ):
+        # 預設使用所有 role 共用的 client (同一個連線池)
+        self.client = client or get_anthropic_client()
         self.model_name = model_name
         self.max_tokens = max_tokens
+        self.temperature = temperature
         logger.info("✅ ClaudeProvider initialized with model: %s", model_name)
 
-    async def agenerate(self, prompt: str) -> str:
+    def _request_kwargs(self, prompt: str, system_prefix: str | None) -> dict:
         """
-        呼叫 Claude Messages API，非同步回傳純文字回應。
-        將完整的 prompt 作為單一 user message 傳入。
+        prompt 作為 user message 傳入；system_prefix 放在 system 並標記 cache_control，
+        之後相同前綴的呼叫會直接讀取快取 (降低 TTFT 與 input token 成本)。
         """
-        message = await self.client.messages.create(
-            model=self.model_name,
-            max_tokens=self.max_tokens,
-            messages=[
+        kwargs = {
+            "model": self.model_name,
+            "max_tokens": self.max_tokens,
+            "messages": [
                 {"role": "user", "content": prompt},
             ],
+        }
+        if self.temperature is not None:
+            kwargs["temperature"] = self.temperature
+        if system_prefix:
+            kwargs["system"] = [
+                {"type": "text", "text": system_prefix, "cache_control": {"type": "ephemeral"}}
+            ]
+        return kwargs
+
+    async def _create(self, **kwargs):
+        pending = _begin_call(kwargs)
+        message = await self._resilient_call(
+            "claude", lambda: self.client.messages.create(**kwargs), _is_retryable
         )
+        usage = message.usage
+        if usage.cache_read_input_tokens or usage.cache_creation_input_tokens:
+            logger.debug(
+                "Claude prompt cache: read=%s, created=%s",
+                usage.cache_read_input_tokens,
+                usage.cache_creation_input_tokens,
+            )
+        record_usage(_input_tokens(usage), usage.output_tokens, pending=pending)
+        return message
+
+    async def agenerate(self, prompt: str, system_prefix: str | None = None) -> str:
+        """呼叫 Claude Messages API，非同步回傳純文字回應。"""
+        message = await self._create(**self._request_kwargs(prompt, system_prefix))
         return message.content[0].text
+
+    async def aparse_json_response(
+        self, prompt: str, schema: dict | None = None, system_prefix: str | None = None
+    ):
+        """
+        有 schema 時以 tool-use 取得結構化輸出 (強制呼叫唯一的工具，input 即為結果)。
+        Tool 的 input_schema 必須是 object，非 object 的 schema 包在 {"result": ...} 裡再取出。
+        """
+        if schema is None:
+            return await super().aparse_json_response(prompt, system_prefix=system_prefix)
+
+        wrapped = schema.get("type") != "object"
+        input_schema = (
+            {"type": "object", "properties": {"result": schema}, "required": ["result"]}
+            if wrapped
+            else schema
+        )
+        kwargs = self._request_kwargs(prompt, system_prefix)
+        kwargs["tools"] = [
+            {
+                "name": STRUCTURED_OUTPUT_TOOL,
+                "description": "Return the result in the required structure.",
+                "input_schema": input_schema,
+            }
+        ]
+        kwargs["tool_choice"] = {"type": "tool", "name": STRUCTURED_OUTPUT_TOOL}
+
+        message = await self._create(**kwargs)
+        block = next((b for b in message.content if b.type == "tool_use"), None)
+        if block is None:
+            raise ValueError("Claude did not return structured output")
+        return block.input["result"] if wrapped else block.input
+
+    async def astream(self, prompt: str, system_prefix: str | None = None, schema: dict | None = None):
+        """
+        串流回傳文字片段 (文字模式；tool-use 不適合逐段輸出，格式由 Prompt 規範)。
+        重試只涵蓋建立串流，串流中斷時直接拋出例外。
+        """
+        kwargs = self._request_kwargs(prompt, system_prefix)
+        pending = _begin_call(kwargs)
+        stream = await self._resilient_call(
+            "claude",
+            lambda: self.client.messages.create(stream=True, **kwargs),
+            _is_retryable,
+        )
+        input_tokens = output_tokens = 0
+        async for event in stream:
+            if event.type == "message_start":
+                input_tokens = _input_tokens(event.message.usage)
+            elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                yield event.delta.text
+            elif event.type == "message_delta":
+                output_tokens = event.usage.output_tokens
+        record_usage(input_tokens, output_tokens, pending=pending)
+
+    async def awarmup(self) -> None:
+        """查詢模型資訊 (不消耗 token)，預先建立 TLS 連線"""
+        await self.client.models.retrieve(self.model_name)
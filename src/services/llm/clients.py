@@ -0,0 +1,82 @@
+import os
+import logging
+
+import httpx
+
+from src.config import (
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE,
+    LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HTTP2,
+)
+
+logger = logging.getLogger(__name__)
+
+# 每個供應商只建立一個 SDK client，讓 router / agent / chat / memory / embedding 共用同一個連線池
+_gemini_client = None
+_anthropic_client = None
+
+
+def get_gemini_client():
+    """
+    取得共用的 genai.Client。
+    明確傳入 httpx client，讓 sync / async 呼叫都使用可調整的連線池 (大小、keep-alive、HTTP/2)。
+    """
+    global _gemini_client
+    if _gemini_client is None:
+        from google import genai
+        from google.genai import types
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("❌ GEMINI_API_KEY is not set in environment variables.")
+
+        limits = httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+        _gemini_client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                httpx_client=httpx.Client(limits=limits, http2=LLM_HTTP2),
+                httpx_async_client=httpx.AsyncClient(limits=limits, http2=LLM_HTTP2),
+            ),
+        )
+        logger.info(
+            "✅ Shared Gemini client created (max_connections=%d, http2=%s)",
+            LLM_HTTP_MAX_CONNECTIONS,
+            LLM_HTTP2,
+        )
+    return _gemini_client
+
+
+def get_anthropic_client():
+    """取得共用的 AsyncAnthropic client (同樣使用可調整的連線池)"""
+    global _anthropic_client
+    if _anthropic_client is None:
+        import anthropic
+
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("❌ ANTHROPIC_API_KEY is not set in environment variables.")
+
+        # 依 SDK 版本使用其內部 httpx 實作的 Limits 類別
+        limits_cls = type(anthropic.DEFAULT_CONNECTION_LIMITS)
+        limits = limits_cls(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+        _anthropic_client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            # 重試交給 LLMProvider._resilient_call (deadline / jitter / circuit breaker)，避免重複重試
+            max_retries=0,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=limits, http2=LLM_HTTP2),
+        )
+        logger.info(
+            "✅ Shared Anthropic client created (max_connections=%d, http2=%s)",
+            LLM_HTTP_MAX_CONNECTIONS,
+            LLM_HTTP2,
+        )
+    return _anthropic_client
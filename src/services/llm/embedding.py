@@ -1,47 +1,207 @@
-import os
+import math
+import array
+import asyncio
+import hashlib
 import logging
-from google import genai
+import unicodedata
+from google.genai import types
+
+from src.services.llm.clients import get_gemini_client
+from src.utils.ttl_cache import TTLCache
+from src.config import (
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_MAX_SIZE,
+    EMBEDDING_CACHE_TTL,
+    EMBEDDING_CACHE_SHARED,
+    EMBEDDING_DIMENSIONALITY,
+    EMBEDDING_RENORMALIZE,
+)
 
 logger = logging.getLogger(__name__)
 
+# Firestore 集合為 cache_<FIRESTORE_NAMESPACE>
+FIRESTORE_NAMESPACE = "embedding"
+# 每查詢幾次輸出一次命中率
+STATS_LOG_EVERY = 50
+
+
+def normalize_text(text: str) -> str:
+    """全形轉半形 (NFKC)、合併空白。不轉小寫也不遮罩數字：這些都會影響語意向量"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
 class EmbeddingService:
     """
-    固定鎖定向 Gemini (text-embedding-004) 索取 Embedding 向量的服務。
+    固定鎖定向 Gemini (gemini-embedding-001) 索取 Embedding 向量的服務。
     無論主要的 LLMProvider 使用什麼模型（如 Claude），記憶搜尋的向量空間必須保持完全一致。
+
+    輸出維度由 output_dimensionality 決定 (模型端截斷)，renormalize 時再做 L2 正規化。
+    向量依 (模型名稱, 維度, 正規化文字) 的 hash 快取兩層：
+    L1 為 instance 內的 LRU + TTL；EMBEDDING_CACHE_SHARED 時 L1 miss 會再查 Firestore。
     """
-    
+
     _instance = None
-    
+
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
-            cls._instance = super(EmbeddingService, cls).__new__(cls, *args, **kwargs)
+            cls._instance = super(EmbeddingService, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, model_name: str = "gemini-embedding-001"):
+    def __init__(
+        self,
+        model_name: str = "gemini-embedding-001",
+        output_dimensionality: int = EMBEDDING_DIMENSIONALITY,
+        renormalize: bool = EMBEDDING_RENORMALIZE,
+        cache_enabled: bool = EMBEDDING_CACHE_ENABLED,
+        shared: bool = EMBEDDING_CACHE_SHARED,
+        firestore_service=None,
+    ):
         if hasattr(self, "_initialized"):
             return
-            
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("❌ GEMINI_API_KEY is not set. Embedding requires Gemini.")
-            
-        self.client = genai.Client(api_key=api_key)
+
+        # 與 GeminiProvider 共用同一個 client / 連線池 (未設定 GEMINI_API_KEY 時會拋出 ValueError)
+        self.client = get_gemini_client()
         self.model_name = model_name
+        self.output_dimensionality = output_dimensionality or None
+        self.renormalize = renormalize
+        self._embed_config = (
+            types.EmbedContentConfig(output_dimensionality=self.output_dimensionality)
+            if self.output_dimensionality
+            else None
+        )
+        self.cache_enabled = cache_enabled
+        # 向量以 array('d') 保存，比 list[float] 省約 3/4 記憶體
+        self.local = TTLCache(max_size=EMBEDDING_CACHE_MAX_SIZE, ttl=EMBEDDING_CACHE_TTL)
+        self.shared = shared
+        self.firestore_service = firestore_service
+        self.shared_hits = 0
+        self.shared_misses = 0
+        # 同一段文字同時被要求多次時只呼叫一次 API
+        self._inflight: dict[str, asyncio.Task] = {}
+        # 每個進行中的 task 還有幾個呼叫端在等 (降到 0 時取消，不再為沒人要的結果付費)
+        self._waiters: dict[str, int] = {}
+        # 背景寫入 Firestore 的 task (保留參照，避免被 GC)
+        self._pending: set[asyncio.Task] = set()
         self._initialized = True
-        logger.info("✅ EmbeddingService initialized with fixed model: %s", model_name)
+        logger.info(
+            "✅ EmbeddingService initialized with fixed model: %s (dim=%s)",
+            model_name,
+            self.output_dimensionality or "default",
+        )
+
+    def _firestore(self):
+        if self.firestore_service is None:
+            from src.services.firestore_service import AsyncFirestoreService
+
+            self.firestore_service = AsyncFirestoreService()
+        return self.firestore_service
+
+    @property
+    def version(self) -> str:
+        """向量空間的識別 (模型 + 維度)：不同 version 的向量不能互相比較"""
+        suffix = "" if self.renormalize else ":raw"
+        return f"{self.model_name}@{self.output_dimensionality or 'default'}{suffix}"
+
+    def reduce(self, values: list[float]) -> list[float]:
+        """
+        截斷成 output_dimensionality 維並 (可選) 重新正規化。
+        API 已截斷的結果也會經過這裡；backfill 也用它把舊的完整向量轉成新維度 (不需重新呼叫 API)。
+        """
+        if self.output_dimensionality and len(values) > self.output_dimensionality:
+            values = values[: self.output_dimensionality]
+        if self.renormalize:
+            norm = math.sqrt(sum(v * v for v in values))
+            if norm:
+                values = [v / norm for v in values]
+        return list(values)
+
+    def _cache_key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.version}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
 
     async def get_embedding(self, text: str) -> list[float]:
         """
-        非同步取得文字的 Embedding 向量。
+        非同步取得文字的 Embedding 向量 (先查快取)。
         """
+        if not self.cache_enabled:
+            return await self._embed(text)
+
+        key = self._cache_key(text)
+        cached = self.local.get(key)
+        if cached is not None:
+            self._maybe_log()
+            return list(cached)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, text))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        self._maybe_log()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            # shield: 某個呼叫端被取消時，不影響其他等待同一個結果的呼叫端
+            return list(await asyncio.shield(task))
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                # 最後一個呼叫端也離開了 (例如 Router 判斷不需要 embedding)，取消 API 呼叫
+                if not task.done():
+                    task.cancel()
+
+    async def _fetch(self, key: str, text: str) -> array.array:
+        """L1 miss：查 Firestore，仍然 miss 才呼叫 Gemini，結果寫回兩層快取"""
+        if self.shared:
+            value = await self._firestore().get_cache_entry(FIRESTORE_NAMESPACE, key)
+            if value and value.get("version") == self.version:
+                self.shared_hits += 1
+                vector = array.array("d", value["values"])
+                self.local.set(key, vector)
+                return vector
+            self.shared_misses += 1
+
+        values = await self._embed(text)
+        vector = array.array("d", values)
+        self.local.set(key, vector)
+        if self.shared:
+            write = asyncio.create_task(
+                self._firestore().set_cache_entry(
+                    FIRESTORE_NAMESPACE,
+                    key,
+                    {"version": self.version, "values": list(values)},
+                    EMBEDDING_CACHE_TTL,
+                )
+            )
+            self._pending.add(write)
+            write.add_done_callback(self._pending.discard)
+        return vector
+
+    async def _embed(self, text: str) -> list[float]:
         try:
             result = await self.client.aio.models.embed_content(
                 model=self.model_name,
                 contents=text,
+                config=self._embed_config,
             )
             if not result.embeddings or not result.embeddings[0].values:
                 raise ValueError("No embedding returned from Gemini")
-            return result.embeddings[0].values
+            return self.reduce(result.embeddings[0].values)
         except Exception as e:
             logger.error("Embedding generation error: %s", e)
             raise
+
+    def stats(self) -> dict:
+        stats = self.local.stats()
+        if self.shared:
+            stats["shared_hits"] = self.shared_hits
+            stats["shared_misses"] = self.shared_misses
+        return stats
+
+    def _maybe_log(self):
+        lookups = self.local.hits + self.local.misses
+        if lookups and lookups % STATS_LOG_EVERY == 0:
+            logger.info("📊 Embedding cache stats: %s", self.stats())
+
+    async def awarmup(self) -> None:
+        """查詢模型資訊 (不消耗 token)，預先建立 TLS 連線"""
+        await self.client.aio.models.get(model=self.model_name)
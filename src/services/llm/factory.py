@@ -5,34 +5,78 @@ from src.config import (
     LLM_PROVIDER,
     GEMINI_ROUTER_MODEL_NAME,
     GEMINI_AGENT_MODEL_NAME,
-    GEMINI_GENERATION_CONFIG,
+    GEMINI_GENERATION_PROFILES,
+    GEMINI_THINKING_CONFIG,
+    GEMINI_DEFAULT_TEMPERATURE_MODELS,
     CLAUDE_ROUTER_MODEL_NAME,
     CLAUDE_AGENT_MODEL_NAME,
-    CLAUDE_MAX_TOKENS,
+    CLAUDE_GENERATION_PROFILES,
+    LLM_CASCADE_ENABLED,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_BACKUP_PROVIDER,
+    LLM_HEDGE_INITIAL_DELAY,
+    LLM_HEDGE_PERCENTILE,
 )
 
+# Hedging 時預設的備援供應商 (另一家)
+_OTHER_PROVIDER = {"gemini": "claude", "claude": "gemini"}
+
 logger = logging.getLogger(__name__)
 
 
-def create_llm_provider(role: str = "agent") -> LLMProvider:
+def create_llm_provider(role: str = "agent", profile: str | None = None) -> LLMProvider:
     """
     LLM Provider 工廠函式。
     根據環境變數 LLM_PROVIDER 決定使用哪個 Provider，
-    並根據 role 決定使用哪個模型（router 求快，agent 求準）。
+    並根據 role 決定使用哪個模型（router 求快，agent / chat 求準）。
+    同一個供應商的 Provider 共用一個 SDK client / HTTP 連線池 (見 clients.py)。
 
     Args:
-        role: "router" 或 "agent"。
+        role: "router"、"agent" 或 "chat"。
               router 通常使用速度較快、成本較低的模型。
               agent 使用能力較強的模型進行語意解析。
+              chat 與 agent 同一個模型，但使用較有創意的生成參數。
+        profile: 生成參數 (溫度 / 輸出上限 / thinking)，預設與 role 相同；
+                 見 config.py 的 GEMINI_GENERATION_PROFILES / CLAUDE_GENERATION_PROFILES。
 
     Returns:
         LLMProvider 實例
 
     Raises:
         ValueError: 若 LLM_PROVIDER 設定為不支援的值
+
+    LLM_HEDGE_ENABLED 時回傳 HedgedProvider (主要供應商太慢或失敗時改問備援供應商)。
     """
     provider = LLM_PROVIDER.lower()
-    logger.info("🏭 Creating LLM Provider: provider=%s, role=%s", provider, role)
+    profile = profile or role
+    primary = _create_vendor_provider(provider, role, profile)
+    if not LLM_HEDGE_ENABLED:
+        return primary
+
+    backup_name = (LLM_HEDGE_BACKUP_PROVIDER or _OTHER_PROVIDER.get(provider, "")).lower()
+    try:
+        backup = _create_vendor_provider(backup_name, role, profile)
+    except ValueError as e:
+        # 例如沒有設定備援供應商的 API Key：不做 hedging
+        logger.warning("⚠️ Hedging disabled for role=%s: %s", role, e)
+        return primary
+
+    from src.services.llm.hedge import HedgedProvider
+
+    return HedgedProvider(
+        primary,
+        backup,
+        initial_delay=LLM_HEDGE_INITIAL_DELAY,
+        percentile=LLM_HEDGE_PERCENTILE,
+        name=f"{provider}->{backup_name}:{role}",
+    )
+
+
+def _create_vendor_provider(provider: str, role: str, profile: str) -> LLMProvider:
+    """建立單一供應商的 Provider (provider 需為小寫)"""
+    logger.info(
+        "🏭 Creating LLM Provider: provider=%s, role=%s, profile=%s", provider, role, profile
+    )
 
     if provider == "gemini":
         from src.services.llm.gemini import GeminiProvider
@@ -40,9 +84,13 @@ def create_llm_provider(role: str = "agent") -> LLMProvider:
         model_name = (
             GEMINI_ROUTER_MODEL_NAME if role == "router" else GEMINI_AGENT_MODEL_NAME
         )
+        generation_config = GEMINI_GENERATION_PROFILES[profile]
+        if model_name in GEMINI_DEFAULT_TEMPERATURE_MODELS:
+            generation_config = {k: v for k, v in generation_config.items() if k != "temperature"}
         return GeminiProvider(
             model_name=model_name,
-            generation_config=GEMINI_GENERATION_CONFIG,
+            generation_config=generation_config,
+            thinking_config=GEMINI_THINKING_CONFIG.get(model_name),
         )
 
     elif provider == "claude":
@@ -51,10 +99,33 @@ def create_llm_provider(role: str = "agent") -> LLMProvider:
         model_name = (
             CLAUDE_ROUTER_MODEL_NAME if role == "router" else CLAUDE_AGENT_MODEL_NAME
         )
-        return ClaudeProvider(model_name=model_name, max_tokens=CLAUDE_MAX_TOKENS)
+        return ClaudeProvider(model_name=model_name, **CLAUDE_GENERATION_PROFILES[profile])
 
     else:
         raise ValueError(
             f"❌ Unknown LLM_PROVIDER: '{provider}'. "
             f"Supported values: 'gemini', 'claude'."
         )
+
+
+def create_structured_provider(name: str) -> LLMProvider:
+    """
+    給需要結構化 (JSON) 輸出的 Agent 使用的 Provider。
+    LLM_CASCADE_ENABLED 時回傳 CascadeProvider (router 模型優先，schema 驗證失敗才改用 agent 模型)，
+    否則與 create_llm_provider(role="agent") 相同。
+
+    Args:
+        name: Agent 名稱，用於區分各 Agent 的升級率 log
+    """
+    if not LLM_CASCADE_ENABLED:
+        return create_llm_provider(role="agent")
+
+    from src.services.llm.cascade import CascadeProvider
+
+    logger.info("🏭 Creating cascade provider for %s", name)
+    # fast 用 router 模型，但生成參數要用 agent 的 (router profile 的輸出上限放不下 action JSON)
+    return CascadeProvider(
+        fast=create_llm_provider(role="router", profile="agent"),
+        strong=create_llm_provider(role="agent"),
+        name=name,
+    )
@@ -1,38 +1,268 @@
-import os
+import json
+import time
+import asyncio
+import hashlib
 import logging
-from google import genai
-from google.genai import types
+import httpx
+from google.genai import errors, types
 
-from src.services.llm.base import LLMProvider
+from src.services.llm.base import LLMProvider, RETRYABLE_STATUS, remaining_budget
+from src.services.llm.clients import get_gemini_client
+from src.services.llm.usage import begin_call, record_usage
+from src.config import GEMINI_CONTEXT_CACHE_ENABLED, GEMINI_CONTEXT_CACHE_TTL
 
 logger = logging.getLogger(__name__)
 
 
+def _is_retryable(exc: Exception) -> bool:
+    """429 / 5xx 與連線層錯誤可以重試"""
+    if isinstance(exc, errors.APIError):
+        return exc.code in RETRYABLE_STATUS
+    return isinstance(exc, (httpx.TransportError, ConnectionError))
+
+
+# 快取剩餘時間低於這個比例的 TTL 時延長
+CACHE_REFRESH_RATIO = 0.2
+# 建立快取暫時失敗 (429 / 5xx / 連線問題) 後，隔多久再試 (秒，連續失敗時加倍，最多一個 TTL)
+CACHE_RETRY_BASE_DELAY = 30.0
+# 400 錯誤訊息含這些字時代表這個前綴 / 模型不能快取 (例如低於最小 token 數)，不再嘗試
+UNSUPPORTED_CACHE_HINTS = ("too small", "too few", "min_total_token_count", "not supported")
+
+
+def _is_cache_unsupported(exc: Exception) -> bool:
+    if not isinstance(exc, errors.ClientError) or exc.code != 400:
+        return False
+    message = str(exc).lower()
+    return any(hint in message for hint in UNSUPPORTED_CACHE_HINTS)
+
+
+class GeminiContextCache:
+    """
+    管理 Gemini explicit cached content：每個 (model, system prefix) 建立一份快取，
+    快過期時以 caches.update 延長 TTL。
+    前綴不能快取 (400，例如低於模型的最小 token 數) 時不再嘗試；其他失敗在 backoff 之後重試。
+    建立 / 延長都受本次 Request 的剩餘時間預算限制，其他 Request 正在建立時不等待，直接改用 system_instruction。
+    """
+
+    def __init__(self, ttl_seconds: int = GEMINI_CONTEXT_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[tuple[str, str], tuple[str, float]] = {}  # key -> (cache name, expires_at)
+        self._unsupported: set[tuple[str, str]] = set()
+        self._retry_after: dict[tuple[str, str], tuple[float, int]] = {}  # key -> (monotonic, 連續失敗次數)
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+    def _fresh(self, key) -> str | None:
+        entry = self._entries.get(key)
+        if entry and entry[1] - time.monotonic() > self.ttl_seconds * CACHE_REFRESH_RATIO:
+            return entry[0]
+        return None
+
+    def _record_failure(self, key, model: str, exc: Exception):
+        self._entries.pop(key, None)
+        if _is_cache_unsupported(exc):
+            logger.info("ℹ️ Gemini context cache unsupported for %s, using system_instruction: %s", model, exc)
+            self._unsupported.add(key)
+            return
+        failures = self._retry_after.get(key, (0.0, 0))[1] + 1
+        delay = min(CACHE_RETRY_BASE_DELAY * 2 ** (failures - 1), self.ttl_seconds)
+        self._retry_after[key] = (time.monotonic() + delay, failures)
+        logger.warning("⚠️ Gemini context cache creation failed for %s, retry in %.0fs: %s", model, delay, exc)
+
+    async def get(self, client, model: str, system_prefix: str) -> str | None:
+        """回傳可用的 cached content 名稱；無法快取 (或暫時不可用) 時回傳 None"""
+        key = (model, hashlib.sha1(system_prefix.encode("utf-8")).hexdigest())
+        if key in self._unsupported:
+            return None
+        name = self._fresh(key)
+        if name:
+            return name
+        retry_after = self._retry_after.get(key)
+        if retry_after and time.monotonic() < retry_after[0]:
+            return None
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        if lock.locked():
+            # 其他 Request 正在建立 / 延長，這次不等，直接用 system_instruction
+            entry = self._entries.get(key)
+            return entry[0] if entry and entry[1] > time.monotonic() else None
+
+        async with lock:
+            budget = remaining_budget()
+            if budget is not None and budget <= 0:
+                return None
+
+            ttl = f"{self.ttl_seconds}s"
+            entry = self._entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                try:
+                    await asyncio.wait_for(
+                        client.aio.caches.update(
+                            name=entry[0], config=types.UpdateCachedContentConfig(ttl=ttl)
+                        ),
+                        budget,
+                    )
+                    self._entries[key] = (entry[0], time.monotonic() + self.ttl_seconds)
+                    return entry[0]
+                except asyncio.TimeoutError:
+                    # 預算用完：這次仍可使用尚未過期的快取，下次再延長
+                    return entry[0]
+                except Exception as e:
+                    logger.warning("⚠️ Gemini cache refresh failed, recreating: %s", e)
+                    budget = remaining_budget()
+                    if budget is not None and budget <= 0:
+                        return None
+
+            try:
+                cache = await asyncio.wait_for(
+                    client.aio.caches.create(
+                        model=model,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=system_prefix, ttl=ttl, display_name=f"ai-butler-{key[1][:8]}"
+                        ),
+                    ),
+                    budget,
+                )
+            except asyncio.TimeoutError:
+                # 超時的是本次 Request 的預算，不算快取失敗；下一個 Request 再建立
+                logger.info("ℹ️ Gemini context cache creation exceeded the request budget (%s)", model)
+                return None
+            except Exception as e:
+                self._record_failure(key, model, e)
+                return None
+
+            self._retry_after.pop(key, None)
+            self._entries[key] = (cache.name, time.monotonic() + self.ttl_seconds)
+            logger.info("✅ Gemini context cache created: %s (%s)", cache.name, model)
+            return cache.name
+
+
+# 所有 GeminiProvider 共用 (同一個 model + prefix 只建一份快取)
+_context_cache = GeminiContextCache()
+
+# 每個 Provider 最多保留幾份 (prefix, schema) 組合的 GenerateContentConfig
+CONFIG_MEMO_SIZE = 64
+
+
 class GeminiProvider(LLMProvider):
     """
     Google Gemini LLM Provider。
     包裝 google.genai SDK，實作 LLMProvider 介面。
     """
 
-    def __init__(self, model_name: str, generation_config: dict | None = None):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("❌ GEMINI_API_KEY is not set in environment variables.")
-
-        self.client = genai.Client(api_key=api_key)
+    def __init__(
+        self,
+        model_name: str,
+        generation_config: dict | None = None,
+        thinking_config: dict | None = None,
+        client=None,
+    ):
+        # 預設使用所有 role 共用的 client (同一個連線池)
+        self.client = client or get_gemini_client()
         self.model_name = model_name
         self.generation_config = generation_config
+        # 固定的生成參數只組一次，每次呼叫只在上面疊加 system prefix / schema
+        base_kwargs = dict(generation_config or {})
+        if thinking_config:
+            base_kwargs["thinking_config"] = types.ThinkingConfig(**thinking_config)
+        self._base_config = types.GenerateContentConfig(**base_kwargs) if base_kwargs else None
+        self._config_memo: dict[tuple, types.GenerateContentConfig] = {}
         logger.info("✅ GeminiProvider initialized with model: %s", model_name)
 
-    async def agenerate(self, prompt: str) -> str:
-        """非同步呼叫 Gemini API，回傳純文字回應。"""
-        config = None
-        if self.generation_config:
-            config = types.GenerateContentConfig(**self.generation_config)
-            
-        response = await self.client.aio.models.generate_content(
-            model=self.model_name,
-            contents=prompt,
-            config=config
+    async def _build_config(
+        self, system_prefix: str | None, schema: dict | None = None
+    ) -> types.GenerateContentConfig | None:
+        """
+        組出本次呼叫的 GenerateContentConfig。
+        system_prefix 優先透過 cached content 引用 (見 GeminiContextCache)，否則作為 system_instruction；
+        schema 啟用 JSON mode 與 response_json_schema (原生 structured output)。
+        """
+        if not system_prefix and not schema:
+            return self._base_config
+
+        overrides = {}
+        if system_prefix:
+            cache_name = None
+            if GEMINI_CONTEXT_CACHE_ENABLED:
+                cache_name = await _context_cache.get(self.client, self.model_name, system_prefix)
+            if cache_name:
+                overrides["cached_content"] = cache_name
+            else:
+                overrides["system_instruction"] = system_prefix
+        if schema:
+            overrides["response_mime_type"] = "application/json"
+            overrides["response_json_schema"] = schema
+
+        # schema 都是模組層級常數，以 id 當 key 即可
+        key = (overrides.get("cached_content"), overrides.get("system_instruction"), id(schema))
+        config = self._config_memo.get(key)
+        if config is None:
+            if len(self._config_memo) >= CONFIG_MEMO_SIZE:
+                self._config_memo.clear()
+            base = self._base_config or types.GenerateContentConfig()
+            config = base.model_copy(update=overrides)
+            self._config_memo[key] = config
+        return config
+
+    async def _generate(self, prompt: str, config, system_prefix: str | None = None) -> str:
+        pending = begin_call(prompt, system_prefix)
+        response = await self._resilient_call(
+            "gemini",
+            lambda: self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=config
+            ),
+            _is_retryable,
+        )
+        usage = response.usage_metadata
+        record_usage(
+            usage.prompt_token_count if usage else None,
+            usage.candidates_token_count if usage else None,
+            pending=pending,
         )
         return response.text or ""
+
+    async def agenerate(self, prompt: str, system_prefix: str | None = None) -> str:
+        """非同步呼叫 Gemini API，回傳純文字回應。"""
+        return await self._generate(prompt, await self._build_config(system_prefix), system_prefix)
+
+    async def aparse_json_response(
+        self, prompt: str, schema: dict | None = None, system_prefix: str | None = None
+    ):
+        """有 schema 時使用 Gemini 原生 structured output，回應保證是合法 JSON"""
+        if schema is None:
+            return await super().aparse_json_response(prompt, system_prefix=system_prefix)
+        text = await self._generate(
+            prompt, await self._build_config(system_prefix, schema), system_prefix
+        )
+        return json.loads(text)
+
+    async def astream(self, prompt: str, system_prefix: str | None = None, schema: dict | None = None):
+        """
+        串流回傳文字片段。重試只涵蓋建立串流 (收到第一個片段前)，串流中斷時直接拋出例外。
+        """
+        config = await self._build_config(system_prefix, schema)
+        pending = begin_call(prompt, system_prefix)
+        stream = await self._resilient_call(
+            "gemini",
+            lambda: self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=prompt,
+                config=config
+            ),
+            _is_retryable,
+        )
+        usage = None
+        async for chunk in stream:
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                yield chunk.text
+        record_usage(
+            usage.prompt_token_count if usage else None,
+            usage.candidates_token_count if usage else None,
+            pending=pending,
+        )
+
+    async def awarmup(self) -> None:
+        """查詢模型資訊 (不消耗 token)，預先建立 TLS 連線"""
+        await self.client.aio.models.get(model=self.model_name)
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from collections import deque
+
+from src.services.llm.base import LLMProvider
+from src.services.llm.schemas import validate
+
+logger = logging.getLogger(__name__)
+
+# 保留最近幾次 primary 的延遲來估計 percentile
+LATENCY_WINDOW = 200
+# 每幾次呼叫輸出一次統計
+STATS_LOG_EVERY = 50
+
+
+class HedgedProvider(LLMProvider):
+    """
+    Hedged Request：先呼叫 primary，超過 hedge delay (primary 近期延遲的 p95) 仍未回應就再呼叫 backup
+    (通常是另一家供應商)，取先回來且有效的結果並取消另一個。primary 提早失敗時立刻改呼叫 backup。
+
+    樣本數不足 min_samples 前使用固定的 initial_delay。
+    """
+
+    def __init__(
+        self,
+        primary: LLMProvider,
+        backup: LLMProvider,
+        initial_delay: float = 2.0,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        name: str = "llm",
+    ):
+        self.primary = primary
+        self.backup = backup
+        self.initial_delay = initial_delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.name = name
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"calls": 0, "fired": 0, "backup_won": 0, "failed": 0}
+
+    # ---------- LLMProvider ----------
+
+    async def agenerate(self, prompt: str, system_prefix: str | None = None) -> str:
+        return await self._hedged(
+            lambda provider: provider.agenerate(prompt, system_prefix=system_prefix),
+            lambda text: bool(text and text.strip()),
+        )
+
+    async def aparse_json_response(
+        self, prompt: str, schema: dict | None = None, system_prefix: str | None = None
+    ):
+        return await self._hedged(
+            lambda provider: provider.aparse_json_response(
+                prompt, schema=schema, system_prefix=system_prefix
+            ),
+            lambda data: schema is None or not validate(data, schema),
+        )
+
+    async def awarmup(self) -> None:
+        await asyncio.gather(self.primary.awarmup(), self.backup.awarmup())
+
+    # ---------- Hedging ----------
+
+    def hedge_delay(self) -> float:
+        """目前的 hedge delay (秒)：primary 延遲的 percentile"""
+        if len(self._latencies) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    async def _hedged(self, call, is_valid):
+        self.stats["calls"] += 1
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        primary = asyncio.create_task(call(self.primary))
+        pending = {primary}
+        errors = []
+
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay())
+            if primary in done:
+                self._latencies.append(loop.time() - t0)
+                result, error = self._outcome(primary, is_valid)
+                if error is None:
+                    return result
+                errors.append(error)
+                pending = set()
+
+            # primary 太慢或失敗：送出 backup
+            self.stats["fired"] += 1
+            logger.info("🪝 Hedge[%s] firing backup after %.2fs", self.name, loop.time() - t0)
+            backup = asyncio.create_task(call(self.backup))
+            pending.add(backup)
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is primary:
+                        self._latencies.append(loop.time() - t0)
+                    result, error = self._outcome(task, is_valid)
+                    if error is None:
+                        if task is backup:
+                            self.stats["backup_won"] += 1
+                        return result
+                    errors.append(error)
+
+            self.stats["failed"] += 1
+            raise errors[0]
+        finally:
+            for task in pending:
+                if task.done():
+                    # 已完成的 task (例如在 hedge delay 內成功的 primary) 已經記錄過延遲
+                    continue
+                task.cancel()
+                if task is primary:
+                    # 被取消的 primary 以「至少這麼久」計入，避免 p95 只看到快的樣本而偏低
+                    self._latencies.append(loop.time() - t0)
+            self._maybe_log()
+
+    @staticmethod
+    def _outcome(task: asyncio.Task, is_valid):
+        """回傳 (result, error)；結果無效時 error 為 ValueError"""
+        error = task.exception()
+        if error is not None:
+            return None, error
+        result = task.result()
+        if not is_valid(result):
+            return None, ValueError("Invalid LLM response")
+        return result, None
+
+    def hedge_stats(self) -> dict:
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "fire_rate": round(self.stats["fired"] / calls, 3) if calls else 0.0,
+            "delay_s": round(self.hedge_delay(), 3),
+        }
+
+    def _maybe_log(self):
+        if self.stats["calls"] % STATS_LOG_EVERY == 0:
+            logger.info("📊 Hedge[%s] stats: %s", self.name, self.hedge_stats())
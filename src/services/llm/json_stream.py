@@ -0,0 +1,105 @@
+import json
+
+_WHITESPACE = " \t\r\n"
+# _feed_array_char 沒有完成任何元素時的回傳值 (元素本身可能是 None / null)
+_NOTHING = object()
+
+
+def strip_code_fence(text: str) -> str:
+    """清洗 LLM 常見的 ```json ... ``` 包裝"""
+    return text.replace("```json", "").replace("```", "").strip()
+
+
+class JsonArrayStreamParser:
+    """
+    增量 JSON 陣列解析器：逐段餵入串流輸出，最外層陣列的每個元素一完整就立刻回傳，
+    讓 Agent 可以在後面的 Action 還在生成時就先執行第一個。
+
+    最外層不是陣列 (例如模型只回傳單一物件) 時，等到 close() 才一次解析。
+    """
+
+    def __init__(self):
+        self._text: list[str] = []
+        self._mode: str | None = None  # None (尚未遇到 JSON) / "array" / "object"
+        self._done = False
+        self._emitted = 0
+        # 陣列元素的狀態
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._element: list[str] = []
+
+    def feed(self, chunk: str) -> list:
+        """餵入一段文字，回傳這段文字讓哪些元素變完整 (已解析)"""
+        items = []
+        for ch in chunk:
+            self._text.append(ch)
+            if self._done or self._mode == "object":
+                continue
+            if self._mode is None:
+                if ch == "[":
+                    self._mode = "array"
+                elif ch == "{":
+                    self._mode = "object"
+                continue
+            item = self._feed_array_char(ch)
+            if item is not _NOTHING:
+                items.append(item)
+        self._emitted += len(items)
+        return items
+
+    def _feed_array_char(self, ch: str):
+        if self._in_string:
+            self._element.append(ch)
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+            return _NOTHING
+
+        if ch == '"':
+            self._in_string = True
+            self._element.append(ch)
+            return _NOTHING
+
+        if self._depth == 0:
+            # 元素之間：逗號或結尾的 ']' 結束一個純量元素
+            if ch in _WHITESPACE:
+                return _NOTHING
+            if ch in ",]":
+                if ch == "]":
+                    self._done = True
+                return self._flush() if self._element else _NOTHING
+            if ch in "{[":
+                self._depth = 1
+            self._element.append(ch)
+            return _NOTHING
+
+        self._element.append(ch)
+        if ch in "{[":
+            self._depth += 1
+        elif ch in "}]":
+            self._depth -= 1
+            if self._depth == 0:
+                return self._flush()
+        return _NOTHING
+
+    def _flush(self):
+        text = "".join(self._element).strip()
+        self._element = []
+        return json.loads(text)
+
+    def close(self) -> list:
+        """
+        串流結束：回傳尚未回傳的元素。
+        最外層是物件時回傳 [該物件]；陣列沒有正常結束時拋出 ValueError。
+        """
+        if self._mode == "array":
+            if not self._done:
+                raise ValueError("Incomplete JSON array in LLM stream")
+            return []
+
+        data = json.loads(strip_code_fence("".join(self._text)))
+        return data if isinstance(data, list) else [data]
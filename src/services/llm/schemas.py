@@ -0,0 +1,192 @@
+"""
+各 Agent 預期的 JSON 輸出結構 (JSON Schema 的子集) 與輕量驗證器。
+- Provider 以此做原生 structured output (Gemini response_json_schema / Claude tool-use)。
+- CascadeProvider 用來判斷便宜模型的輸出是否可用，不合格才升級到較強的模型。
+"""
+
+_ISO_TIME = {"type": "string"}
+
+
+def _skill(name: str, required: list[str], properties: dict | None = None) -> dict:
+    return {
+        "type": "object",
+        "required": ["skill", "args"],
+        "properties": {
+            "skill": {"enum": [name]},
+            "args": {"type": "object", "required": required, "properties": properties or {}},
+        },
+    }
+
+
+# CalendarAgent：單一 Action (required 與 AsyncCalendarSkills 各 Skill 的必填參數一致)
+_EVENT_ARGS = {"title": {"type": "string"}, "start_time": _ISO_TIME, "end_time": _ISO_TIME}
+
+CALENDAR_ACTION = {
+    "anyOf": [
+        _skill("create_event", ["title", "start_time", "end_time"], _EVENT_ARGS),
+        _skill(
+            "create_recurring_event",
+            ["title", "start_time", "end_time", "frequency"],
+            {**_EVENT_ARGS, "frequency": {"enum": ["daily", "weekly", "monthly"]}},
+        ),
+        _skill(
+            "batch_create",
+            ["events"],
+            {
+                "events": {
+                    "type": "array",
+                    "minItems": 1,
+                    "items": {
+                        "type": "object",
+                        "required": ["title", "start_time", "end_time"],
+                        "properties": _EVENT_ARGS,
+                    },
+                }
+            },
+        ),
+        _skill("list_events", ["time_min"], {"time_min": _ISO_TIME}),
+        _skill("delete_event", ["time_min"], {"time_min": _ISO_TIME}),
+        _skill(
+            "reschedule_event",
+            ["old_time_min", "new_start_time", "new_end_time"],
+            {"old_time_min": _ISO_TIME, "new_start_time": _ISO_TIME, "new_end_time": _ISO_TIME},
+        ),
+    ]
+}
+
+# CalendarAgent：Action List (LLM 偶爾只回傳單一 Action，Agent 會自行包成 List，因此也接受)
+CALENDAR_ACTIONS = {
+    "anyOf": [
+        {"type": "array", "minItems": 1, "items": CALENDAR_ACTION},
+        CALENDAR_ACTION,
+    ]
+}
+
+# ExpenseAgent：記帳 (RECORD) 或查帳 (QUERY)
+EXPENSE_ACTION = {
+    "anyOf": [
+        {
+            "type": "object",
+            "required": ["action", "data"],
+            "properties": {
+                "action": {"enum": ["RECORD"]},
+                "data": {
+                    "type": "object",
+                    "required": ["item", "amount", "category", "date"],
+                    "properties": {
+                        "item": {"type": "string"},
+                        "amount": {"type": ["integer", "number", "string"]},
+                        "category": {"type": "string"},
+                        "project": {"type": ["string", "null"]},
+                        "date": {"type": "string"},
+                    },
+                },
+            },
+        },
+        {
+            "type": "object",
+            "required": ["action", "params"],
+            "properties": {
+                "action": {"enum": ["QUERY"]},
+                "params": {
+                    "type": "object",
+                    "required": ["start_date", "end_date"],
+                    "properties": {
+                        "start_date": {"type": "string"},
+                        "end_date": {"type": "string"},
+                        "filter_column": {"type": ["string", "null"]},
+                        "filter_value": {"type": ["string", "null"]},
+                    },
+                },
+            },
+        },
+    ]
+}
+
+# MemoryParser
+MEMORY_RECORD = {
+    "type": "object",
+    "required": ["summary", "tags", "memory_type"],
+    "properties": {
+        "summary": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "memory_type": {"enum": ["technical_log", "personal_fact", "task_note", "daily_log"]},
+    },
+}
+
+# Router：意圖分類
+ROUTER_DECISION = {
+    "type": "object",
+    "required": ["intent", "needs_memory"],
+    "properties": {
+        "intent": {"enum": ["CALENDAR", "EXPENSE", "CHAT"]},
+        "needs_memory": {"type": "boolean"},
+        "confidence": {"type": "number"},
+    },
+}
+
+# Fused pipeline：意圖 + Agent payload
+FUSED_DECISION = {
+    "type": "object",
+    "required": ["intent", "needs_memory", "payload"],
+    "properties": {
+        "intent": {"enum": ["CALENDAR", "EXPENSE", "CHAT"]},
+        "needs_memory": {"type": "boolean"},
+        "payload": {"anyOf": [CALENDAR_ACTIONS, EXPENSE_ACTION, {"type": "null"}]},
+    },
+}
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def _type_ok(value, expected) -> bool:
+    names = expected if isinstance(expected, list) else [expected]
+    for name in names:
+        # bool 是 int 的子類別，需排除
+        if name in ("integer", "number") and isinstance(value, bool):
+            continue
+        if isinstance(value, _TYPES[name]):
+            return True
+    return False
+
+
+def validate(data, schema: dict, path: str = "$") -> list[str]:
+    """
+    依 schema 驗證 data，回傳錯誤訊息列表 (空列表代表通過)。
+    支援：type, enum, required, properties, items, minItems, anyOf。
+    """
+    if "anyOf" in schema:
+        branches = [validate(data, sub, path) for sub in schema["anyOf"]]
+        if any(not errors for errors in branches):
+            return []
+        # 回傳最接近 (錯誤最少) 的分支的錯誤
+        return min(branches, key=len)
+
+    if "type" in schema and not _type_ok(data, schema["type"]):
+        return [f"{path}: expected {schema['type']}, got {type(data).__name__}"]
+    if "enum" in schema and data not in schema["enum"]:
+        return [f"{path}: {data!r} not in {schema['enum']}"]
+
+    errors = []
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}: missing '{key}'")
+        for key, sub in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate(data[key], sub, f"{path}.{key}"))
+    elif isinstance(data, list):
+        if len(data) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(data):
+                errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
@@ -0,0 +1,82 @@
+import contextvars
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# 粗估 prompt 的 token 數 (中英混合文字平均每個 token 約幾個字元)
+CHARS_PER_TOKEN = 3
+
+
+@dataclass
+class UsageRecord:
+    """一段流程 (一個 asyncio Task / with 區塊) 內所有 LLM 呼叫的 token 用量"""
+
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # 已送出但還沒回報用量的呼叫 (以 prompt 長度估算的輸入 token)；呼叫被取消時會留在這裡
+    pending_input_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+
+# 目前的 UsageRecord；asyncio Task 建立時會複製 context，所以各 Task 可以各自統計
+_current_usage: contextvars.ContextVar[UsageRecord | None] = contextvars.ContextVar(
+    "llm_usage", default=None
+)
+
+
+@contextmanager
+def track_usage():
+    """
+    統計 with 區塊內 (含其中 await 的呼叫) 的 LLM token 用量。
+
+        with track_usage() as usage:
+            await llm.agenerate(prompt)
+        usage.total_tokens
+    """
+    record = UsageRecord()
+    token = _current_usage.set(record)
+    try:
+        yield record
+    finally:
+        _current_usage.reset(token)
+
+
+def estimate_tokens(*texts: str | None) -> int:
+    """以字元數粗估 token 數"""
+    return sum(len(text) for text in texts if text) // CHARS_PER_TOKEN
+
+
+def begin_call(*texts: str | None) -> int:
+    """
+    由 Provider 在送出呼叫前登記 (以 prompt 長度估算輸入 token)。
+    回傳估計值，呼叫完成時傳給 record_usage(pending=...) 扣回。
+    """
+    estimate = estimate_tokens(*texts)
+    record = _current_usage.get()
+    if record is not None:
+        record.pending_input_tokens += estimate
+    return estimate
+
+
+def record_usage(input_tokens: int | None, output_tokens: int | None, pending: int = 0) -> None:
+    """由 Provider 在每次呼叫完成後回報用量 (沒有在統計時不做事)；pending 為 begin_call 的估計值"""
+    record = _current_usage.get()
+    if record is None:
+        return
+    record.calls += 1
+    record.input_tokens += input_tokens or 0
+    record.output_tokens += output_tokens or 0
+    record.pending_input_tokens -= pending
@@ -0,0 +1,108 @@
+import re
+import asyncio
+import hashlib
+import logging
+import unicodedata
+
+from src.config import (
+    ROUTER_CACHE_TTL,
+    ROUTER_CACHE_MAX_SIZE,
+    ROUTER_CACHE_SHARED,
+)
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Firestore 集合為 cache_<FIRESTORE_NAMESPACE>
+FIRESTORE_NAMESPACE = "router"
+# 每查詢幾次輸出一次命中率
+STATS_LOG_EVERY = 50
+
+# 數字 (含中文數字 + 單位) 一律遮罩，讓「午餐 120」與「午餐 85」、「3/15 開會」與「4/2 開會」共用同一個 key
+_DIGITS = re.compile(r"\d+(\.\d+)?")
+_CJK_NUMBERS = re.compile(r"[零一二三四五六七八九十百千兩]+(?=[點號日月塊元個次週周年])")
+
+
+def normalize_message(text: str) -> str:
+    """去頭尾空白、全形轉半形 (NFKC)、轉小寫、合併空白，並遮罩數字與日期"""
+    norm = " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+    norm = _DIGITS.sub("#", norm)
+    return _CJK_NUMBERS.sub("#", norm)
+
+
+class RouterDecisionCache:
+    """
+    Router LLM 決策 (intent, needs_memory) 的快取。
+    L1 為 instance 內的 LRU + TTL；shared=True 時 L1 miss 會再查 Firestore，讓不同 warm instance 共用結果。
+    """
+
+    def __init__(
+        self,
+        ttl: float = ROUTER_CACHE_TTL,
+        max_size: int = ROUTER_CACHE_MAX_SIZE,
+        shared: bool = ROUTER_CACHE_SHARED,
+        firestore_service=None,
+    ):
+        self.ttl = ttl
+        self.local = TTLCache(max_size=max_size, ttl=ttl)
+        self.shared = shared
+        self.firestore_service = firestore_service
+        self.shared_hits = 0
+        self.shared_misses = 0
+        # 背景寫入 Firestore 的 task (保留參照，避免被 GC)
+        self._pending: set[asyncio.Task] = set()
+
+    def _firestore(self):
+        if self.firestore_service is None:
+            from src.services.firestore_service import AsyncFirestoreService
+
+            self.firestore_service = AsyncFirestoreService()
+        return self.firestore_service
+
+    @staticmethod
+    def _doc_id(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    async def get(self, text: str) -> tuple[str, bool] | None:
+        key = normalize_message(text)
+        decision = self.local.get(key)
+
+        if decision is None and self.shared:
+            value = await self._firestore().get_cache_entry(FIRESTORE_NAMESPACE, self._doc_id(key))
+            if value:
+                self.shared_hits += 1
+                decision = (value["intent"], value["needs_memory"])
+                self.local.set(key, decision)
+            else:
+                self.shared_misses += 1
+
+        self._maybe_log()
+        return decision
+
+    def set(self, text: str, intent: str, needs_memory: bool):
+        """寫入 L1；shared 模式下 Firestore 在背景寫入，不拖慢回覆"""
+        key = normalize_message(text)
+        self.local.set(key, (intent, needs_memory))
+        if self.shared:
+            task = asyncio.create_task(
+                self._firestore().set_cache_entry(
+                    FIRESTORE_NAMESPACE,
+                    self._doc_id(key),
+                    {"intent": intent, "needs_memory": needs_memory},
+                    self.ttl,
+                )
+            )
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    def stats(self) -> dict:
+        stats = self.local.stats()
+        if self.shared:
+            stats["shared_hits"] = self.shared_hits
+            stats["shared_misses"] = self.shared_misses
+        return stats
+
+    def _maybe_log(self):
+        lookups = self.local.hits + self.local.misses
+        if lookups and lookups % STATS_LOG_EVERY == 0:
+            logger.info("📊 Router cache stats: %s", self.stats())
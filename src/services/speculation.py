@@ -0,0 +1,123 @@
+import asyncio
+import logging
+
+from src.services.llm.usage import track_usage
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 會做 speculative parsing 的 intent (CHAT 需要先查記憶，不適合)
+SPECULATIVE_INTENTS = ("CALENDAR", "EXPENSE")
+# 記住每位使用者最近一次 intent 的時間 (秒)
+RECENT_INTENT_TTL = 600
+# 每結算幾次輸出一次統計
+STATS_LOG_EVERY = 20
+
+
+class Speculation:
+    """一次 speculative parse：預測的 intent 與背景執行中的 parse task"""
+
+    def __init__(self, intent: str, task: asyncio.Task, usage_holder: dict):
+        self.intent = intent
+        self.task = task
+        self.usage_holder = usage_holder  # {"usage": UsageRecord}，task 開始執行後才有值
+
+
+class SpeculativeParser:
+    """
+    在 Router 判斷 intent 的同時，先以最可能的 Agent 解析指令。
+
+    預測來源：LocalIntentClassifier 的規則猜測 (信心不足也可)，其次是同一使用者最近一次的 intent。
+    Router 結果一致時直接使用解析結果 (省下一段串行的 LLM 延遲)；不一致就取消，並把已花掉的 token 記為浪費
+    (還在進行中的呼叫以 prompt 長度估算)。
+    """
+
+    def __init__(self, classifier=None):
+        self.classifier = classifier
+        self.recent = TTLCache(max_size=1024, ttl=RECENT_INTENT_TTL)
+        self.stats = {
+            "started": 0,
+            "hits": 0,
+            "misses": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "wasted_tokens": 0,
+        }
+
+    def predict(self, user_id: str, text: str) -> str | None:
+        """
+        回傳值得先跑的 intent。
+        本地規則已經有把握時 Router 幾乎不花時間，不需要預測：由呼叫端判斷後不呼叫 start (見 main._route_two_stage)
+        """
+        if self.classifier is not None:
+            guess = self.classifier.guess(text)
+            if guess in SPECULATIVE_INTENTS:
+                return guess
+        recent = self.recent.get(user_id)
+        return recent if recent in SPECULATIVE_INTENTS else None
+
+    def start(self, user_id: str, text: str, parsers: dict) -> Speculation | None:
+        """
+        parsers: {intent: async callable(text)}，例如 {"CALENDAR": lambda t: get_calendar_agent().parse(t)}
+                 (只有預測到的 intent 會被呼叫，Agent 可以在 callable 內才建立)
+        """
+        intent = self.predict(user_id, text)
+        if intent is None or intent not in parsers:
+            return None
+
+        usage_holder = {}
+
+        async def run():
+            # 在 task 內統計，才不會把 Router 的用量算進來
+            with track_usage() as usage:
+                usage_holder["usage"] = usage
+                return await parsers[intent](text)
+
+        self.stats["started"] += 1
+        logger.info("🔮 Speculatively parsing as %s", intent)
+        return Speculation(intent, asyncio.create_task(run()), usage_holder)
+
+    async def resolve(self, speculation: Speculation | None, user_id: str, intent: str):
+        """
+        Router 結果出來後結算。
+        回傳: 預測命中且解析成功時回傳解析結果，否則回傳 None (由 Agent 自行重新解析)
+        """
+        self.recent.set(user_id, intent)
+        if speculation is None:
+            return None
+
+        result = None
+        if speculation.intent == intent:
+            try:
+                result = await speculation.task
+                self.stats["hits"] += 1
+            except Exception as e:
+                logger.warning("⚠️ Speculative parse failed: %s", e)
+                self.stats["failed"] += 1
+        else:
+            self.stats["misses"] += 1
+            if not speculation.task.done():
+                speculation.task.cancel()
+                self.stats["cancelled"] += 1
+            elif not speculation.task.cancelled():
+                # 取出例外 (若有)，避免 "exception was never retrieved" 警告
+                speculation.task.exception()
+            # 被取消時仍在進行的呼叫拿不到實際用量，改以 prompt 長度估算的輸入 token 計入
+            usage = speculation.usage_holder.get("usage")
+            if usage:
+                self.stats["wasted_tokens"] += usage.total_tokens + usage.pending_input_tokens
+
+        self._maybe_log()
+        return result
+
+    def hit_rate(self) -> dict:
+        settled = self.stats["hits"] + self.stats["misses"] + self.stats["failed"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / settled, 3) if settled else 0.0,
+        }
+
+    def _maybe_log(self):
+        settled = self.stats["hits"] + self.stats["misses"] + self.stats["failed"]
+        if settled and settled % STATS_LOG_EVERY == 0:
+            logger.info("📊 Speculation stats: %s", self.hit_rate())
@@ -1,12 +1,128 @@
+import asyncio
 import logging
-from src.services.gcal_service import GCalService
+import datetime
+from src.services.gcal_service import GCalService, AsyncGCalService
 
 logger = logging.getLogger(__name__)
 
+# 週期行程支援的頻率與星期代碼 (RFC 5545)
+RRULE_FREQUENCIES = {"daily": "DAILY", "weekly": "WEEKLY", "monthly": "MONTHLY"}
+RRULE_WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+# 行程總覽最多顯示幾筆 (LINE Flex Message 有大小上限，再多也塞不進一張卡片)
+MAX_OVERVIEW_EVENTS = 50
+# 沒指定 count / until 時的預設次數 (與 Prompt 的「預設未來 4 週」一致)
+DEFAULT_RECURRENCE_COUNT = 4
+
+
+def _first_unclaimed(events, claimed_ids=()):
+    """排序後的搜尋結果中，取第一筆還沒被其他操作鎖定的行程"""
+    for evt in events:
+        if evt.get("id") not in claimed_ids:
+            return evt
+    return None
+
+
+def _event_data(
+    title: str,
+    start_time: str,
+    end_time: str,
+    location: str = "",
+    description: str = "",
+):
+    """把 Skill 參數轉成 service 層的 event_data"""
+    return {
+        "title": title,
+        "startTime": start_time,
+        "endTime": end_time,
+        "location": location,
+        "description": description,
+    }
+
+
+def build_rrule(
+    frequency: str,
+    count: int = None,
+    until: str = None,
+    interval: int = 1,
+    by_day=None,
+):
+    """
+    組出 RFC 5545 RRULE 字串，例如 RRULE:FREQ=WEEKLY;BYDAY=WE;COUNT=52
+    - frequency: daily | weekly | monthly
+    - until: ISO 8601 日期或時間 (含當天)，會轉成 UTC 的 UNTIL
+    - by_day: "MO,WE" 或 ["MO", "WE"]
+    """
+    freq = RRULE_FREQUENCIES.get(str(frequency).lower())
+    if not freq:
+        raise ValueError(f"Unsupported frequency: {frequency}")
+
+    parts = [f"FREQ={freq}"]
+    if interval and int(interval) > 1:
+        parts.append(f"INTERVAL={int(interval)}")
+
+    if by_day:
+        days = by_day.split(",") if isinstance(by_day, str) else list(by_day)
+        days = [d.strip().upper()[:2] for d in days if d.strip()]
+        invalid = [d for d in days if d not in RRULE_WEEKDAYS]
+        if invalid:
+            raise ValueError(f"Unsupported by_day: {invalid}")
+        parts.append(f"BYDAY={','.join(days)}")
+
+    if until:
+        if "T" in until:
+            dt_until = datetime.datetime.fromisoformat(until.replace("Z", "+00:00"))
+            if dt_until.tzinfo is None:
+                dt_until = dt_until.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=8)))
+        else:
+            # 只有日期：涵蓋到當天結束 (台灣時間)
+            dt_until = datetime.datetime.fromisoformat(until).replace(
+                hour=23, minute=59, second=59,
+                tzinfo=datetime.timezone(datetime.timedelta(hours=8)),
+            )
+        dt_until = dt_until.astimezone(datetime.timezone.utc)
+        parts.append(f"UNTIL={dt_until.strftime('%Y%m%dT%H%M%SZ')}")
+    else:
+        parts.append(f"COUNT={int(count) if count else DEFAULT_RECURRENCE_COUNT}")
+
+    return "RRULE:" + ";".join(parts)
+
+
+def _recurring_event_data(
+    title: str,
+    start_time: str,
+    end_time: str,
+    frequency: str,
+    count: int = None,
+    until: str = None,
+    interval: int = 1,
+    by_day=None,
+    location: str = "",
+    description: str = "",
+):
+    """把週期行程的 Skill 參數轉成 service 層的 event_data (含 recurrence)"""
+    event_data = _event_data(title, start_time, end_time, location, description)
+    event_data["recurrence"] = [build_rrule(frequency, count, until, interval, by_day)]
+    return event_data
+
+
+def _reschedule_patch(new_start_time: str, new_end_time: str, new_title: str = None):
+    """
+    改期用的 events.patch body：只動開始/結束時間 (與標題)，
+    其餘欄位 (ID、參與者、描述、提醒) 由 Calendar 保留。
+    """
+    patch_body = {
+        # date 設為 None：若原本是整天行程，需清掉 date 才能改成指定時間
+        "start": {"dateTime": new_start_time, "timeZone": "Asia/Taipei", "date": None},
+        "end": {"dateTime": new_end_time, "timeZone": "Asia/Taipei", "date": None},
+    }
+    if new_title:
+        patch_body["summary"] = new_title
+    return patch_body
+
 
 class CalendarSkills:
-    def __init__(self):
-        self.service = GCalService()
+    def __init__(self, use_mirror: bool = False):
+        self.service = GCalService(use_mirror=use_mirror)
 
     def create_event(
         self,
@@ -17,15 +133,16 @@ class CalendarSkills:
         description: str = "",
     ):
         """[Skill] 建立行程"""
-        event_data = {
-            "title": title,
-            "startTime": start_time,
-            "endTime": end_time,
-            "location": location,
-            "description": description,
-        }
+        event_data = _event_data(title, start_time, end_time, location, description)
         return self.service.create_event(event_data)
 
+    def create_recurring_event(self, title: str, start_time: str, end_time: str, frequency: str, **kwargs):
+        """[Skill] 建立週期行程 (單一事件 + RRULE，只花一次 API 呼叫)"""
+        event_data = _recurring_event_data(title, start_time, end_time, frequency, **kwargs)
+        result = self.service.create_event(event_data)
+        result["rrule"] = event_data["recurrence"][0]
+        return result
+
     def list_events(self, time_min: str, time_max: str = None):
         """[Skill] 查詢行程"""
         return self.service.list_events(time_min, time_max)
@@ -33,30 +150,18 @@ class CalendarSkills:
     def delete_event_by_query(self, time_min: str, keyword: str = ""):
         """
         [Skill] 刪除行程 (智慧搜尋刪除)
-        1. 根據 time_min 抓取該時段附近的行程
-        2. 若有 keyword，篩選標題
+        1. 在 time_min 附近 (往前 3 小時 ~ 往後 30 天) 搜尋行程
+        2. 以 n-gram 索引比對 keyword (標題/地點/描述)，依相似度排序，同分取時間最近的
         3. 刪除最吻合的那一筆
         """
         logger.info("🗑️ Skill: Delete search | Time: %s | Key: %s", time_min, keyword)
 
-        # 1. 搜尋行程 (範圍設為該時間點的當天)
-        # 簡單起見，我們查該時間點往後 24 小時內的
-        query_result = self.service.list_events(time_min)
+        # 1 + 2. 搜尋並排序
+        query_result = self.service.find_events(time_min, keyword)
         if not query_result["success"]:
             return {"success": False, "message": "搜尋行程失敗，無法刪除"}
 
-        events = query_result["events"]
-        target_event = None
-
-        # 2. 篩選邏輯
-        for evt in events:
-            # 如果有提供關鍵字，必須包含關鍵字
-            if keyword and keyword not in evt.get("summary", ""):
-                continue
-
-            # 如果沒關鍵字，預設刪除找到的第一筆 (通常是時間最近的)
-            target_event = evt
-            break
+        target_event = _first_unclaimed(query_result["events"])
 
         # 3. 執行刪除
         if target_event:
@@ -71,32 +176,258 @@ class CalendarSkills:
     def reschedule_event(
         self,
         old_time_min: str,
-        old_keyword: str,
-        new_title: str,
         new_start_time: str,
         new_end_time: str,
+        old_keyword: str = "",
+        new_title: str = None,
     ):
         """
         [Skill] 改期 (Reschedule)
-        邏輯：先刪除舊的 -> 再建立新的
+        邏輯：找到舊行程一次 -> events.patch 改時間 (保留 ID、參與者與描述)
+        若找不到舊行程，改為直接建立新行程，並在結果中標註 mode="created"
         """
         logger.info(
             "🔄 Skill: Reschedule | Old: %s | New: %s", old_time_min, new_start_time
         )
 
-        # 1. 嘗試刪除舊行程
-        del_result = self.delete_event_by_query(old_time_min, old_keyword)
+        query_result = self.service.find_events(old_time_min, old_keyword)
+        if not query_result["success"]:
+            return {"success": False, "message": "搜尋行程失敗，無法改期"}
 
-        # 2. 建立新行程
-        # 就算刪除失敗(沒找到舊的)，我們通常還是會建立新的，或是回傳錯誤
-        # 這裡策略是：如果找不到舊的，就只建立新的，並在訊息提醒
+        target_event = _first_unclaimed(query_result["events"])
+        if not target_event:
+            if not new_title:
+                return {"success": False, "message": "找不到符合條件的行程可以改期"}
+            create_result = self.create_event(
+                title=new_title, start_time=new_start_time, end_time=new_end_time
+            )
+            return {**create_result, "mode": "created"}
 
-        create_result = self.create_event(
-            title=new_title, start_time=new_start_time, end_time=new_end_time
+        patch_result = self.service.patch_event(
+            target_event["id"],
+            _reschedule_patch(new_start_time, new_end_time, new_title),
         )
+        return {**patch_result, "mode": "patched", "original_event": target_event}
+
+
+def _lookup_spec(skill, args):
+    """刪除/改期要搜尋的 (time_min, keyword)；其他 Skill 回傳 None"""
+    if skill == "delete_event":
+        return args.get("time_min"), args.get("keyword", "")
+    if skill == "reschedule_event":
+        return args.get("old_time_min"), args.get("old_keyword", "")
+    return None
 
-        return {
-            "success": create_result["success"],
-            "delete_status": del_result,
-            "create_status": create_result,
-        }
+
+def _lookup_batch_op(skill, args, lookup, claimed_ids):
+    """
+    依搜尋結果組出刪除/改期的 batch 操作，並鎖定選中的行程。
+    回傳: ((kind, payload), 目標舊行程, None)；無法加入 batch 時為 (None, None, 失敗結果)
+    """
+    if isinstance(lookup, BaseException) or not lookup["success"]:
+        return None, None, {"success": False, "message": "搜尋行程失敗"}
+
+    target = _first_unclaimed(lookup["events"], claimed_ids)
+    try:
+        if target and skill == "delete_event":
+            op = ("delete", target["id"])
+        elif target:
+            patch_body = _reschedule_patch(
+                args["new_start_time"], args["new_end_time"], args.get("new_title")
+            )
+            op = ("patch", (target["id"], patch_body))
+        elif skill == "reschedule_event" and args.get("new_title"):
+            # 找不到舊行程：與單筆 Skill 相同，改為直接建立
+            op = ("create", _event_data(args["new_title"], args["new_start_time"], args["new_end_time"]))
+        else:
+            return None, None, {"success": False, "message": "找不到符合條件的行程"}
+    except KeyError as e:
+        logger.error("Parameter Mismatch in batch %s: %s", skill, e)
+        return None, None, {"success": False, "message": "參數錯誤"}
+
+    if target:
+        claimed_ids.add(target["id"])
+    return op, target, None
+
+
+def _create_batch_op(skill, args):
+    """組出新增型 Skill 的 batch 操作，回傳格式同 _lookup_batch_op"""
+    try:
+        if skill == "create_event":
+            event_data = _event_data(**args)
+        elif skill == "create_recurring_event":
+            event_data = _recurring_event_data(**args)
+        else:
+            return None, None, {"success": False, "message": f"不支援批次的 Skill: {skill}"}
+    except (TypeError, ValueError) as e:
+        logger.error("Parameter Mismatch in batch %s: %s", skill, e)
+        return None, None, {"success": False, "message": "參數錯誤"}
+    return ("create", event_data), None, None
+
+
+def _batch_skill_result(skill, kind, target, result):
+    """把 batch_mutate 的單筆結果轉回對應單筆 Skill 的回傳格式"""
+    if skill == "delete_event" and result["success"]:
+        return {"success": True, "deleted_event": target}
+    if skill == "reschedule_event":
+        mode = "patched" if kind == "patch" else "created"
+        return {**result, "mode": mode, "original_event": target}
+    return result
+
+
+class AsyncCalendarSkills:
+    """
+    CalendarSkills 的非同步版本，供 CalendarAgent 在 webhook 的 event loop 中 await。
+    Skill 介面與回傳格式和 CalendarSkills 完全一致；報表腳本仍使用同步版。
+    """
+
+    def __init__(self):
+        self.service = AsyncGCalService()
+
+    async def create_event(
+        self,
+        title: str,
+        start_time: str,
+        end_time: str,
+        location: str = "",
+        description: str = "",
+    ):
+        """[Skill] 建立行程"""
+        event_data = _event_data(title, start_time, end_time, location, description)
+        return await self.service.create_event(event_data)
+
+    async def create_recurring_event(
+        self, title: str, start_time: str, end_time: str, frequency: str, **kwargs
+    ):
+        """[Skill] 建立週期行程 (單一事件 + RRULE，只花一次 API 呼叫)"""
+        event_data = _recurring_event_data(title, start_time, end_time, frequency, **kwargs)
+        result = await self.service.create_event(event_data)
+        result["rrule"] = event_data["recurrence"][0]
+        return result
+
+    async def list_events(
+        self, time_min: str, time_max: str = None, max_results: int = MAX_OVERVIEW_EVENTS
+    ):
+        """
+        [Skill] 查詢行程 (超過 max_results 筆就不再抓下一頁)
+        多抓一筆判斷是否被截斷：result["truncated"] 為 True 時還有更多行程沒有列出
+        """
+        result = await self.service.list_events(time_min, time_max, max_results=max_results + 1)
+        if result["success"]:
+            result["truncated"] = len(result["events"]) > max_results
+            result["events"] = result["events"][:max_results]
+        return result
+
+    async def delete_event_by_query(
+        self, time_min: str, keyword: str = "", claimed_ids: set | None = None
+    ):
+        """
+        [Skill] 刪除行程 (智慧搜尋刪除)，邏輯同 CalendarSkills.delete_event_by_query
+        claimed_ids: 同一則訊息中已被其他刪除 / 改期鎖定的行程 id (會加入本次的目標)，
+                     避免「刪除明天的兩個會議」兩次都選到同一筆
+        """
+        logger.info("🗑️ Skill: Delete search | Time: %s | Key: %s", time_min, keyword)
+
+        query_result = await self.service.find_events(time_min, keyword)
+        if not query_result["success"]:
+            return {"success": False, "message": "搜尋行程失敗，無法刪除"}
+
+        target_event = _first_unclaimed(query_result["events"], claimed_ids or ())
+        if not target_event:
+            return {"success": False, "message": "找不到符合條件的行程可以刪除"}
+        if claimed_ids is not None:
+            claimed_ids.add(target_event["id"])
+
+        del_result = await self.service.delete_event(target_event["id"])
+        if del_result["success"]:
+            return {"success": True, "deleted_event": target_event}
+        return {"success": False, "message": del_result["message"]}
+
+    async def batch_apply(self, mutations, claimed_ids: set | None = None):
+        """
+        [Skill] 批次套用多筆寫入，只花一次 Calendar batch HTTP request。
+        mutations: [("create_event" | "create_recurring_event" | "delete_event" | "reschedule_event", args), ...]
+                   args 與對應單筆 Skill 的參數相同。刪除/改期的搜尋都在送出前進行，看不到同一批的新增/改期，
+                   呼叫端只能傳入互不相依的操作 (見 CalendarAgent._independent_prefix)
+        claimed_ids: 同 delete_event_by_query (會加入本批刪除/改期選中的行程)
+        回傳: 與 mutations 同順序的結果 list，格式同對應的單筆 Skill
+        拋出: 只在 batch request 送出之前 (此時呼叫端可以改為逐筆執行)；送出之後的錯誤都轉成該筆的失敗結果
+        """
+        if claimed_ids is None:
+            claimed_ids = set()
+
+        # 1. 刪除/改期需先找到目標：各筆搜尋並行進行
+        lookups = await self._lookup_targets(mutations)
+
+        # 2. 組出 batch 內容 (依原始順序，刪除/改期依序鎖定目標)
+        results = [None] * len(mutations)
+        batch_ops = []  # (原始 index, (kind, payload), 目標舊行程)
+        for i, (skill, args) in enumerate(mutations):
+            if i in lookups:
+                op, target, error = _lookup_batch_op(skill, args, lookups[i], claimed_ids)
+            else:
+                op, target, error = _create_batch_op(skill, args)
+            if error:
+                results[i] = error
+            else:
+                batch_ops.append((i, op, target))
+
+        # 3. 一次送出，再把結果轉回各 Skill 的格式
+        if batch_ops:
+            batch_results = await self.service.batch_mutate([op for _, op, _ in batch_ops])
+            # batch 已送出：以下只做格式轉換，不可再拋出例外讓呼叫端重送
+            for (i, (kind, _), target), result in zip(batch_ops, batch_results):
+                results[i] = _batch_skill_result(mutations[i][0], kind, target, result)
+        return results
+
+    async def _lookup_targets(self, mutations):
+        """並行搜尋刪除/改期的目標，回傳 {mutation index: find_events 的結果或例外}"""
+        specs = {}
+        for i, (skill, args) in enumerate(mutations):
+            spec = _lookup_spec(skill, args)
+            if spec:
+                specs[i] = spec
+
+        found = await asyncio.gather(
+            *(self.service.find_events(time_min, keyword) for time_min, keyword in specs.values()),
+            return_exceptions=True,
+        )
+        return dict(zip(specs, found))
+
+    async def reschedule_event(
+        self,
+        old_time_min: str,
+        new_start_time: str,
+        new_end_time: str,
+        old_keyword: str = "",
+        new_title: str = None,
+        claimed_ids: set | None = None,
+    ):
+        """
+        [Skill] 改期 (Reschedule)：找到舊行程一次 -> events.patch，邏輯同 CalendarSkills.reschedule_event
+        claimed_ids: 同 delete_event_by_query
+        """
+        logger.info(
+            "🔄 Skill: Reschedule | Old: %s | New: %s", old_time_min, new_start_time
+        )
+
+        query_result = await self.service.find_events(old_time_min, old_keyword)
+        if not query_result["success"]:
+            return {"success": False, "message": "搜尋行程失敗，無法改期"}
+
+        target_event = _first_unclaimed(query_result["events"], claimed_ids or ())
+        if target_event and claimed_ids is not None:
+            claimed_ids.add(target_event["id"])
+        if not target_event:
+            if not new_title:
+                return {"success": False, "message": "找不到符合條件的行程可以改期"}
+            create_result = await self.create_event(
+                title=new_title, start_time=new_start_time, end_time=new_end_time
+            )
+            return {**create_result, "mode": "created"}
+
+        patch_result = await self.service.patch_event(
+            target_event["id"],
+            _reschedule_patch(new_start_time, new_end_time, new_title),
+        )
+        return {**patch_result, "mode": "patched", "original_event": target_event}
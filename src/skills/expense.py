@@ -21,6 +21,7 @@ class ExpenseSkills:
             "https://www.googleapis.com/auth/drive",
         ]
         self.creds = None
+        self._client = None
 
         # 定義可能的金鑰路徑
         possible_paths = [
@@ -60,9 +61,19 @@ class ExpenseSkills:
             )
 
     def _get_client(self):
+        """取得 gspread client (重複使用同一個，保留底層 HTTP session 的 keep-alive 連線)"""
         if not self.creds:
             return None
-        return gspread.authorize(self.creds)
+        if self._client is None:
+            self._client = gspread.authorize(self.creds)
+        return self._client
+
+    def warmup(self):
+        """[Warm-up] 建立 Sheets 連線並開啟試算表 (同步，請在 thread 中呼叫)"""
+        client = self._get_client()
+        if not client:
+            raise RuntimeError("Google Sheets Auth Failed")
+        client.open_by_key(self.spreadsheet_id)
 
     def _get_worksheet(self, sheet_name):
         """內部 helper：取得指定名稱的 Worksheet"""
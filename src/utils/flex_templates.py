@@ -25,11 +25,53 @@ def _format_time(iso_str):
     return date_key, display_date, display_time
 
 
+_RRULE_FREQ_LABELS = {"DAILY": "天", "WEEKLY": "週", "MONTHLY": "個月"}
+_RRULE_DAY_LABELS = {
+    "MO": "一", "TU": "二", "WE": "三", "TH": "四", "FR": "五", "SA": "六", "SU": "日",
+}
+
+
+def describe_rrule(rrule):
+    """
+    將 RRULE 轉成人看得懂的中文描述。
+    例：RRULE:FREQ=WEEKLY;BYDAY=WE;COUNT=52 -> 每週三，共 52 次
+    """
+    fields = dict(
+        part.split("=", 1)
+        for part in rrule.replace("RRULE:", "").split(";")
+        if "=" in part
+    )
+    unit = _RRULE_FREQ_LABELS.get(fields.get("FREQ"), "")
+    interval = int(fields.get("INTERVAL", "1") or 1)
+    text = f"每 {interval} {unit}" if interval > 1 else f"每{unit}"
+
+    if fields.get("BYDAY"):
+        days = "、".join(
+            _RRULE_DAY_LABELS.get(d[-2:], d) for d in fields["BYDAY"].split(",")
+        )
+        # 每週三 / 每 2 週 (週三) / 每月 (週一)
+        if unit == "週" and interval == 1:
+            text += days
+        else:
+            text += f" (週{days})"
+
+    if fields.get("COUNT"):
+        text += f"，共 {fields['COUNT']} 次"
+    elif fields.get("UNTIL"):
+        until = fields["UNTIL"]
+        text += f"，至 {until[:4]}/{until[4:6]}/{until[6:8]}"
+    return text
+
+
 def generate_create_success_flex(event_data):
-    """建立成功卡片"""
+    """
+    建立成功卡片
+    - event_data["headline"]: 自訂卡片標題 (例如改期時的「✅ 行程已改期」)
+    - event_data["recurrence"]: 週期行程的 RRULE，會額外顯示週期資訊
+    """
     _, display_date, display_time = _format_time(event_data["startTime"])
 
-    return {
+    bubble = {
         "type": "bubble",
         "size": "mega",
         "body": {
@@ -38,7 +80,7 @@ def generate_create_success_flex(event_data):
             "contents": [
                 {
                     "type": "text",
-                    "text": "✅ 行程已建立",
+                    "text": event_data.get("headline") or "✅ 行程已建立",
                     "weight": "bold",
                     "color": "#1DB446",
                     "size": "sm",
@@ -78,9 +120,28 @@ def generate_create_success_flex(event_data):
         },
     }
 
+    recurrence = event_data.get("recurrence")
+    if recurrence:
+        rrule = recurrence[0] if isinstance(recurrence, list) else recurrence
+        contents = bubble["body"]["contents"]
+        if not event_data.get("headline"):
+            contents[0]["text"] = "✅ 週期行程已建立"
+        contents.append(
+            {
+                "type": "text",
+                "text": f"🔁 {describe_rrule(rrule)}",
+                "size": "sm",
+                "color": "#2B3467",
+                "margin": "md",
+                "wrap": True,
+            }
+        )
+
+    return bubble
 
-def generate_overview_flex(events):
-    """查詢結果 (Timeline 風格)"""
+
+def generate_overview_flex(events, truncated=False):
+    """查詢結果 (Timeline 風格)；truncated 時在最後提示還有更多行程沒有列出"""
     if not events:
         return {
             "type": "bubble",
@@ -194,6 +255,18 @@ def generate_overview_flex(events):
                 }
             )
 
+    if truncated:
+        body_contents.append(
+            {
+                "type": "text",
+                "text": f"⋯ 只顯示前 {len(events)} 筆，還有更多行程，請縮小查詢範圍",
+                "size": "xs",
+                "color": "#888888",
+                "margin": "xl",
+                "wrap": True,
+            }
+        )
+
     # 3. Final Bubble
     date_range = f"{grouped_events[sorted_keys[0]]['label']} - {grouped_events[sorted_keys[-1]]['label']}"
 
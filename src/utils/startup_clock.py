@@ -0,0 +1,4 @@
+import time
+
+# ⏱️ 冷啟動量測起點：main.py 第一個 import 本模組，載入當下的時間就是起點
+STARTUP_T0 = time.perf_counter()
@@ -0,0 +1,102 @@
+import time
+import asyncio
+import logging
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+
+class TaskGraph:
+    """
+    單則訊息處理流程的相依圖 (DAG)。
+    每個節點是一個 async 函式，參數依序為相依節點的結果。
+    節點在第一次 start / get 時才建立 task (相依節點一併啟動)，所以可以提早 start (speculative)，
+    也可以 cancel 後來發現用不到的分支。相依節點只能是已經加入的節點，因此不會有循環。
+    只在單一 event loop 中使用，不需要上鎖。
+    """
+
+    def __init__(self):
+        self._nodes: dict[str, tuple] = {}  # name -> (fn, deps, detached)
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._cancelled: set[str] = set()  # cancel 時還沒啟動的節點，之後 start 也不會執行
+        self.timings: dict[str, float] = {}  # name -> 執行耗時 (ms，含等待相依節點)
+
+    def add(self, name: str, fn, deps: tuple[str, ...] = (), detached: bool = False):
+        """
+        Args:
+            fn: async callable，參數為 deps 的結果
+            deps: 相依節點名稱
+            detached: 在空的 contextvars.Context 中執行 (不受本次 Request 的時間預算限制)，
+                      給回覆之後才跑完的背景工作使用；cancel_pending 不會取消它與它的相依節點
+        """
+        if name in self._nodes:
+            raise ValueError(f"Duplicate task graph node: {name}")
+        unknown = [dep for dep in deps if dep not in self._nodes]
+        if unknown:
+            raise ValueError(f"Unknown dependencies for {name}: {unknown}")
+        self._nodes[name] = (fn, tuple(deps), detached)
+
+    def start(self, name: str) -> asyncio.Task:
+        """啟動節點 (已啟動則回傳同一個 task)；已被 cancel 的節點回傳已取消的 task，不會執行"""
+        task = self._tasks.get(name)
+        if task is None:
+            fn, deps, detached = self._nodes[name]
+            cancelled = name in self._cancelled
+            # 被 cancel 的節點也不啟動它的相依節點
+            dep_tasks = [] if cancelled else [self.start(dep) for dep in deps]
+            task = asyncio.create_task(
+                self._run(name, fn, dep_tasks),
+                name=f"task_graph:{name}",
+                context=contextvars.Context() if detached else None,
+            )
+            if cancelled:
+                # 在第一次執行前取消：fn 完全不會被呼叫
+                task.cancel()
+            task.add_done_callback(self._on_done)
+            self._tasks[name] = task
+        return task
+
+    async def get(self, name: str):
+        """
+        等待節點結果。以 shield 等待：呼叫端被取消時不會連帶取消共用的節點。
+        """
+        return await asyncio.shield(self.start(name))
+
+    def started(self, name: str) -> bool:
+        return name in self._tasks
+
+    def cancel(self, *names: str):
+        """取消尚未完成的節點；還沒啟動的節點之後 start / get 也不會執行 (get 會拋出 CancelledError)"""
+        for name in names:
+            task = self._tasks.get(name)
+            if task is None:
+                self._cancelled.add(name)
+            elif not task.done():
+                logger.debug("✂️ Cancelling task graph node: %s", name)
+                task.cancel()
+
+    def cancel_pending(self):
+        """取消所有還在執行的節點，detached 節點及其相依節點除外"""
+        keep = set()
+        stack = [name for name in self._tasks if self._nodes[name][2]]
+        while stack:
+            name = stack.pop()
+            if name not in keep:
+                keep.add(name)
+                stack.extend(self._nodes[name][1])
+        self.cancel(*(name for name in self._tasks if name not in keep))
+
+    async def _run(self, name: str, fn, dep_tasks: list[asyncio.Task]):
+        t0 = time.perf_counter()
+        try:
+            # shield：這個節點被取消時不會連帶取消其他節點也在用的相依節點
+            args = [await asyncio.shield(task) for task in dep_tasks]
+            return await fn(*args)
+        finally:
+            self.timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+    @staticmethod
+    def _on_done(task: asyncio.Task):
+        # 取出例外，避免沒人等待的 speculative 節點出現 "exception was never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("Task graph node %s failed: %s", task.get_name(), task.exception())